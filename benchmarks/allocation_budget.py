@@ -0,0 +1,118 @@
+"""Allocation budget check for steady-state play
+
+Plays a headless game (GameState, Graphics with the dummy video driver, KeyboardState) with the paddle following
+the ball. After a warm-up, it measures what each stage of every frame allocates with the AllocationProfiler,
+and fails if any frame allocates more than the budget (Constants.play_frame_allocation_budget by default).
+
+Run from the repository root:
+    python benchmarks/allocation_budget.py
+"""
+
+import argparse
+import os
+import random
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from allocation import AllocationProfiler, StageAllocations
+from common import Constants, GameFsmState
+from game_state import GameState
+from graphics import Graphics
+from inputs import KeyboardState
+
+FRAME_TIME = 1000 / 60
+
+
+def play_keys(game: GameState) -> set[int]:
+    """Keys that keep the game going: launch the ball, then follow it with the paddle"""
+    if game.game_fsm_state == GameFsmState.PRE_PLAY:
+        return {pygame.K_l}
+    core_game_state = game.core_game_state
+    if core_game_state == None or core_game_state.ball == None:
+        return set()
+    paddle_middle = core_game_state.paddle.x + core_game_state.paddle.width / 2
+    return {pygame.K_a} if core_game_state.ball.x < paddle_middle else {pygame.K_d}
+
+
+def measure(warmup: int, frames: int) -> list[dict[str, StageAllocations]]:
+    """Plays warmup frames, then returns the allocations of each stage of the next frames of play"""
+    random.seed(0)
+    pygame.init()
+    game = GameState()
+    graphics = Graphics(game.settings.graphics_settings)
+    keyboard_state = KeyboardState()
+    keyboard_state.new_keys_pressed = {pygame.K_p}
+
+    profiler = AllocationProfiler()
+    results = []
+    for frame in range(warmup + frames):
+        if frame == warmup:
+            profiler.start()
+        keyboard_state.currently_pressed_keys = play_keys(game)
+
+        _, graphics_instructions = game.update(FRAME_TIME, keyboard_state)
+        if frame >= warmup:
+            profiler.checkpoint("update")
+        graphics.render(graphics_instructions)
+        if frame >= warmup:
+            profiler.checkpoint("render")
+        keyboard_state.handle_pygame_events()
+        if frame >= warmup:
+            profiler.checkpoint("events")
+
+            # Only frames of actual play count, not the frames spent waiting to relaunch the ball
+            frame_allocations = profiler.end_frame()
+            if game.game_fsm_state == GameFsmState.PLAY:
+                results.append(frame_allocations)
+
+    profiler.stop()
+    pygame.quit()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--warmup", type=int, default=120)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument(
+        "--budget",
+        type=int,
+        default=Constants.play_frame_allocation_budget,
+        help="the most a frame may allocate, in bytes",
+    )
+    args = parser.parse_args()
+
+    results = measure(args.warmup, args.frames)
+    stages = list(results[0].keys())
+    for stage in stages:
+        allocated = [frame[stage].allocated for frame in results]
+        collections = [
+            sum(frame[stage].collections[generation] for frame in results)
+            for generation in range(3)
+        ]
+        print(
+            "{:<8} allocated: mean {:>8.0f} B, max {:>8} B   collections {}".format(
+                stage, sum(allocated) / len(allocated), max(allocated), collections
+            )
+        )
+
+    # Peaks of different stages happen at different times, so their sum is an upper bound for the frame
+    totals = [sum(stage.allocated for stage in frame.values()) for frame in results]
+    over_budget = [total for total in totals if total > args.budget]
+    print(
+        "{} frames of play, worst frame {} B, budget {} B".format(
+            len(totals), max(totals), args.budget
+        )
+    )
+    if over_budget:
+        print("{} frame(s) went over the allocation budget".format(len(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Throughput benchmark for the training environment
+
+Steps a VectorEnvironment with random actions using 1, 2, 4, ... workers (up to the number of cores) and prints the
+environment steps per second of each, and how close each comes to scaling linearly from one worker.
+
+Run from the repository root:
+    python benchmarks/env_throughput.py --envs 16 --steps 500
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from environment import VectorEnvironment
+
+
+def throughput(num_envs: int, num_workers: int, steps: int) -> float:
+    """Returns environment steps per second of a VectorEnvironment with the given number of workers"""
+    rng = random.Random(0)
+    with VectorEnvironment(num_envs, num_workers) as vector_environment:
+        vector_environment.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(steps):
+            vector_environment.step(
+                [rng.randrange(vector_environment.num_actions) for _ in range(num_envs)]
+            )
+        return num_envs * steps / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--envs", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= min(args.max_workers, args.envs):
+        worker_counts.append(worker_counts[-1] * 2)
+
+    single = None
+    print("{:>8} {:>14} {:>12}".format("workers", "steps/s", "efficiency"))
+    for num_workers in worker_counts:
+        steps_per_second = throughput(args.envs, num_workers, args.steps)
+        single = single or steps_per_second
+        print(
+            "{:>8} {:>14.0f} {:>11.0%}".format(
+                num_workers, steps_per_second, steps_per_second / (single * num_workers)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Frame time of huge boards drawn through a camera, as the board grows
+
+Builds boards of growing size (LevelData.uniform) and gives their blocks to Graphics as a scene, like a game does,
+then times rendering through a Camera that pans across the board while blocks break in view. The zoom grows with the
+board so that blocks are the same size on screen, the view stays within the blocks and the camera moves the same
+number of pixels each frame, so the only thing that changes from board to board is how many blocks there are out of
+view. The blocks are frozen out of the garbage collector's reach once they are built, like a game does after loading
+a level. Reports, per board:
+    tiled       the render time with block tiles, which should be about the same for every board
+    tiles       the tiles blitted per frame
+    direct      the render time drawing every block, without a camera, for comparison
+
+Then it plays the game's own huge board (H in the menu) with the autopilot, timing whole frames like main.py runs
+them: GameState.update, Graphics.render and the invariants at the default level. Enough frames are played for
+every expensive invariant to take its turn several times. Boards in the sweep all fill the same game area, so their
+cells get smaller as they grow and the ball overlaps more blocks at once, which is why play is only timed on the
+game's board.
+
+Fails if the average tiled render of the largest board is more than --tolerance times that of the smallest, or if a
+frame of play takes longer than --frame-budget milliseconds.
+
+Run from the repository root:
+    python benchmarks/huge_board.py
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from allocation import freeze_long_lived_objects
+from common import (
+    BALL_SCENE_ID,
+    PADDLE_SCENE_ID,
+    Ball,
+    Constants,
+    GameFsmState,
+    Paddle,
+    SceneChanges,
+)
+from game_state import GameState
+from graphics import Camera, Graphics, GraphicsInstructions
+from inputs import KeyboardState
+from invariants import InvariantChecker
+from level import CellType, LevelData
+
+# Boards are zoomed in by how many times more columns they have than this, so blocks are 32 by 16 pixels at 800x600
+BASE_COLUMNS = 25
+# The blocks fill the top third of the game area. Boards are zoomed in enough for the view to fit in it
+BLOCKS_HEIGHT = Constants.game_height / 3
+
+FRAME_TIME = 1000 / 60
+
+
+def build_scene(num_cols: int, num_rows: int) -> dict:
+    """The scene of a board, with a paddle and a ball, by scene id like CoreGameState.scene_changes gives it"""
+    random.seed(0)
+    level = LevelData.uniform(num_cols, num_rows, cell_type=CellType.NORMAL)
+    scene = {
+        PADDLE_SCENE_ID: Paddle(
+            Constants.game_width / 2 - 50, 0.9 * Constants.game_height, 100, 10, 0, 3
+        ),
+    }
+    scene.update((block.block_id, block) for block in level.blocks())
+    freeze_long_lived_objects()
+    return scene
+
+
+def camera_path(
+    frame: int, pan: float, scaling: float, zoom: float
+) -> tuple[float, float]:
+    """Where the camera looks on a frame: back and forth across the blocks, pan pixels a frame"""
+    speed = pan / scaling
+    span = 2 * Constants.game_width
+    x = (frame * speed) % span
+    x = x if x < Constants.game_width else span - x
+    # Up and down as far as the view stays within the blocks
+    reach = (BLOCKS_HEIGHT - Constants.game_height / zoom) / 2
+    y = BLOCKS_HEIGHT / 2 + reach * math.sin(frame * speed / reach)
+    return x, y
+
+
+def time_tiled(
+    graphics: Graphics, num_cols: int, num_rows: int, args
+) -> dict[str, float]:
+    """Renders a board through a panning camera, breaking blocks in view, and returns the times after warming up"""
+    scene = build_scene(num_cols, num_rows)
+    zoom = num_cols / BASE_COLUMNS
+    col_width, row_height = LevelData.uniform(num_cols, num_rows).cell_size()
+    rng = random.Random(0)
+
+    render_times = []
+    tiles = []
+    changed = dict(scene)
+    reset = True
+    for frame in range(args.warmup + args.frames):
+        x, y = camera_path(frame, args.pan, graphics.scaling * zoom, zoom)
+        ball = Ball(x, y, 0, 0, Constants.ball_radius)
+        changed[BALL_SCENE_ID] = ball
+
+        # Break blocks around the middle of the view, like the ball would
+        destroyed = []
+        for _ in range(args.breaks):
+            block_id = (
+                int(x / col_width) + rng.randint(-10, 10),
+                int(y / row_height) + rng.randint(-10, 10),
+            )
+            if scene.pop(block_id, None) != None:
+                destroyed.append(block_id)
+
+        instructions = GraphicsInstructions(
+            [],
+            [],
+            scene_changes=SceneChanges(reset, changed, destroyed),
+            camera=Camera.following(x, y, zoom),
+        )
+        start = time.perf_counter()
+        graphics.render(instructions)
+        elapsed = 1000 * (time.perf_counter() - start)
+        if frame >= args.warmup:
+            render_times.append(elapsed)
+            tiles.append(graphics.tiles_drawn())
+        changed = {}
+        reset = False
+
+    return {
+        "tiled": statistics.fmean(render_times),
+        "worst": max(render_times),
+        "tiles": statistics.fmean(tiles),
+    }
+
+
+def time_direct(graphics: Graphics, num_cols: int, num_rows: int, frames: int) -> float:
+    """Renders a whole board without a camera, drawing every block, and returns the average time"""
+    scene = build_scene(num_cols, num_rows)
+    graphics.render(
+        GraphicsInstructions([], [], scene_changes=SceneChanges(True, scene, []))
+    )
+    render_times = []
+    for _ in range(frames):
+        instructions = GraphicsInstructions(
+            [], [], scene_changes=SceneChanges(False, {}, [])
+        )
+        start = time.perf_counter()
+        graphics.render(instructions)
+        render_times.append(1000 * (time.perf_counter() - start))
+    return statistics.fmean(render_times)
+
+
+def time_play(graphics: Graphics, args) -> dict[str, float]:
+    """Plays the huge board of the game with the autopilot, like main.py runs frames, and returns the times after
+    warming up
+    """
+    random.seed(0)
+    game = GameState()
+    keyboard_state = KeyboardState()
+    keyboard_state.new_keys_pressed = {pygame.K_h}
+    # The first frame of the game hands Graphics the whole scene
+    graphics.render(game.update(FRAME_TIME, keyboard_state)[1])
+    invariant_checker = InvariantChecker(Constants.default_invariant_level)
+
+    times = {"frame": [], "update": [], "render": [], "invariants": []}
+    for frame in range(args.warmup + args.play_frames):
+        # Holding L launches the ball whenever a life is lost, and the lives are topped up so the game never ends
+        keyboard_state.currently_pressed_keys = {pygame.K_l}
+        keyboard_state.new_keys_pressed = set()
+        if game.game_fsm_state == GameFsmState.PLAY and game.autopilot == None:
+            keyboard_state.new_keys_pressed = {pygame.K_o}
+        game.core_game_state.lives = Constants.initial_lives
+        game.core_game_state.paddle.lives = Constants.initial_lives
+
+        start = time.perf_counter()
+        _, instructions = game.update(FRAME_TIME, keyboard_state)
+        updated = time.perf_counter()
+        graphics.render(instructions)
+        rendered = time.perf_counter()
+        invariant_checker.check(game, graphics)
+        checked = time.perf_counter()
+        if frame >= args.warmup:
+            times["frame"].append(1000 * (checked - start))
+            times["update"].append(1000 * (updated - start))
+            times["render"].append(1000 * (rendered - updated))
+            times["invariants"].append(1000 * (checked - rendered))
+
+    result = {
+        stage: statistics.fmean(stage_times) for stage, stage_times in times.items()
+    }
+    result["worst frame"] = max(times["frame"])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--boards",
+        default="100x50,200x100,400x200,800x400",
+        help="comma separated board sizes, in columns x rows",
+    )
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=30)
+    parser.add_argument("--direct-frames", type=int, default=5)
+    parser.add_argument(
+        "--pan", type=float, default=8, help="pixels the camera moves a frame"
+    )
+    parser.add_argument(
+        "--breaks", type=int, default=2, help="blocks broken in view a frame"
+    )
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--play-frames", type=int, default=600)
+    parser.add_argument(
+        "--frame-budget",
+        type=float,
+        default=FRAME_TIME,
+        help="milliseconds a whole frame of play may take",
+    )
+    args = parser.parse_args()
+
+    pygame.display.init()
+    # The screens of a game have text on them
+    pygame.font.init()
+    graphics = Graphics(Constants.default_settings.graphics_settings)
+
+    print(
+        "{:>9} {:>8} {:>6} {:>10} {:>10} {:>7} {:>11}".format(
+            "board", "blocks", "zoom", "tiled ms", "worst ms", "tiles", "direct ms"
+        )
+    )
+    averages = []
+    for board in args.boards.split(","):
+        num_cols, num_rows = (int(size) for size in board.split("x"))
+        result = time_tiled(graphics, num_cols, num_rows, args)
+        direct = time_direct(graphics, num_cols, num_rows, args.direct_frames)
+        averages.append(result["tiled"])
+        print(
+            "{:>9} {:>8} {:>5g}x {:>10.2f} {:>10.2f} {:>7.1f} {:>11.2f}".format(
+                board,
+                num_cols * num_rows,
+                num_cols / BASE_COLUMNS,
+                result["tiled"],
+                result["worst"],
+                result["tiles"],
+                direct,
+            )
+        )
+
+    growth = averages[-1] / averages[0]
+    print("tiled render of the largest board is {:.2f}x the smallest".format(growth))
+
+    play = time_play(graphics, args)
+    print(
+        "frames of play on the {}x{} board: {:.2f} ms on average (update {:.2f}, render {:.2f}, invariants {:.2f}), "
+        "worst {:.2f} ms".format(
+            Constants.huge_board_cols,
+            Constants.huge_board_rows,
+            play["frame"],
+            play["update"],
+            play["render"],
+            play["invariants"],
+            play["worst frame"],
+        )
+    )
+
+    if growth > args.tolerance:
+        sys.exit("Tiled render time grows with the board")
+    if play["worst frame"] > args.frame_budget:
+        sys.exit("A frame of play took longer than the budget")
+
+
+if __name__ == "__main__":
+    main()
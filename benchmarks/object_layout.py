@@ -0,0 +1,111 @@
+"""Microbenchmark for the memory and attribute access cost of game objects
+
+Compares the slotted game objects in common against equivalent plain dataclasses (with a __dict__ per instance,
+and an RGB tuple for the block color), which is how they used to be defined. Reports:
+    memory          bytes per instance, measured with tracemalloc over many instances
+    access          time to read the fields the collision loops read, across a board of blocks
+
+Run from the repository root:
+    python benchmarks/object_layout.py
+"""
+
+import argparse
+from dataclasses import field, fields, make_dataclass
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from common import Ball, Block, BlockType, Colors, Paddle, Powerup, PowerupType
+
+
+def unslotted(cls: type) -> type:
+    """A plain dataclass with the same fields as a slotted one"""
+    return make_dataclass(
+        "Plain" + cls.__name__,
+        [(item.name, item.type, field(default=item.default)) for item in fields(cls)],
+    )
+
+
+def make_block(cls: type, index: int, packed_color: bool):
+    color = Colors.generate_random_block_color()
+    return cls(
+        float(index % 100),
+        float(index // 100),
+        76.0,
+        26.0,
+        (index % 100, index // 100),
+        BlockType.NORMAL,
+        1,
+        0,
+        color if packed_color else Colors.unpack(color),
+    )
+
+
+def memory_per_instance(make, count: int) -> float:
+    """Average bytes allocated per instance, over count instances"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [make(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # The list holding them is not part of the instances
+    return (after - before - sys.getsizeof(instances)) / len(instances)
+
+
+def read_fields(blocks: list) -> float:
+    """Reads the fields of every block like CoreGameState's collision checks do"""
+    total = 0
+    for block in blocks:
+        total += block.x + block.y + block.width + block.height + block.health
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    constructors = {
+        "Paddle": lambda cls, index: cls(index, 550, 100, 10, 0, 3),
+        "Ball": lambda cls, index: cls(index, 300, 0.1, -0.8, 5),
+        "Powerup": lambda cls, index: cls(PowerupType.LIFE, index, 100, 10),
+        "Block": lambda cls, index: make_block(cls, index, cls == Block),
+    }
+    print(
+        "{:<10} {:>14} {:>14} {:>8}".format(
+            "object", "plain bytes", "slotted bytes", "saved"
+        )
+    )
+    for cls in [Paddle, Ball, Powerup, Block]:
+        make = constructors[cls.__name__]
+        plain_cls = unslotted(cls)
+        plain = memory_per_instance(lambda index: make(plain_cls, index), args.count)
+        slotted = memory_per_instance(lambda index: make(cls, index), args.count)
+        print(
+            "{:<10} {:>14.0f} {:>14.0f} {:>7.0f}%".format(
+                cls.__name__, plain, slotted, 100 * (1 - slotted / plain)
+            )
+        )
+
+    plain_cls = unslotted(Block)
+    plain_blocks = [make_block(plain_cls, index, False) for index in range(args.count)]
+    slotted_blocks = [make_block(Block, index, True) for index in range(args.count)]
+    times = {}
+    for name, blocks in [("plain", plain_blocks), ("slotted", slotted_blocks)]:
+        times[name] = min(
+            timeit.repeat(lambda: read_fields(blocks), number=1, repeat=args.repeat)
+        ) / len(blocks)
+        print(
+            "{:<10} reading block fields {:.1f} ns per block".format(
+                name, 1e9 * times[name]
+            )
+        )
+    print("access speedup {:.2f}x".format(times["plain"] / times["slotted"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Frame cost of the particle system with many live particles
+
+Keeps the ParticleSystem topped up to a target number of live particles with block-break sized bursts, and times
+what Graphics does with it every frame: update (move, age and compact) and draw (lock the screen's pixels and
+write the particles in). Runs with the dummy video driver at the given resolution, and fails if the average frame
+goes over the 60 fps frame time.
+
+Run from the repository root:
+    python benchmarks/particles.py
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from common import Colors, Constants
+from particles import ParticleSystem, PARTICLES_AVAILABLE
+
+FRAME_TIME = 1000 / 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--particles", type=int, default=Constants.particle_capacity)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    args = parser.parse_args()
+
+    if not PARTICLES_AVAILABLE:
+        sys.exit("Particles need NumPy, which is not installed")
+
+    pygame.display.init()
+    screen = pygame.display.set_mode((args.width, args.height))
+    scaling = min(
+        args.width / Constants.game_width, args.height / Constants.game_height
+    )
+    bounds = (0, 0, args.width, args.height)
+    particles = ParticleSystem(args.particles, seed=0)
+    random.seed(0)
+
+    update_times = []
+    draw_times = []
+    live = []
+    for frame in range(args.frames):
+        # Top up with bursts, like a board where blocks keep breaking
+        while particles.count + Constants.particles_per_block <= args.particles:
+            particles.emit(
+                random.uniform(0, Constants.game_width),
+                random.uniform(0, Constants.game_height / 2),
+                Constants.particles_per_block,
+                Colors.unpack(Colors.generate_random_block_color()),
+            )
+        live.append(particles.count)
+
+        start = time.perf_counter()
+        particles.update(FRAME_TIME)
+        middle = time.perf_counter()
+        screen.fill(Colors.black)
+        pixels = pygame.surfarray.pixels3d(screen)
+        particles.draw(pixels, scaling, (0, 0), bounds)
+        del pixels
+        end = time.perf_counter()
+        update_times.append(1000 * (middle - start))
+        draw_times.append(1000 * (end - middle))
+
+    frame_times = [update + draw for update, draw in zip(update_times, draw_times)]
+    print("live particles    {:.0f} average".format(statistics.fmean(live)))
+    for name, times in [
+        ("update", update_times),
+        ("draw", draw_times),
+        ("frame", frame_times),
+    ]:
+        print(
+            "{:<17} {:.2f} ms average, {:.2f} ms worst".format(
+                name, statistics.fmean(times), max(times)
+            )
+        )
+    average = statistics.fmean(frame_times)
+    print(
+        "{:.0f}% of the {:.1f} ms frame time".format(
+            100 * average / FRAME_TIME, FRAME_TIME
+        )
+    )
+    if average > FRAME_TIME:
+        sys.exit("Over the frame time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Replay-driven performance regression harness
+
+Replays every input trace in benchmarks/traces headlessly through GameState (see src/replay.py), timing
+GameState.update for every frame, and summarizes the frame times of each trace per FSM state.
+
+Run from the repository root:
+    python benchmarks/replay_benchmark.py run                 writes benchmarks/replay_results.json
+    python benchmarks/replay_benchmark.py compare             compares them against the committed replay_baseline.json
+    python benchmarks/replay_benchmark.py run --output benchmarks/replay_baseline.json        updates the baseline
+
+Traces of real sessions are recorded by playing with BREAKOUT_RECORD=<path> set. The scripted player below can also
+record traces, for situations that are hard to reach by hand:
+    python benchmarks/replay_benchmark.py record-bot benchmarks/traces/endless.trace --frames 7200 --endless
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from common import GameFsmState
+from game_state import GameState
+from inputs import KeyboardState
+from replay import InputTrace, replay
+from run import summarize, compare
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+TRACES_DIR = os.path.join(BENCHMARK_DIR, "traces")
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, "replay_results.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "replay_baseline.json")
+
+
+def time_trace(trace: InputTrace) -> dict:
+    """Replays a trace, returning a summary of GameState.update frame times for each FSM state"""
+    times = {}
+
+    def on_frame(game: GameState, fsm_state: GameFsmState, update_time: float):
+        times.setdefault(fsm_state.value, []).append(update_time)
+
+    replay(trace, on_frame)
+    return {state: summarize(state_times) for state, state_times in times.items()}
+
+
+def record_bot(frames: int, endless: bool, seed: int) -> InputTrace:
+    """Records a trace of a scripted player, who follows the ball imperfectly and pauses now and then"""
+    trace = InputTrace(seed)
+    random.seed(seed)
+    player = random.Random(seed + 1)
+    game = GameState()
+    keyboard_state = KeyboardState()
+    previous_keys = set()
+    pause_until = None
+
+    for frame in range(frames):
+        keys = set()
+        fsm_state = game.game_fsm_state
+        if fsm_state == GameFsmState.MENU:
+            keys = {pygame.K_e if endless else pygame.K_p}
+        elif fsm_state == GameFsmState.PRE_PLAY:
+            keys = {pygame.K_l}
+        elif fsm_state in [GameFsmState.GAME_OVER, GameFsmState.GAME_WIN]:
+            keys = {pygame.K_r}
+        elif fsm_state == GameFsmState.PAUSE:
+            if frame >= pause_until:
+                keys = {pygame.K_p}
+        elif fsm_state == GameFsmState.PLAY:
+            if player.random() < 0.002:
+                keys = {pygame.K_p}
+                pause_until = frame + 60
+            elif game.core_game_state.ball != None:
+                ball = game.core_game_state.ball
+                paddle = game.core_game_state.paddle
+                target = ball.x + player.uniform(-30, 30)
+                if target < paddle.x + paddle.width * 0.3:
+                    keys = {pygame.K_a}
+                elif target > paddle.x + paddle.width * 0.7:
+                    keys = {pygame.K_d}
+
+        # Turn the keys held this frame into what KeyboardState would report
+        keyboard_state.new_keys_pressed = keys - previous_keys
+        keyboard_state.currently_pressed_keys = keys & previous_keys
+        previous_keys = keys
+
+        delta_t = 16 + player.choice([0, 0, 0, 1, 1, 2])
+        trace.record(delta_t, keyboard_state)
+        game.update(delta_t, keyboard_state)
+
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="replay every trace")
+    run_parser.add_argument("--output", default=RESULTS_PATH)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare results against the baseline"
+    )
+    compare_parser.add_argument("--results", default=RESULTS_PATH)
+    compare_parser.add_argument("--baseline", default=BASELINE_PATH)
+    compare_parser.add_argument("--threshold", type=float, default=0.2)
+
+    bot_parser = subparsers.add_parser(
+        "record-bot", help="record a trace of a scripted player"
+    )
+    bot_parser.add_argument("output")
+    bot_parser.add_argument("--frames", type=int, default=3600)
+    bot_parser.add_argument("--endless", action="store_true")
+    bot_parser.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = {}
+        for path in sorted(glob.glob(os.path.join(TRACES_DIR, "*.trace"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            for state, summary in time_trace(InputTrace.load(path)).items():
+                results["{}/{}".format(name, state)] = summary
+                print(name, state, summary)
+        with open(args.output, "w") as file:
+            json.dump({"results": results}, file, indent=4)
+
+    elif args.command == "compare":
+        with open(args.results) as file:
+            results = json.load(file)["results"]
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("{} replay(s) regressed".format(len(regressions)))
+            sys.exit(1)
+
+    elif args.command == "record-bot":
+        trace = record_bot(args.frames, args.endless, args.seed)
+        trace.save(args.output)
+        print("{} frames, {} bytes".format(len(trace.frames), len(trace.to_bytes())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Benchmark suite for the game
+
+Measures, headlessly:
+    core update     CoreGameState.update per frame, across board sizes and numbers of physics substeps
+    rewind record   CoreGameState.update per frame with rewind recording on, across board sizes
+    render          Graphics.render of a game frame, at each resolution in SettingsState.possible_resolutions
+    game state      GameState.update per frame, in each GameFsmState
+
+Run from the repository root:
+    python benchmarks/run.py run                    writes benchmarks/results.json
+    python benchmarks/run.py compare                compares results.json against the committed baseline.json
+    python benchmarks/run.py run --output benchmarks/baseline.json      updates the baseline
+
+Baselines are only meaningful on the machine they were recorded on, so regenerate baseline.json before
+comparing on a new machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from common import Constants, GameFsmState, GraphicsSettings
+from core_game_state import CoreGameState
+from game_state import GameState
+from graphics import Graphics, GraphicsInstructions
+from inputs import KeyboardState
+from level import LevelData
+from screen_content import screen_content
+from settings import SettingsState
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_PATH = os.path.join(BENCHMARK_DIR, "results.json")
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+FRAME_TIME = 1000 / 60
+
+# (columns, rows) of uniform levels, from the size of the default level to 10,000 blocks
+BOARD_SIZES = [(9, 5), (25, 20), (50, 40), (100, 100)]
+SUBSTEP_COUNTS = [25, 50, 100]
+
+
+def summarize(times: list[float]) -> dict:
+    """Summarizes a list of frame times in seconds"""
+    times = sorted(times)
+    return {
+        "median_ms": 1000 * statistics.median(times),
+        "p95_ms": 1000 * times[int(0.95 * (len(times) - 1))],
+        # Rare slow frames, like rewind keyframes, don't show in the median or p95
+        "max_ms": 1000 * times[-1],
+        "frames": len(times),
+    }
+
+
+def launch(core_game_state: CoreGameState):
+    """Starts a new ball if the last one fell, so the benchmark keeps playing"""
+    if core_game_state.start_new_life() or core_game_state.ball == None:
+        core_game_state.lives = Constants.initial_lives
+        core_game_state.make_new_ball()
+    if core_game_state.ball.y_vel == 0:
+        core_game_state.ball.y_vel = Constants.init_y_vel_ball
+
+
+def bench_core_update(
+    num_cols: int,
+    num_rows: int,
+    substeps: int,
+    frames: int,
+    record_rewind: bool = False,
+) -> dict:
+    """Times CoreGameState.update on a uniform board with the given number of substeps per frame
+
+    Rewind recording is off unless asked for, so that its cost is measured on its own (see run_all)
+    """
+    random.seed(0)
+    original_repetitions = Constants.update_repetitions
+    Constants.update_repetitions = substeps
+    try:
+        core_game_state = CoreGameState(
+            LevelData.uniform(num_cols, num_rows), record_rewind=record_rewind
+        )
+        # Timings of blocks the ball can't hit (like blocks of negative height) would mean nothing
+        for block in core_game_state.blocks:
+            if block.width <= 0 or block.height <= 0:
+                raise ValueError(
+                    "Block {} of the {}x{} board has size {}x{}".format(
+                        block.block_id, num_cols, num_rows, block.width, block.height
+                    )
+                )
+        times = []
+        for frame in range(frames):
+            launch(core_game_state)
+            keys = {pygame.K_a} if (frame // 30) % 2 else {pygame.K_d}
+            start = time.perf_counter()
+            core_game_state.update(FRAME_TIME, keys, GameFsmState.PLAY)
+            times.append(time.perf_counter() - start)
+    finally:
+        Constants.update_repetitions = original_repetitions
+    return summarize(times)
+
+
+def bench_render(resolution: tuple[int, int], frames: int) -> dict:
+    """Times Graphics.render of a game in progress at the given resolution"""
+    random.seed(0)
+    graphics = Graphics(GraphicsSettings(*resolution))
+    core_game_state = CoreGameState()
+    core_game_state.update(FRAME_TIME, set(), GameFsmState.PRE_PLAY)
+    instructions = GraphicsInstructions(
+        core_game_state.objects(), screen_content(GameFsmState.PRE_PLAY)
+    )
+
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        graphics.render(instructions)
+        times.append(time.perf_counter() - start)
+    return summarize(times)
+
+
+def bench_game_state(fsm_state: GameFsmState, frames: int) -> dict:
+    """Times GameState.update while staying in the given state"""
+    random.seed(0)
+    game = GameState()
+    keyboard_state = KeyboardState()
+
+    def enter_state():
+        game.game_fsm_state = fsm_state
+        if fsm_state in [GameFsmState.PLAY, GameFsmState.PAUSE, GameFsmState.PRE_PLAY]:
+            if game.core_game_state == None:
+                game.core_game_state = CoreGameState()
+                # GameState reads the events of its game, like __initialize_game sets it up to
+                game.event_reader = game.core_game_state.events.reader()
+            launch(game.core_game_state)
+        elif fsm_state == GameFsmState.SETTINGS:
+            game.settings_state = SettingsState(game.settings)
+
+    game.core_game_state = None
+    enter_state()
+    times = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        game.update(FRAME_TIME, keyboard_state)
+        times.append(time.perf_counter() - start)
+        if game.game_fsm_state != fsm_state:
+            enter_state()
+    return summarize(times)
+
+
+def run_all(frames: int) -> dict:
+    """Runs every benchmark, returning results by benchmark name"""
+    results = {}
+    for num_cols, num_rows in BOARD_SIZES:
+        for substeps in SUBSTEP_COUNTS:
+            name = "core update/{} blocks/{} substeps".format(
+                num_cols * num_rows, substeps
+            )
+            results[name] = bench_core_update(num_cols, num_rows, substeps, frames)
+            print(name, results[name])
+
+    # Enough frames for several keyframes, which are the frames that cost the most to record
+    for num_cols, num_rows in BOARD_SIZES:
+        name = "rewind record/{} blocks".format(num_cols * num_rows)
+        results[name] = bench_core_update(
+            num_cols,
+            num_rows,
+            Constants.update_repetitions,
+            max(frames, 10 * Constants.rewind_keyframe_interval),
+            record_rewind=True,
+        )
+        print(name, results[name])
+
+    for resolution in SettingsState.possible_resolutions:
+        name = "render/{}x{}".format(*resolution)
+        results[name] = bench_render(resolution, frames)
+        print(name, results[name])
+
+    for fsm_state in GameFsmState:
+        if fsm_state == GameFsmState.QUIT:
+            continue
+        name = "game state/{}".format(fsm_state.value)
+        results[name] = bench_game_state(fsm_state, frames)
+        print(name, results[name])
+
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Returns the names of benchmarks whose median got slower than the baseline by more than threshold"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median_ms"] / max(baseline[name]["median_ms"], 1e-9)
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        print(
+            "{:<45} {:>10.3f} ms {:>10.3f} ms {:>7.2f}x {}".format(
+                name, baseline[name]["median_ms"], result["median_ms"], ratio, flag
+            )
+        )
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default=RESULTS_PATH)
+    run_parser.add_argument("--frames", type=int, default=300)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare results against the baseline"
+    )
+    compare_parser.add_argument("--results", default=RESULTS_PATH)
+    compare_parser.add_argument("--baseline", default=BASELINE_PATH)
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="flag benchmarks more than this fraction slower than the baseline",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        pygame.init()
+        results = run_all(args.frames)
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "machine": {
+                        "python": platform.python_version(),
+                        "pygame": pygame.version.ver,
+                        "platform": platform.platform(),
+                        "processor": platform.processor(),
+                    },
+                    "results": results,
+                },
+                file,
+                indent=4,
+            )
+        pygame.quit()
+
+    elif args.command == "compare":
+        with open(args.results) as file:
+            results = json.load(file)["results"]
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("{} benchmark(s) regressed".format(len(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
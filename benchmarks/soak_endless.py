@@ -0,0 +1,122 @@
+"""Soak benchmark for endless mode
+
+Plays a long headless endless game, with the paddle following the ball, and samples the number of blocks and
+falling powerups, the memory allocated by the game and the time taken by CoreGameState.update at regular intervals.
+Fails if any of them grows over the session, since endless mode should keep all of them flat.
+
+The paddle only chases the ball, so most powerups are missed. Raising --powerup-probability turns this into a
+stress test of powerups that fall off the screen:
+    python benchmarks/soak_endless.py --minutes 60
+    python benchmarks/soak_endless.py --minutes 30 --powerup-probability 1
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from common import Constants, GameFsmState
+from core_game_state import CoreGameState
+from events import EventType
+
+
+def follow_ball(core_game_state: CoreGameState) -> set[int]:
+    """Keys that move the paddle towards the ball"""
+    ball = core_game_state.ball
+    paddle_middle = core_game_state.paddle.x + core_game_state.paddle.width / 2
+    if ball == None or abs(ball.x - paddle_middle) < 10:
+        return set()
+    return {pygame.K_a} if ball.x < paddle_middle else {pygame.K_d}
+
+
+def soak(minutes: float, samples: int, frame_time: float = 1000 / 60) -> list[dict]:
+    """Plays an endless game for the given number of simulated minutes, returning evenly spaced samples"""
+    core_game_state = CoreGameState(endless_seed=1)
+    core_game_state.ball.y_vel = Constants.init_y_vel_ball
+    events = core_game_state.events.reader()
+    spawned = 0
+    total_frames = int(minutes * 60 * 1000 / frame_time)
+    frames_per_sample = max(1, total_frames // samples)
+
+    tracemalloc.start()
+    results = []
+    update_time = 0
+    powerups = 0
+    for frame in range(1, total_frames + 1):
+        # Lives are not the point of this benchmark, so the ball is relaunched forever
+        if core_game_state.start_new_life():
+            core_game_state.lives = Constants.initial_lives
+            core_game_state.make_new_ball()
+            core_game_state.ball.y_vel = Constants.init_y_vel_ball
+
+        keys = follow_ball(core_game_state)
+        start = time.perf_counter()
+        core_game_state.update(frame_time, keys, GameFsmState.PLAY)
+        update_time += time.perf_counter() - start
+        powerups += len(core_game_state.powerups)
+        for event in events.read():
+            if event.event_type == EventType.POWERUP_SPAWNED:
+                spawned += 1
+
+        if frame % frames_per_sample == 0:
+            results.append(
+                {
+                    "minute": frame * frame_time / 60000,
+                    "blocks": len(core_game_state.blocks),
+                    "powerups": powerups / frames_per_sample,
+                    "spawned": spawned,
+                    "rows generated": core_game_state.endless_field.next_row,
+                    "memory (KiB)": tracemalloc.get_traced_memory()[0] / 1024,
+                    "update (ms)": 1000 * update_time / frames_per_sample,
+                }
+            )
+            update_time = 0
+            powerups = 0
+
+    tracemalloc.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=10)
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument(
+        "--powerup-probability", type=float, default=Constants.powerup_probability
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.5,
+        help="fail if the second half of the session averages more than this times the first half",
+    )
+    args = parser.parse_args()
+
+    Constants.powerup_probability = args.powerup_probability
+    results = soak(args.minutes, args.samples)
+    columns = list(results[0].keys())
+    print("".join("{:>16}".format(column) for column in columns))
+    for result in results:
+        print("".join("{:>16.2f}".format(result[column]) for column in columns))
+
+    failed = False
+    half = len(results) // 2
+    for column in ["blocks", "powerups", "memory (KiB)", "update (ms)"]:
+        first = sum(result[column] for result in results[:half]) / max(1, half)
+        second = sum(result[column] for result in results[half:]) / max(
+            1, len(results) - half
+        )
+        if second > args.tolerance * first:
+            print("{} grew from {:.2f} to {:.2f}".format(column, first, second))
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Load benchmark for spectator streaming
+
+Plays a headless game with the autopilot at 60 fps, streaming it through a SpectatorServer to a fleet of stand-in
+spectators in another process. The stand-ins read the stream and count what they receive; a few of them can be
+made slow, to exercise the resynchronization of spectators that fall behind. One stand-in decodes every frame,
+and its view is checked against the game at the end.
+
+Reports the server CPU time per frame (encoding on the game thread, fanning out on the server thread),
+the bandwidth per spectator and the number of resyncs.
+
+Run from the repository root:
+    python benchmarks/spectator_fleet.py --spectators 200 --seconds 10
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from autopilot import Autopilot
+from common import Constants, GameFsmState
+from core_game_state import CoreGameState
+from spectator import LENGTH, SpectatorServer, SpectatorView
+
+
+async def stand_in(
+    port: int, slow: bool, decode: bool, results: dict, index: int, finished
+):
+    """One spectator: reads the stream until it ends, counting bytes and frames
+
+    A slow spectator is like one on a poor connection: it buffers little and reads at about 0.3 KiB/s,
+    less than the stream needs, so the server has to resynchronize it now and then
+    """
+    reader, writer = await asyncio.open_connection(
+        "127.0.0.1", port, limit=4096 if slow else 2**16
+    )
+    if slow:
+        writer.get_extra_info("socket").setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, 4096
+        )
+    view = SpectatorView() if decode else None
+    received = frames = 0
+    try:
+        while True:
+            if slow:
+                # What is still buffered when the game ends would take a slow spectator a while to read
+                if finished.is_set():
+                    break
+                data = await reader.read(64)
+                if not data:
+                    break
+                received += len(data)
+                await asyncio.sleep(0.2)
+                continue
+            header = await reader.readexactly(LENGTH.size)
+            (length,) = LENGTH.unpack(header)
+            frame = await reader.readexactly(length)
+            received += LENGTH.size + length
+            frames += 1
+            if view != None:
+                view.apply(frame)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    writer.close()
+    results[index] = (received, frames, view.objects() if view != None else None)
+
+
+def run_fleet(port: int, spectators: int, slow: int, connected, finished, queue):
+    """The stand-in process: runs every spectator on one event loop and reports what they received"""
+
+    async def fleet():
+        results = {}
+        tasks = [
+            asyncio.create_task(
+                stand_in(port, index < slow, index == slow, results, index, finished)
+            )
+            for index in range(spectators)
+        ]
+        # Give the connections a moment to be accepted before the game starts
+        await asyncio.sleep(0.5)
+        connected.set()
+        await asyncio.gather(*tasks)
+        return results
+
+    queue.put(asyncio.run(fleet()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--spectators", type=int, default=200)
+    parser.add_argument(
+        "--slow", type=int, default=5, help="how many spectators read slowly"
+    )
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    server = SpectatorServer()
+    server.start()
+    connected = multiprocessing.Event()
+    finished = multiprocessing.Event()
+    queue = multiprocessing.Queue()
+    fleet = multiprocessing.Process(
+        target=run_fleet,
+        args=(server.port, args.spectators, args.slow, connected, finished, queue),
+    )
+    fleet.start()
+    connected.wait()
+
+    random.seed(1)
+    core_game_state = CoreGameState(record_rewind=False)
+    core_game_state.ball.y_vel = Constants.init_y_vel_ball
+    autopilot = Autopilot()
+    frame_time = 1000 / 60
+    frames = int(args.seconds * 60)
+    next_frame = time.perf_counter()
+    for _ in range(frames):
+        if core_game_state.start_new_life():
+            core_game_state.make_new_ball()
+            core_game_state.ball.y_vel = Constants.init_y_vel_ball
+        keys = autopilot.keys(
+            core_game_state.paddle, core_game_state.ball, core_game_state.blocks
+        )
+        core_game_state.update(frame_time, keys, GameFsmState.PLAY)
+        server.publish(core_game_state.scene_changes())
+
+        next_frame += frame_time / 1000
+        time.sleep(max(0, next_frame - time.perf_counter()))
+
+    # Let the last frames drain before hanging up
+    time.sleep(0.5)
+    final_objects = [obj for obj in core_game_state.objects() if obj != None]
+    server.stop()
+    finished.set()
+    results = queue.get()
+    fleet.join()
+
+    received = [received for received, _, _ in results.values()]
+    fast = [results[index][0] for index in range(args.slow, args.spectators)]
+    print("frames                         {}".format(server.frames))
+    print("spectators                     {}".format(args.spectators))
+    print(
+        "encode per frame               {:.1f} us".format(
+            1e6 * server.encode_time / server.frames
+        )
+    )
+    print(
+        "fan-out per frame              {:.1f} us".format(
+            1e6 * server.fan_out_time / server.frames
+        )
+    )
+    print(
+        "bandwidth per spectator        {:.2f} KiB/s (fast spectators)".format(
+            sum(fast) / len(fast) / args.seconds / 1024
+        )
+    )
+    print("total sent                     {:.1f} KiB".format(sum(received) / 1024))
+    print("resyncs                        {}".format(server.resyncs))
+
+    decoded = results[args.slow][2]
+    matches = len(decoded) == len(final_objects) and all(
+        abs(a.x - b.x) < 1e-3 and abs(a.y - b.y) < 1e-3
+        for a, b in zip(decoded, final_objects)
+    )
+    print("decoded view matches the game  {}".format(matches))
+    sys.exit(0 if matches else 1)
+
+
+if __name__ == "__main__":
+    main()
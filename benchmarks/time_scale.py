@@ -0,0 +1,125 @@
+"""Achieved speed and frame skipping at each time scale
+
+Plays a headless game (GameState, Graphics with the dummy video driver, the autopilot at the paddle) at each of
+Constants.time_scales, the way GameLoop runs it: each frame's delta is the frame time, or however long the last
+frame actually took if that was longer, and the FrameSkipper decides which frames are drawn. Reports, per scale:
+    speed       game time simulated per real time, against the time scale asked for
+    skipped     frames taken in by Graphics without being drawn
+    substep     the longest physics substep, which stays within Constants.max_physics_delta_t at every scale
+    dropped     game time that did not fit in the substep cap and was not simulated
+
+Run from the repository root:
+    python benchmarks/time_scale.py
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import pygame
+
+from common import Constants, GameFsmState
+from game_state import GameState
+from graphics import Graphics
+from inputs import KeyboardState
+from performance import FrameSkipper
+
+
+def new_keys(game: GameState) -> set[int]:
+    """Keys that keep a game going: launch the ball, hand the paddle to the autopilot, restart when it ends"""
+    if game.game_fsm_state == GameFsmState.MENU:
+        return {pygame.K_p}
+    if game.game_fsm_state == GameFsmState.PRE_PLAY:
+        return {pygame.K_l}
+    if game.game_fsm_state == GameFsmState.PLAY and game.autopilot == None:
+        return {pygame.K_o}
+    if game.game_fsm_state in [GameFsmState.GAME_OVER, GameFsmState.GAME_WIN]:
+        return {pygame.K_r}
+    return set()
+
+
+def play(time_scale: float, frames: int, seed: int) -> dict[str, float]:
+    """Plays frames frames at a time scale, returning the measurements"""
+    random.seed(seed)
+    game = GameState()
+    game.set_time_scale(time_scale)
+    graphics = Graphics(game.settings.graphics_settings)
+    keyboard_state = KeyboardState()
+    frame_skipper = FrameSkipper()
+    frame_budget = 1000 / game.settings.fps
+
+    real_time = 0
+    game_time = 0
+    longest_substep = 0
+    dropped_time = 0
+    last_frame_time = frame_budget
+    for _ in range(frames):
+        keys = new_keys(game)
+        keyboard_state.new_keys_pressed = keys
+        keyboard_state.currently_pressed_keys = keys
+        total_delta_t = max(frame_budget, last_frame_time)
+
+        start = time.perf_counter()
+        _, graphics_instructions = game.update(total_delta_t, keyboard_state)
+        update_time = 1000 * (time.perf_counter() - start)
+        render = frame_skipper.should_render(game.time_scale, frame_budget, update_time)
+        if render:
+            graphics.render(graphics_instructions)
+        else:
+            graphics.skip(graphics_instructions)
+        last_frame_time = 1000 * (time.perf_counter() - start)
+        if render:
+            frame_skipper.rendered(last_frame_time - update_time)
+
+        core_game_state = game.core_game_state
+        if game.game_fsm_state == GameFsmState.PLAY and core_game_state != None:
+            real_time += total_delta_t
+            game_time += core_game_state.last_simulated_time
+            longest_substep = max(
+                longest_substep,
+                core_game_state.last_simulated_time
+                / core_game_state.last_update_repetitions,
+            )
+            dropped_time = max(dropped_time, core_game_state.dropped_time)
+
+    return {
+        "speed": game_time / real_time,
+        "skipped": frame_skipper.skipped_frames,
+        "substep": longest_substep,
+        "dropped": dropped_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    pygame.init()
+    print(
+        "{:>6} {:>8} {:>10} {:>12} {:>11}".format(
+            "scale", "speed", "skipped", "substep ms", "dropped ms"
+        )
+    )
+    for time_scale in Constants.time_scales:
+        result = play(time_scale, args.frames, args.seed)
+        print(
+            "{:>5g}x {:>7.2f}x {:>10} {:>12.4f} {:>11.0f}".format(
+                time_scale,
+                result["speed"],
+                result["skipped"],
+                result["substep"],
+                result["dropped"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Rollback benchmark for versus mode
+
+Plays a versus game between two peers in one process, connected over loopback UDP with artificial latency and
+packet loss, each player driven by an autopilot and paced in real time at 60 fps. The autopilots change their
+keys often, so predictions of the remote input are often wrong and there is plenty of rolling back.
+
+Reports how many rollbacks there were, how many frames they resimulated, and how long they took compared to
+the frame budget. At the end, both peers must have simulated exactly the same games.
+
+Run from the repository root:
+    python benchmarks/versus_loopback.py --latency 50 --loss 0.05 --seconds 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from autopilot import Autopilot
+from common import Constants
+from versus import RollbackSession, UdpLink
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--latency", type=float, default=50, help="one way, in milliseconds"
+    )
+    parser.add_argument(
+        "--loss", type=float, default=0.05, help="probability of dropping a packet"
+    )
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=7001)
+    args = parser.parse_args()
+
+    links = [
+        UdpLink(
+            ("127.0.0.1", args.port + player),
+            ("127.0.0.1", args.port + 1 - player),
+            args.latency,
+            args.loss,
+            seed=player,
+        )
+        for player in range(2)
+    ]
+    sessions = [
+        RollbackSession(player, links[player], args.seed) for player in range(2)
+    ]
+    autopilots = [Autopilot(), Autopilot()]
+
+    frame_budget = Constants.versus_frame_time / 1000
+    frames = int(args.seconds * 1000 / Constants.versus_frame_time)
+    over_budget = 0
+    next_frame = time.perf_counter()
+    for _ in range(frames):
+        for player, session in enumerate(sessions):
+            start = time.perf_counter()
+            # Each player reacts to their own board, as they currently see it
+            game = session.simulation.games[player]
+            session.advance(
+                autopilots[player].keys(game.paddle, game.ball, game.blocks)
+            )
+            if time.perf_counter() - start > frame_budget:
+                over_budget += 1
+
+        next_frame += frame_budget
+        time.sleep(max(0, next_frame - time.perf_counter()))
+
+    # Stop pressing anything and let the last inputs arrive, so both peers confirm the same frames
+    deadline = time.perf_counter() + 2 + 4 * args.latency / 1000
+    while time.perf_counter() < deadline:
+        for session in sessions:
+            if session.frame < frames + Constants.versus_max_rollback:
+                session.advance([])
+            else:
+                session.poll()
+        time.sleep(frame_budget)
+
+    for player, session in enumerate(sessions):
+        times = session.rollback_times
+        print("player {}".format(player + 1))
+        print("    frames simulated           {}".format(session.frame))
+        print("    stalls                     {}".format(session.stalls))
+        print("    rollbacks                  {}".format(session.rollbacks))
+        print(
+            "    frames resimulated         {} ({:.1f} per rollback)".format(
+                session.resimulated_frames,
+                session.resimulated_frames / max(1, session.rollbacks),
+            )
+        )
+        if times:
+            print(
+                "    rollback time              mean {:.2f} ms, max {:.2f} ms ({:.0f}% of the frame budget)".format(
+                    1000 * sum(times) / len(times),
+                    1000 * max(times),
+                    100 * max(times) / frame_budget,
+                )
+            )
+    print("peer frames over budget        {}".format(over_budget))
+
+    frame = min(session.confirmed_frames() for session in sessions)
+    in_sync = all(session.frame == frame for session in sessions) and (
+        sessions[0].simulation.save() == sessions[1].simulation.save()
+    )
+    print("games identical on both peers  {}".format(in_sync))
+    for link in links:
+        link.close()
+    sys.exit(0 if in_sync else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Provides a profiler for the memory allocated and garbage collections run by each stage of a frame
+
+Allocation profiling is turned on by setting the BREAKOUT_ALLOCATIONS environment variable. It uses tracemalloc,
+which slows the game down noticeably, so it is meant for finding where garbage comes from, not for normal play.
+
+For each stage, two numbers are recorded:
+    allocated   the peak of traced memory during the stage, above what was traced when it started.
+                This is the memory the stage needed at once, a lower bound on how much it allocated
+    retained    how much more memory is traced after the stage than before it
+and the number of collections of each garbage collector generation that ran during the stage.
+"""
+
+from dataclasses import dataclass, field
+import gc
+import tracemalloc
+
+
+@dataclass
+class StageAllocations:
+    """What one stage of one frame allocated"""
+
+    allocated: int = 0
+    retained: int = 0
+    collections: list[int] = field(default_factory=lambda: [0, 0, 0])
+
+
+class AllocationProfiler:
+    """Measures allocations between checkpoints, attributing them to the stage that just finished"""
+
+    def __init__(self):
+        self.frame = {}
+        self.__collections = [0, 0, 0]
+        self.__before = 0
+
+    def start(self):
+        """Starts tracing allocations and listening for garbage collections"""
+        tracemalloc.start()
+        gc.callbacks.append(self.__on_gc)
+        self.__reset()
+
+    def stop(self):
+        """Stops tracing"""
+        gc.callbacks.remove(self.__on_gc)
+        tracemalloc.stop()
+
+    def checkpoint(self, stage: str):
+        """Attributes everything since the last checkpoint to the given stage"""
+        current, peak = tracemalloc.get_traced_memory()
+        self.frame[stage] = StageAllocations(
+            max(0, peak - self.__before),
+            current - self.__before,
+            self.__collections,
+        )
+        self.__reset()
+
+    def end_frame(self) -> dict[str, StageAllocations]:
+        """Returns the allocations of each stage of the frame that just ended, and starts a new frame"""
+        frame = self.frame
+        self.frame = {}
+        return frame
+
+    def __reset(self):
+        """Starts measuring a new stage"""
+        self.__collections = [0, 0, 0]
+        tracemalloc.reset_peak()
+        self.__before = tracemalloc.get_traced_memory()[0]
+
+    def __on_gc(self, phase: str, info: dict):
+        """Counts garbage collections, by generation"""
+        if phase == "stop":
+            self.__collections[info["generation"]] += 1
+
+
+def freeze_long_lived_objects():
+    """Moves every object that exists now out of the reach of the garbage collector
+
+    Called once a level is loaded, so that the collector doesn't keep traversing the blocks and
+    everything else that lives for the whole game. Objects frozen for a previous level are unfrozen
+    first, so that they can be collected if they are garbage now.
+    """
+    gc.unfreeze()
+    gc.collect()
+    gc.freeze()
@@ -2,8 +2,12 @@
 
 from enum import Enum
 from dataclasses import dataclass
+from typing import Iterable
 import pygame
 
+from events import EventType, GameEvent
+from tracing import traced
+
 
 class Sound(Enum):
     """Stores the sounds that are to be played when certain events occur"""
@@ -15,6 +19,23 @@ class Sound(Enum):
     POWERUP = "powerup_sound"
 
 
+# The sounds played when things happen during play, see events.py
+EVENT_SOUNDS = {
+    EventType.PADDLE_HIT: Sound.HIT,
+    EventType.BLOCK_BROKEN: Sound.BLOCK,
+    EventType.POWERUP_COLLECTED: Sound.POWERUP,
+}
+
+
+def event_sounds(events: Iterable[GameEvent]) -> list[Sound]:
+    """The sounds to play for some game events"""
+    return [
+        EVENT_SOUNDS[event.event_type]
+        for event in events
+        if event.event_type in EVENT_SOUNDS
+    ]
+
+
 class Music(Enum):
     """Stores the music for different game screens"""
 
@@ -88,6 +109,7 @@ class Audio:
         self.__player.load(music)
         self.__player.play(-1)
 
+    @traced("Audio.run")
     def run(self, instructions: AudioInstructions):
         """Takes in audio instructions and plays the sounds/changes the music, as requested"""
         for sound_repr in instructions.sound_queue:
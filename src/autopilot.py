@@ -0,0 +1,217 @@
+"""Provides a closed-form predictor of where the ball will reach the paddle, and an autopilot built on it
+
+Between bounces the ball follows a parabola: x moves at a constant speed (clamped to Constants.ball_x_vel_limit)
+and y accelerates with Constants.gravity. So instead of running the physics substeps forward, the predictor
+solves for the first thing the ball hits along its parabola (a wall, the ceiling, a block or the paddle line),
+reflects the velocity like CoreGameState does, and repeats from there. A prediction costs a few microseconds
+per bounce, plus a cheap bounds test per block whenever the ball's path reaches the blocks.
+
+The prediction is exact up to the substep discretization, as long as nothing else changes the ball's course.
+Blocks that would break when hit are taken out of the layout for the rest of the prediction, but the protection
+they give is not updated. A piercing ball is predicted to go through every block.
+"""
+
+from dataclasses import dataclass
+import math
+from typing import Sequence
+
+import pygame
+
+from common import Ball, BallModifier, Block, Constants, Paddle
+
+# How far past the start of a segment an event must be, so that the bounce that started it is not found again
+EPSILON = 1e-9
+
+
+@dataclass
+class Prediction:
+    """Where the ball will reach the paddle line, how many milliseconds from now, after how many bounces"""
+
+    x: float
+    time: float
+    bounces: int
+
+
+def crossing_time(
+    y: float, y_vel: float, line: float, descending: bool
+) -> float | None:
+    """Returns how long until a ball at height y with velocity y_vel crosses the horizontal line
+
+    Only crossings in the given direction count. Returns None if the ball never crosses it that way
+    """
+    gravity = Constants.gravity
+    if gravity == 0:
+        if (y_vel > 0) != descending or y_vel == 0:
+            return None
+        time = (line - y) / y_vel
+        return time if time > EPSILON else None
+
+    discriminant = y_vel * y_vel + 2 * gravity * (line - y)
+    if discriminant < 0:
+        return None
+    root = math.sqrt(discriminant)
+    # The ball moves down through the line at the later root, and up through it at the earlier one
+    time = (-y_vel + root) / gravity if descending else (-y_vel - root) / gravity
+    return time if time > EPSILON else None
+
+
+def predict(
+    ball: Ball, blocks: Sequence[Block], paddle_line: float
+) -> Prediction | None:
+    """Predicts where the ball's centre will next move down through the height paddle_line
+
+    The blocks are looked at again after every bounce, so they must be a sequence rather than a one-shot iterator.
+    Returns None if the ball is already below the line, or bounces more than Constants.prediction_max_bounces times
+    """
+    radius = ball.radius
+    x, y, y_vel = ball.x, ball.y, ball.y_vel
+    x_vel = max(
+        -Constants.ball_x_vel_limit, min(Constants.ball_x_vel_limit, ball.x_vel)
+    )
+    gravity = Constants.gravity
+    left_wall, right_wall = radius, Constants.game_width - radius
+
+    # A piercing ball goes through blocks. Otherwise blocks are only looked at while the ball's path reaches them,
+    # which most predictions never do. Blocks hit during the prediction are tracked by their remaining hits
+    blocks = [] if ball.modifier == BallModifier.PIERCING else blocks
+    blocks_bottom = max(
+        (block.y + block.height + radius for block in blocks), default=-math.inf
+    )
+    remaining_hits = {}
+
+    elapsed = 0
+    for bounces in range(Constants.prediction_max_bounces + 1):
+        if y > paddle_line:
+            return None
+        landing = crossing_time(y, y_vel, paddle_line, True)
+        if landing == None:
+            return None
+
+        # The first event so far, as (time, which velocity it reflects, block hit)
+        event = (landing, None, None)
+        if x_vel < 0 and x > left_wall:
+            event = min(event, ((left_wall - x) / x_vel, "x", None), key=first)
+        elif x_vel > 0 and x < right_wall:
+            event = min(event, ((right_wall - x) / x_vel, "x", None), key=first)
+        ceiling = crossing_time(y, y_vel, radius, False)
+        if ceiling != None:
+            event = min(event, (ceiling, "y", None), key=first)
+
+        if y < blocks_bottom or y_vel < 0:
+            event = min(
+                event,
+                first_block_hit(
+                    x, y, x_vel, y_vel, radius, blocks, remaining_hits, event[0]
+                ),
+                key=first,
+            )
+
+        time, reflect, block = event
+        x += x_vel * time
+        y += (y_vel + gravity * time / 2) * time
+        y_vel += gravity * time
+        elapsed += time
+
+        if reflect == None:
+            return Prediction(x, elapsed, bounces)
+        elif reflect == "x":
+            x_vel = -x_vel
+        else:
+            y_vel = -y_vel
+        if block != None:
+            hits = remaining_hits.get(block.block_id, block.health)
+            # Protected blocks take no damage, like in CoreGameState.__update_block_from_collision
+            remaining_hits[block.block_id] = hits - (block.protection == 0)
+
+    return None
+
+
+def first(event: tuple) -> float:
+    """Orders events by time"""
+    return event[0]
+
+
+def first_block_hit(
+    x: float,
+    y: float,
+    x_vel: float,
+    y_vel: float,
+    radius: float,
+    blocks: Sequence[Block],
+    remaining_hits: dict,
+    before: float,
+) -> tuple:
+    """Returns the first (time, reflected velocity, block) hit before the given time, or (math.inf, None, None)
+
+    Blocks whose remaining hits have run out are already broken, and skipped
+    """
+    gravity = Constants.gravity
+    best = (math.inf, None, None)
+    # Only blocks that overlap the box the ball moves in before the deadline can be hit
+    y_end = y + (y_vel + gravity * before / 2) * before
+    highest, lowest = min(y, y_end), max(y, y_end)
+    if y_vel < 0 and gravity > 0 and -y_vel / gravity < before:
+        highest = y - y_vel * y_vel / (2 * gravity)
+    leftmost, rightmost = sorted([x, x + x_vel * before])
+
+    for block in blocks:
+        # The rectangle the ball's centre can't enter
+        left = block.x - radius
+        right = block.x + block.width + radius
+        top = block.y - radius
+        bottom = block.y + block.height + radius
+        if top > lowest or bottom < highest or left > rightmost or right < leftmost:
+            continue
+        if remaining_hits.get(block.block_id, 1) <= 0:
+            continue
+
+        if x_vel > 0 and x <= left:
+            time = (left - x) / x_vel
+            if EPSILON < time < best[0]:
+                y_at = y + (y_vel + gravity * time / 2) * time
+                if top < y_at < bottom:
+                    best = (time, "x", block)
+        elif x_vel < 0 and x >= right:
+            time = (right - x) / x_vel
+            if EPSILON < time < best[0]:
+                y_at = y + (y_vel + gravity * time / 2) * time
+                if top < y_at < bottom:
+                    best = (time, "x", block)
+
+        if y <= top:
+            time = crossing_time(y, y_vel, top, True)
+        elif y >= bottom:
+            time = crossing_time(y, y_vel, bottom, False)
+        else:
+            time = None
+        if time != None and time < best[0]:
+            if left < x + x_vel * time < right:
+                best = (time, "y", block)
+
+    return best
+
+
+class Autopilot:
+    """Moves the paddle to where the ball will come down, by choosing which keys to hold each frame"""
+
+    def keys(
+        self, paddle: Paddle, ball: Ball | None, blocks: Sequence[Block]
+    ) -> list[int]:
+        """Returns the keys to press this frame"""
+        if ball == None:
+            target = Constants.game_width / 2
+        else:
+            prediction = predict(ball, blocks, paddle.y - ball.radius)
+            target = prediction.x if prediction != None else ball.x
+
+        # Without any impulse the paddle would still coast x_vel / air_resistance_coefficient further
+        resting = (
+            paddle.x
+            + paddle.width / 2
+            + paddle.x_vel / Constants.air_resistance_coefficient
+        )
+        if target > resting + Constants.autopilot_deadband:
+            return [pygame.K_d]
+        elif target < resting - Constants.autopilot_deadband:
+            return [pygame.K_a]
+        return []
@@ -0,0 +1,311 @@
+"""Provides the engine that applies the area effects of blocks, like protectors shielding the blocks under them
+
+Each block type with an effect declares it in BLOCK_EFFECTS, as a kind and the cells (relative to the block's id)
+it reaches. BlockEffects keeps an index of the live blocks by id and, for each of them, the ids of the cells its
+effect reaches, worked out once when the block comes into play. So applying an effect only looks at the blocks it
+reaches, instead of scanning the whole board.
+
+Breaking blocks goes through a work queue: breaking an explosive block queues its neighbours, which may be
+explosive themselves, and so on until nothing more breaks. Blocks that revive wait in a heap ordered by when they
+come back, so nothing has to be checked each frame except the top of the heap.
+
+The blocks of a level are built as they are needed (see LevelBlocks in level.py). Looking up a cell that has not been
+built builds its block, and a pristine protector still protects the blocks around it.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+import heapq
+from typing import Iterable, Tuple
+
+from common import Block, BlockType, Constants
+from level import LevelBlocks
+
+
+class EffectKind(Enum):
+    """What an effect does to the blocks it reaches"""
+
+    # While the block is alive, the blocks it reaches take no damage
+    PROTECT = "protect"
+    # When the block breaks, the blocks it reaches gain Constants.heal_amount health
+    HEAL = "heal"
+    # When the block breaks, the blocks it reaches break too
+    EXPLODE = "explode"
+    # The block itself comes back Constants.revive_delay milliseconds after it breaks, as a normal block
+    REVIVE = "revive"
+
+
+@dataclass(frozen=True, slots=True)
+class AreaEffect:
+    """An effect, and the cells it reaches as (column, row) offsets from the block's id"""
+
+    kind: EffectKind
+    offsets: Tuple[Tuple[int, int], ...]
+
+
+BELOW = ((-1, 1), (0, 1), (1, 1))
+AROUND = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+BLOCK_EFFECTS = {
+    BlockType.PROTECTOR: AreaEffect(EffectKind.PROTECT, BELOW),
+    BlockType.HEALER: AreaEffect(EffectKind.HEAL, AROUND),
+    BlockType.EXPLOSIVE: AreaEffect(EffectKind.EXPLODE, AROUND),
+    BlockType.REVIVER: AreaEffect(EffectKind.REVIVE, ()),
+}
+
+# The offsets from a block to the cells that can protect it, with the type of block that would be there
+PROTECTED_FROM = [
+    (block_type, (-i, -j))
+    for block_type, effect in BLOCK_EFFECTS.items()
+    if effect.kind == EffectKind.PROTECT
+    for i, j in effect.offsets
+]
+
+
+class BlockEffects:
+    """Keeps track of which blocks are where, and applies their effects as they come into play and break
+
+    The protection of a block is kept up to date as the number of live blocks protecting it, built or not.
+    CoreGameState owns the list of blocks, and tells BlockEffects about every block that is added or goes away.
+    """
+
+    def __init__(self):
+        # The live blocks by id, and the ids of the cells the effect of each one reaches
+        self.__blocks = {}
+        self.__targets = {}
+        # Where the blocks of the level that have not been built yet come from, if there are any
+        self.__unbuilt = None
+        # PROTECTED_FROM, with the cells that could protect a block without having been built yet
+        self.__protected_from = [
+            (block_type, offset, set()) for block_type, offset in PROTECTED_FROM
+        ]
+        # Blocks queued to be broken by process()
+        self.__queue = deque()
+        # Milliseconds of play so far, which revive times are measured against
+        self.clock = 0.0
+        # Broken blocks waiting to revive, as a heap of (revive time, block id, block)
+        self.revives = []
+
+    def rebuild(self, blocks: Iterable[Block], unbuilt: LevelBlocks = None):
+        """Indexes a whole new set of blocks (a level starting, or a snapshot being restored), and sets their protection
+
+        The rest of the blocks, if any, are built from unbuilt as they are looked up
+        """
+        self.__blocks = {}
+        self.__targets = {}
+        self.__unbuilt = unbuilt
+        self.__protected_from = [
+            (
+                block_type,
+                offset,
+                unbuilt.pristine_cells(block_type) if unbuilt != None else set(),
+            )
+            for block_type, offset in PROTECTED_FROM
+        ]
+        self.__queue.clear()
+        blocks = list(blocks)
+        for block in blocks:
+            self.__index(block)
+            block.protection = 0
+        for block in blocks:
+            effect = BLOCK_EFFECTS.get(block.block_type)
+            if effect != None and effect.kind == EffectKind.PROTECT:
+                for target in self.__live_targets(block):
+                    target.protection += 1
+        # Protectors that have not been built protect too
+        if unbuilt != None:
+            for block in blocks:
+                i, j = block.block_id
+                for _, (di, dj), pristine in self.__protected_from:
+                    if (i + di, j + dj) in pristine:
+                        block.protection += 1
+
+    def add(self, block: Block) -> list[Block]:
+        """Indexes a block that came into play, like a new row in endless mode or a revived block
+
+        Returns the blocks whose protection changed, including the new block
+        """
+        self.__index(block)
+        block.protection = self.__protectors(block)
+
+        changed = [block]
+        effect = BLOCK_EFFECTS.get(block.block_type)
+        if effect != None and effect.kind == EffectKind.PROTECT:
+            for target in self.__live_targets(block):
+                target.protection += 1
+                changed.append(target)
+        return changed
+
+    def remove(self, block: Block) -> list[Block]:
+        """Stops indexing a block that left play without breaking, like a row scrolling away in endless mode
+
+        Returns the blocks whose protection changed
+        """
+        changed = []
+        effect = BLOCK_EFFECTS.get(block.block_type)
+        if effect != None and effect.kind == EffectKind.PROTECT:
+            for target in self.__live_targets(block):
+                target.protection -= 1
+                changed.append(target)
+        del self.__blocks[block.block_id]
+        del self.__targets[block.block_id]
+        return changed
+
+    def __len__(self) -> int:
+        """The number of live blocks that have been built"""
+        return len(self.__blocks)
+
+    def unbuilt(self) -> int:
+        """The number of blocks of the level that have not been built yet"""
+        return self.__unbuilt.remaining if self.__unbuilt != None else 0
+
+    def built(self) -> list[Block]:
+        """The live blocks that have been built"""
+        return list(self.__blocks.values())
+
+    def build_all(self) -> list[Block]:
+        """Builds every block that has not been built yet, and returns all the live blocks"""
+        if self.__unbuilt != None:
+            # Their protectors may be among them, so they are all indexed before working it out
+            blocks = self.__unbuilt.take_all()
+            for block in blocks:
+                self.__index(block)
+            for block in blocks:
+                block.protection = self.__protectors(block)
+        return self.built()
+
+    def is_live(self, block: Block) -> bool:
+        """Whether a block is in play, i.e. indexed and not broken"""
+        return self.__blocks.get(block.block_id) is block
+
+    def blocks_in(self, cols: range, rows: range) -> list[Block]:
+        """The live blocks whose ids are in a range of columns and rows, by column, then row
+
+        The cost is proportional to the size of the range, however large the board is. Blocks in the range that
+        have not been built are built
+        """
+        blocks = self.__blocks
+        if self.__unbuilt == None or self.__unbuilt.remaining == 0:
+            return [blocks[(i, j)] for i in cols for j in rows if (i, j) in blocks]
+
+        found = []
+        for i in cols:
+            for j in rows:
+                block = blocks.get((i, j))
+                if block == None:
+                    block = self.__take(i, j)
+                if block != None:
+                    found.append(block)
+        return found
+
+    def break_block(self, block: Block):
+        """Queues a block to be broken. Nothing happens to it until process() is called"""
+        self.__queue.append(block)
+
+    def pending(self) -> bool:
+        """Whether there are blocks queued to be broken"""
+        return len(self.__queue) > 0
+
+    def process(self) -> Tuple[list[Block], list[Block]]:
+        """Breaks the queued blocks and applies their effects, until nothing more breaks
+
+        Returns the blocks that broke, in the order they broke, and the blocks that changed (which may include
+        blocks that broke later on). The cost is proportional to the number of blocks affected, however large
+        the board is
+        """
+        broken = []
+        changed = []
+        queue = self.__queue
+        while queue:
+            block = queue.popleft()
+            # A block can be queued more than once, like when two explosions reach it
+            if not self.is_live(block):
+                continue
+            effect = BLOCK_EFFECTS.get(block.block_type)
+            if effect != None:
+                if effect.kind == EffectKind.EXPLODE:
+                    queue.extend(self.__live_targets(block, build=True))
+                elif effect.kind == EffectKind.HEAL:
+                    for target in self.__live_targets(block, build=True):
+                        target.health += Constants.heal_amount
+                        changed.append(target)
+                elif effect.kind == EffectKind.REVIVE:
+                    heapq.heappush(
+                        self.revives,
+                        (self.clock + Constants.revive_delay, block.block_id, block),
+                    )
+            changed += self.remove(block)
+            broken.append(block)
+        return broken, changed
+
+    def advance(self, delta_t: float) -> list[Block]:
+        """Moves the clock on, returning the blocks that revive. They are not indexed until they are add()ed"""
+        self.clock += delta_t
+        revived = []
+        while self.revives and self.revives[0][0] <= self.clock:
+            _, _, block = heapq.heappop(self.revives)
+            block.block_type = BlockType.NORMAL
+            block.health = Constants.revived_block_health
+            revived.append(block)
+        return revived
+
+    def __index(self, block: Block):
+        """Adds a block to the index, working out the cells its effect reaches"""
+        i, j = block.block_id
+        effect = BLOCK_EFFECTS.get(block.block_type)
+        self.__blocks[block.block_id] = block
+        self.__targets[block.block_id] = (
+            [(i + di, j + dj) for di, dj in effect.offsets] if effect != None else []
+        )
+
+    def __take(self, i: int, j: int) -> Block | None:
+        """Builds the block of a cell that has not been built, if it has one, and indexes it"""
+        block = self.__unbuilt.take(i, j)
+        if block != None:
+            self.__build(block)
+        return block
+
+    def __build(self, block: Block):
+        """Indexes a block that was just built
+
+        Unlike a block added by add(), it has been in play all along: the blocks it protects already count it
+        """
+        self.__index(block)
+        block.protection = self.__protectors(block)
+
+    def __protectors(self, block: Block) -> int:
+        """The number of live blocks protecting a block, built or not"""
+        i, j = block.block_id
+        protection = 0
+        for block_type, (di, dj), pristine in self.__protected_from:
+            cell = (i + di, j + dj)
+            source = self.__blocks.get(cell)
+            if source != None:
+                if source.block_type == block_type:
+                    protection += 1
+            elif cell in pristine:
+                protection += 1
+        return protection
+
+    def __live_targets(self, block: Block, build: bool = False) -> list[Block]:
+        """The live blocks the effect of a block reaches. Levels can leave cells empty, or put blocks on an edge
+
+        Targets that have not been built are only built if asked to. Protection doesn't need to: a block built
+        later works out its protection from the blocks around it then
+        """
+        blocks = self.__blocks
+        if build and self.__unbuilt != None and self.__unbuilt.remaining > 0:
+            found = []
+            for target in self.__targets[block.block_id]:
+                target_block = blocks.get(target)
+                if target_block == None:
+                    target_block = self.__take(*target)
+                if target_block != None:
+                    found.append(target_block)
+            return found
+        return [
+            blocks[target]
+            for target in self.__targets[block.block_id]
+            if target in blocks
+        ]
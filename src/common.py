@@ -7,6 +7,9 @@ from dataclasses import dataclass
 
 # A type alias for cleaner code
 Color = Tuple[float, float, float]
+# A color packed into one int as 0xRRGGBB, see Colors.pack. Blocks store their color like this,
+# since there can be very many of them
+PackedColor = int
 
 
 class Colors:
@@ -18,17 +21,34 @@ class Colors:
     red = (255, 0, 0)
 
     @staticmethod
-    def generate_random_block_color() -> Color:
-        """Generates a random BRIGHT color, so that blocks are distinguishable from the background"""
-        color = tuple([random.randint(0, 255) for i in range(3)])
+    def generate_random_block_color(rng: random.Random = random) -> PackedColor:
+        """Generates a random BRIGHT color, so that blocks are distinguishable from the background
+
+        Uses the random module unless a seeded generator is given
+        """
+        # One call for all three channels, since this runs once per block when a level is built
+        color = rng.getrandbits(24)
         return (
-            color if Colors.is_bright(color) else Colors.generate_random_block_color()
+            color
+            if Colors.is_bright(Colors.unpack(color))
+            else Colors.generate_random_block_color(rng)
         )
 
+    @staticmethod
+    def pack(color: Color) -> PackedColor:
+        """Packs a color into one int"""
+        r, g, b = color
+        return int(r) << 16 | int(g) << 8 | int(b)
+
+    @staticmethod
+    def unpack(color: PackedColor) -> Color:
+        """Unpacks a color packed by Colors.pack"""
+        return color >> 16, color >> 8 & 0xFF, color & 0xFF
+
     @staticmethod
     def is_bright(color: Color, brightness: int = 20) -> bool:
         """Checks if a color is bright enough"""
-        return not [i < brightness for i in color] == [True, True, True]
+        return max(color) >= brightness
 
     @staticmethod
     def negative(color: Color) -> Color:
@@ -66,6 +86,15 @@ class Settings:
     graphics_settings: GraphicsSettings
 
 
+class InvariantLevel(Enum):
+    """How thoroughly invariants are checked each frame, see invariants.py"""
+
+    OFF = "off"
+    SAMPLED = "sampled"
+    EVERY_FRAME = "every frame"
+    EXHAUSTIVE = "exhaustive"
+
+
 class Constants:
     """Holds config information"""
 
@@ -81,21 +110,142 @@ class Constants:
     # How many times should the physics update per FRAME (not per second)
     # See: discussion in core game state about overshooting when using large time updates
     update_repetitions = 50
+
+    # Frame spikes (window drags, GC pauses, slow disk reads) give one very large delta. Instead of stretching the
+    # substeps to cover it, more substeps of at most max_physics_delta_t milliseconds are run, up to
+    # max_update_repetitions per frame. Any time beyond that budget is dropped rather than simulated.
+    # max_physics_delta_t matches the substep length at 30 fps, so normal play is unaffected
+    max_physics_delta_t = 1000 / (30 * update_repetitions)
+    max_update_repetitions = 4 * update_repetitions
+
+    # On static screens (menus, pause, etc.) the main loop sleeps until input arrives instead of ticking at full fps
+    # It still wakes up at least this often (in milliseconds) so that screens can be redrawn
+    idle_wait_timeout = 250
+
+    # Performance HUD (toggled with F3): stage timings are averaged over hud_window frames, the text is refreshed
+    # every hud_refresh_interval milliseconds and the graph shows the last hud_graph_frames frame times
+    hud_window = 60
+    hud_refresh_interval = 250
+    hud_graph_frames = 120
+
+    # Release builds only sample invariants, see invariants.py
+    default_invariant_level = InvariantLevel.SAMPLED
+    invariant_sample_interval = 10
+
+    # With BREAKOUT_ALLOCATIONS set, allocations per stage are averaged and printed every this many frames
+    allocation_report_interval = 300
+    # The most a steady-state frame of play may allocate, in bytes, checked by benchmarks/allocation_budget.py
+    play_frame_allocation_budget = 64 * 1024
+    # Moves objects loaded with a level out of the garbage collector's reach, see allocation.py
+    freeze_gc_after_level_load = True
+
+    # How many spans the tracing ring buffer holds (about 30 seconds of play), see tracing.py
+    trace_capacity = 200000
+    # How many events CoreGameState's event stream holds before overwriting the oldest, see events.py
+    event_stream_capacity = 1024
     init_y_vel_ball = -0.8
     init_max_x_vel_ball = 0.4
     max_x_vel_ball = 0.8
+    # The ball's horizontal speed is clamped to this every physics substep
+    ball_x_vel_limit = 0.1
     ball_radius = 5
+
+    # The rewind buffer keeps this many frames (5 seconds at 60 fps), with a full keyframe every rewind_keyframe_interval
+    rewind_frames = 300
+    rewind_keyframe_interval = 30
+    # How many frames each press of the rewind key goes back
+    rewind_scrub_frames = 10
     initial_lives = 3
     life_width = 5
 
+    # Block effects (see block_effects.py): healers heal the blocks around them by heal_amount when they break,
+    # and revivers come back revive_delay milliseconds after breaking, as normal blocks with revived_block_health
+    heal_amount = 1
+    revive_delay = 5000
+    revived_block_health = 1
+
     powerup_probability = 0.4
     powerup_type_probabilities = [0.8, 0.2]
     # probablities should add to 1
     assert round(sum(powerup_type_probabilities), 3) == 1.0
     powerup_fall_speed = 0.4
 
-
-@dataclass
+    # Endless mode: rows of blocks scroll down at this speed (game units per millisecond) and new rows appear at the top
+    # Blocks that scroll past endless_retire_line are removed, so only a bounded number of rows ever exist
+    endless_scroll_speed = 0.005
+    endless_retire_line = 0.6 * game_height
+    endless_gap_probability = 0.2
+    endless_tough_probability = 0.3
+    endless_protector_probability = 0.03
+
+    # Training environment (see environment.py): each step simulates one frame of env_frame_time milliseconds,
+    # an episode is cut off after env_max_frames steps, and at most env_max_powerups falling powerups are observed.
+    # Breaking a block is worth 1, gaining a life env_life_reward and losing one -env_life_reward
+    env_frame_time = 1000 / 60
+    env_max_frames = 5 * 60 * 60
+    env_max_powerups = 4
+    env_life_reward = 5
+
+    # The ball predictor (see autopilot.py) follows at most this many bounces off walls, the ceiling and blocks.
+    # The autopilot stops pushing the paddle once it would coast to within autopilot_deadband of its target
+    prediction_max_bounces = 16
+    autopilot_deadband = 4
+
+    # Difficulty estimation (see difficulty.py) plays games in frames of difficulty_frame_time milliseconds. Long
+    # frames get more substeps of max_physics_delta_t, so the physics is the same as at 30 fps with fewer frames to
+    # work through, but controllers only steer once a frame, and much longer frames make them steer too coarsely.
+    # It gives up on a game after difficulty_max_game_time milliseconds
+    difficulty_frame_time = 50
+    difficulty_max_game_time = 5 * 60 * 1000
+    # The human controller sees the ball this many milliseconds late, and aims this far off (a standard deviation)
+    difficulty_reaction_time = 150
+    difficulty_aim_error = 12
+
+    # Spectator streaming (see spectator.py): each spectator can have this many frames waiting to be sent before
+    # it is considered to have fallen behind and is resynchronized with a keyframe
+    spectator_port = 7878
+    spectator_queue_frames = 30
+    # Bytes buffered for each spectator by the socket and by asyncio, beyond which sending waits
+    spectator_send_buffer = 4 * 1024
+
+    # Time scale (see GameState.set_time_scale): [ and ] step through these speeds, in multiples of real time.
+    # Faster than real time, frames are skipped rather than drawn when the physics needs the time, but never more
+    # than max_skipped_frames in a row
+    time_scales = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16]
+    max_skipped_frames = 8
+
+    # Particle effects (see particles.py), only drawn when NumPy is installed. Speeds are in game units per
+    # millisecond, lifetimes in milliseconds and sizes in game units
+    particle_capacity = 10000
+    particles_per_block = 40
+    particles_per_paddle_hit = 10
+    particle_speed = 0.15
+    particle_lifetime = 700
+    particle_size = 2
+
+    # Huge-board mode (H in the menu) plays a level of huge_board_cols by huge_board_rows blocks, seen through a
+    # camera that follows the ball, zoomed in by one of camera_zooms (Z steps through them). Its blocks are drawn
+    # from pre-rendered tiles of tile_pixels by tile_pixels pixels, of which at most tile_cache_size are kept
+    huge_board_cols = 200
+    huge_board_rows = 100
+    camera_zooms = [1, 2, 4, 8]
+    default_camera_zoom = 4
+    tile_pixels = 128
+    tile_cache_size = 128
+    # Looking at every block of a huge board takes too long for a frame. There the autopilot only predicts bounces
+    # off the blocks within huge_board_autopilot_reach of the ball, and expensive invariants only check the blocks
+    # within huge_board_invariant_reach of it, which is where blocks break (both in game units)
+    huge_board_autopilot_reach = 50
+    huge_board_invariant_reach = 30
+
+    # Versus mode (see versus.py) runs in lockstep at 60 fps. Local input is applied versus_input_delay frames late,
+    # and a peer simulates at most versus_max_rollback frames past the last one it has the other peer's input for
+    versus_frame_time = 1000 / 60
+    versus_input_delay = 2
+    versus_max_rollback = 8
+
+
+@dataclass(slots=True)
 class Paddle:
     """Holds data for the paddle"""
 
@@ -113,7 +263,7 @@ class BallModifier(Enum):
     PIERCING = "piercing"
 
 
-@dataclass
+@dataclass(slots=True)
 class Ball:
     """Holds data for the ball"""
 
@@ -123,7 +273,9 @@ class Ball:
     y_vel: float
     radius: float
     has_fallen: bool = False
-    modifier: None | BallModifier = None  # This will later probably be a list, but for now only one possible modifier at a time
+    modifier: None | BallModifier = (
+        None  # This will later probably be a list, but for now only one possible modifier at a time
+    )
     modifier_active_for: float = 0  # This will later probably be a list
     max_blocks_can_pierce: int = (
         0  # If many other modifiers are added, will be packaged up into an object
@@ -144,22 +296,24 @@ class BlockType(Enum):
     NORMAL = "normal"
     POWERUP = "powerup"
     PROTECTOR = "protector"
+    HEALER = "healer"
+    EXPLOSIVE = "explosive"
+    REVIVER = "reviver"
 
     @classmethod
-    def normal_or_powerup(cls, probability_powerup):
+    def normal_or_powerup(cls, probability_powerup, rng: random.Random = random):
         """Chooses whether a block is normal or has a powerup, when initializing a level
 
-        This does not deal with protector blocks, which are hardcoded (currently) or decided by the
-        level data (not yet implemented)
+        This does not deal with blocks with effects, like protectors, which are decided by the level data (see level.py)
         """
         return (
             BlockType.POWERUP
-            if random.random() < probability_powerup
+            if rng.random() < probability_powerup
             else BlockType.NORMAL
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Block:
     """Holds block data"""
 
@@ -172,7 +326,7 @@ class Block:
     health: int
     protection: int
 
-    color: Color
+    color: PackedColor
 
 
 class PowerupType(Enum):
@@ -182,7 +336,7 @@ class PowerupType(Enum):
     LIFE = "life"
 
 
-@dataclass
+@dataclass(slots=True)
 class Powerup:
     """Holds the data for the actual powerup as it falls"""
 
@@ -194,3 +348,25 @@ class Powerup:
 
 # A Union type for gameObjects that Graphics will render
 GameObject = Block | Paddle | Powerup | Ball
+
+# Stable ids of the objects to render, used by SceneChanges. Blocks use their block_id, and each powerup gets
+# ("powerup", n) while it exists
+PADDLE_SCENE_ID = "paddle"
+BALL_SCENE_ID = "ball"
+SceneId = str | Tuple[int, int] | Tuple[str, int]
+
+
+@dataclass(slots=True)
+class SceneChanges:
+    """What changed in the objects to render since the last SceneChanges, keyed by stable ids
+
+    CoreGameState keeps track of these as it updates, so that Graphics can keep the objects it draws and
+    only be told about the ones that were created, changed or destroyed, instead of getting all of them every frame
+    """
+
+    # Whether everything the receiver holds must be dropped first, because all the objects were replaced
+    # (a new game, a rewind, a quickload). changed then holds every object
+    reset: bool
+    # Objects created or changed, in the order they are drawn
+    changed: dict[SceneId, GameObject]
+    destroyed: list[SceneId]
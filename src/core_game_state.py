@@ -1,13 +1,15 @@
 """Provide a class to hold the state of actual level objects"""
 
+import bisect
 from dataclasses import dataclass
 from enum import Enum
 import random
+import math
+from operator import attrgetter
 from typing import Tuple
 import pygame
 
 from common import (
-    Colors,
     Constants,
     Block,
     Paddle,
@@ -18,8 +20,20 @@ from common import (
     PowerupType,
     Powerup,
     GameObject,
+    SceneChanges,
+    PADDLE_SCENE_ID,
+    BALL_SCENE_ID,
 )
-from audio import Sound
+from block_effects import BlockEffects
+from events import EventStream, EventType
+from rewind import RewindBuffer
+from level import LevelData, LevelBlocks, EndlessField
+from tracing import traced
+
+# The blocks of a level are kept in order of this key
+BLOCK_ID = attrgetter("block_id")
+# With a camera, the blocks of a level are built as squares of this many cells come into view
+REVEAL_CELLS = 8
 
 
 class CoreGameState:
@@ -29,7 +43,22 @@ class CoreGameState:
     updating the physics of the game, collision detection, removing blocks, spawning powerups, etc.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        level: LevelData = None,
+        endless_seed: int = None,
+        level_seed: int = None,
+        record_rewind: bool = True,
+        record_events: bool = True,
+    ):
+        # Changes to the objects to render since scene_changes() was last called. The first call gets everything
+        self.__scene_reset = True
+        self.__scene_changed = {}
+        self.__scene_destroyed = []
+        # Scene ids of the powerups, by object identity, since powerups have no id of their own
+        self.__powerup_scene_ids = {}
+        self.__next_powerup_scene_id = 0
+
         self.lives = Constants.initial_lives
         self.paddle = Paddle(
             Constants.game_width / 2 - 50,
@@ -50,29 +79,278 @@ class CoreGameState:
             Constants.ball_radius,
         )
 
-        self.blocks = self.__generate_blocks(9, 5)
-        self.__set_special_blocks()
-        self.__update_block_effects()
+        # In endless mode there is no level. Rows are generated as the field scrolls, see __scroll_endless_field
+        self.endless_field = None
+        # The blocks of a level stay in the cells of its grid, so the ball is only checked against the blocks in
+        # the cells around it (see blocks_around). Endless blocks move, so the ball is checked against all of them
+        self.__cell_size = None
+        # Below the bottom row of a level, the ball can't touch any block
+        self.__blocks_bottom = None
+        # Where each block is, and what blocks do to each other (protecting, exploding, reviving, ...)
+        self.block_effects = BlockEffects()
+        # The blocks of a level are built as they are needed, see LevelBlocks. Until something needs all of them,
+        # there is no list of blocks
+        self.__level_blocks = None
+        self.__blocks = None
+        # The squares of REVEAL_CELLS cells whose blocks have been built for the camera, see scene_changes
+        self.__revealed = set()
+        if endless_seed != None:
+            self.endless_field = EndlessField(endless_seed)
+            self.blocks = self.endless_field.scroll(0)
+            self.block_effects.rebuild(self.blocks)
+        else:
+            if level == None:
+                level = LevelData.default()
+            self.__cell_size = level.cell_size()
+            self.__blocks_bottom = level.num_rows * self.__cell_size[1]
+            # The random types and colors of the blocks come from this seed, see LevelData.block
+            if level_seed == None:
+                level_seed = random.randrange(2**32)
+            self.__level_blocks = LevelBlocks(level, level_seed)
+            self.block_effects.rebuild([], self.__level_blocks)
         self.powerups = []
+        # Powerups that were collected or fell off, kept to be reused instead of building new ones
+        self.__powerup_pool = []
         self.new_life = False
 
+        # Metrics about how the last frames were simulated, see update()
+        self.dropped_time = 0
+        self.last_update_repetitions = 0
+        self.last_simulated_time = 0
+
+        # What happens during play (blocks breaking, lives lost, ...), for sounds and anything else to read.
+        # Headless users that read none of it can skip recording it, and events is None
+        self.events = None
+        if record_events:
+            self.events = EventStream(Constants.event_stream_capacity)
+
+        # Headless users (like the training environment) can skip recording, since nobody will rewind
+        self.rewind_buffer = None
+        # The blocks that changed since the rewind buffer last recorded a frame, by id (None for blocks that went
+        # away), so that it only packs those. Blocks that only scrolled with the endless field are not included
+        self.__rewind_changes = {}
+        if record_rewind:
+            self.rewind_buffer = RewindBuffer(
+                Constants.rewind_frames, Constants.rewind_keyframe_interval
+            )
+
+    @traced("CoreGameState.update")
     def update(
-        self, total_delta_t: float, keys: list[int], game_fsm_state
-    ) -> Tuple[list[Sound], list[GameObject]]:
-        """Given the current gameFSMstate, update the game physics and data. Also return the sounds to play and objects to render"""
-        delta_t = total_delta_t / Constants.update_repetitions
-        output_sounds = []
+        self,
+        total_delta_t: float,
+        keys: list[int],
+        game_fsm_state,
+        time_scale: float = 1,
+    ):
+        """Given the current gameFSMstate, update the game physics and data
 
+        Game time passes time_scale times as fast as total_delta_t, see __substeps.
+        What happened during the update is written to self.events, and what changed on screen is returned
+        by scene_changes()
+        """
         # Update repetitions: when the time step is too large, the physics does not work correctly
         # because the forces are too large and cause the paddle to overshoot. The only way to reduce timestep
         # is to increase the framerate of the game, which is not feasible beyond a certain limit.
         # So instead, the physics of the game is updated at much smaller timesteps, multiple times each frame
 
+        self.last_simulated_time = 0
         if game_fsm_state == GameFsmState.PLAY:
-            for _ in range(Constants.update_repetitions):
-                self.__update_game_physics(delta_t, keys, output_sounds)
+            paddle_x, lives = self.paddle.x, self.paddle.lives
+            repetitions, delta_t = self.__substeps(total_delta_t, time_scale)
+            for _ in range(repetitions):
+                self.__update_game_physics(delta_t, keys)
+            self.last_simulated_time = repetitions * delta_t
+            if self.endless_field != None:
+                self.__scroll_endless_field(repetitions * delta_t)
+            revived = self.block_effects.advance(repetitions * delta_t)
+            if revived:
+                self.__revive_blocks(revived)
+            if self.rewind_buffer != None:
+                self.rewind_buffer.record(self, self.__rewind_changes)
+                self.__rewind_changes = {}
+
+            # The ball and powerups move all the time, the paddle only while it is pushed or coasting
+            if not self.__scene_reset:
+                if self.paddle.x != paddle_x or self.paddle.lives != lives:
+                    self.__scene_changed[PADDLE_SCENE_ID] = self.paddle
+                if self.ball != None:
+                    self.__scene_changed[BALL_SCENE_ID] = self.ball
+                for powerup in self.powerups:
+                    scene_id = self.__powerup_scene_ids[id(powerup)]
+                    self.__scene_changed[scene_id] = powerup
+
+    @property
+    def blocks(self) -> list[Block]:
+        """The blocks in play. For levels, in order of id, which is kept as blocks are broken and revived
+
+        The first time this is read, every block of the level that has not been built yet is built, which takes time
+        in proportion to the size of the level. Use num_blocks() to count them, or blocks_around() for the blocks
+        near a point
+        """
+        if self.__blocks == None:
+            self.__build_blocks()
+        return self.__blocks
+
+    @blocks.setter
+    def blocks(self, blocks: list[Block]):
+        # The blocks are replaced wholesale (by the endless field, a snapshot or rewinding), so none are left to build
+        self.__blocks = blocks
+        self.__level_blocks = None
+
+    def __build_blocks(self):
+        """Builds every block of the level that has not been built yet, and makes the list of blocks"""
+        self.__blocks = sorted(self.block_effects.build_all(), key=BLOCK_ID)
+
+    def num_blocks(self) -> int:
+        """The number of blocks in play, without building any"""
+        return len(self.block_effects) + self.block_effects.unbuilt()
+
+    def objects(self) -> list[GameObject]:
+        """Returns every object to render, for users that don't keep a scene (see scene_changes)"""
+        return [self.paddle] + [self.ball] + self.blocks + self.powerups
+
+    def scene_changes(
+        self, view: Tuple[float, float, float, float] = None
+    ) -> SceneChanges:
+        """Returns the objects to render that were created, changed or destroyed since the last call
 
-        return output_sounds, self.__game_objects_to_render()
+        view is the part of the game area that is drawn, as (x, y, width, height). Without one the whole game area is
+        drawn, so every block of a level is built. With one, only the blocks that come into view are (and any built
+        for other reasons, like the ball reaching them)
+        """
+        if self.__level_blocks != None:
+            if view == None:
+                if self.__blocks == None:
+                    self.__build_blocks()
+            else:
+                self.__reveal(*view)
+            new_blocks = self.__level_blocks.take_new()
+            if not self.__scene_reset:
+                for block in new_blocks:
+                    if self.block_effects.is_live(block):
+                        self.__scene_changed[block.block_id] = block
+
+        if self.__scene_reset:
+            self.__scene_reset = False
+            self.__scene_destroyed = []
+            self.__powerup_scene_ids = {}
+            changed = {PADDLE_SCENE_ID: self.paddle}
+            if self.ball != None:
+                changed[BALL_SCENE_ID] = self.ball
+            blocks = self.__blocks
+            if blocks == None:
+                blocks = self.block_effects.built()
+            for block in blocks:
+                changed[block.block_id] = block
+            for powerup in self.powerups:
+                changed[self.__new_powerup_scene_id(powerup)] = powerup
+            self.__scene_changed = {}
+            return SceneChanges(True, changed, [])
+
+        changes = SceneChanges(False, self.__scene_changed, self.__scene_destroyed)
+        self.__scene_changed = {}
+        self.__scene_destroyed = []
+        return changes
+
+    def __reveal(self, x: float, y: float, width: float, height: float):
+        """Builds the blocks of the squares of REVEAL_CELLS cells that overlap an area, unless they were built already"""
+        if y >= self.__blocks_bottom:
+            return
+        level = self.__level_blocks.level
+        col_width, row_height = self.__cell_size
+        size = REVEAL_CELLS
+        cols = range(
+            math.floor(x / col_width) // size,
+            min(math.floor((x + width) / col_width), level.num_cols - 1) // size + 1,
+        )
+        rows = range(
+            math.floor(y / row_height) // size,
+            min(math.floor((y + height) / row_height), level.num_rows - 1) // size + 1,
+        )
+        for i in cols:
+            for j in rows:
+                if (i, j) not in self.__revealed:
+                    self.__revealed.add((i, j))
+                    self.block_effects.blocks_in(
+                        range(i * size, (i + 1) * size), range(j * size, (j + 1) * size)
+                    )
+
+    def reset_scene(self):
+        """Makes the next scene_changes() start over with every object
+
+        Needed whenever the objects are replaced wholesale, like by load_snapshot
+        """
+        self.__scene_reset = True
+        self.__scene_changed = {}
+        self.__scene_destroyed = []
+
+    def __new_powerup_scene_id(self, powerup: Powerup) -> Tuple[str, int]:
+        """Gives a powerup a scene id"""
+        scene_id = ("powerup", self.__next_powerup_scene_id)
+        self.__next_powerup_scene_id += 1
+        self.__powerup_scene_ids[id(powerup)] = scene_id
+        return scene_id
+
+    def __scene_change(self, scene_id, obj: GameObject):
+        """Records that an object to render was created or changed"""
+        # Until the pending reset is taken, there is nothing to record: it will send everything anyway.
+        # This also keeps users that never call scene_changes() from building up changes
+        if not self.__scene_reset:
+            self.__scene_changed[scene_id] = obj
+
+    def __scene_destroy(self, scene_id):
+        """Records that an object to render is gone"""
+        if not self.__scene_reset:
+            self.__scene_changed.pop(scene_id, None)
+            self.__scene_destroyed.append(scene_id)
+
+    def __block_change(self, block: Block):
+        """Records that a block was created or changed, for the scene and the rewind buffer"""
+        self.__scene_change(block.block_id, block)
+        if self.rewind_buffer != None:
+            self.__rewind_changes[block.block_id] = block
+
+    def __block_destroy(self, block: Block):
+        """Records that a block is gone, for the scene and the rewind buffer"""
+        self.__scene_destroy(block.block_id)
+        if self.rewind_buffer != None:
+            self.__rewind_changes[block.block_id] = None
+
+    def __substeps(self, total_delta_t: float, time_scale: float) -> Tuple[int, float]:
+        """Decides how many physics substeps to run this frame, and how long each one is
+
+        Normally this is Constants.update_repetitions substeps. A frame spike instead gets extra substeps so that
+        no substep is longer than Constants.max_physics_delta_t (otherwise the ball can jump through blocks).
+        The number of substeps is capped, and whatever time does not fit is dropped and added to self.dropped_time
+
+        A time scale scales the number of substeps (and the cap), not their length, so the physics is as accurate
+        in fast-forward or slow motion as at normal speed
+        """
+        total_delta_t *= time_scale
+        repetitions = max(
+            math.ceil(Constants.update_repetitions * time_scale),
+            math.ceil(total_delta_t / Constants.max_physics_delta_t),
+        )
+        max_repetitions = math.ceil(
+            Constants.max_update_repetitions * max(1, time_scale)
+        )
+        if repetitions > max_repetitions:
+            repetitions = max_repetitions
+            simulated_time = repetitions * Constants.max_physics_delta_t
+            self.dropped_time += total_delta_t - simulated_time
+            total_delta_t = simulated_time
+
+        self.last_update_repetitions = repetitions
+        return repetitions, total_delta_t / repetitions
+
+    def rewind(self, frames: int) -> int:
+        """Goes back the given number of played frames, returning how many frames were actually rewound"""
+        self.reset_scene()
+        self.__rewind_changes = {}
+        frames = self.rewind_buffer.rewind(self, frames)
+        if self.__cell_size != None:
+            self.blocks.sort(key=BLOCK_ID)
+        return frames
 
     def game_over(self) -> bool:
         """Returns whether the game is over"""
@@ -80,8 +358,12 @@ class CoreGameState:
         return condition
 
     def game_win(self) -> bool:
-        """Returns whether the game has been won"""
-        condition = len(self.blocks) == 0
+        """Returns whether the game has been won. Endless mode can't be won, and blocks waiting to revive still count"""
+        condition = (
+            self.endless_field == None
+            and self.num_blocks() == 0
+            and len(self.block_effects.revives) == 0
+        )
         return condition
 
     def start_new_life(self) -> bool:
@@ -109,11 +391,10 @@ class CoreGameState:
             0,
             Constants.ball_radius,
         )
+        self.__scene_change(BALL_SCENE_ID, self.ball)
 
-    def __update_game_physics(
-        self, delta_t: float, keys: list[int], output_sounds: list[Sound]
-    ):
-        """Updates the game physics based on how much time has passed and what keys are pressed. Returns sounds."""
+    def __update_game_physics(self, delta_t: float, keys: list[int]):
+        """Updates the game physics based on how much time has passed and what keys are pressed"""
         if pygame.K_a in keys:
             impulse_sign = -1
         elif pygame.K_d in keys:
@@ -133,65 +414,39 @@ class CoreGameState:
             self.paddle.x = 0
 
         if self.ball != None:
-            self.__update_ball(self.ball, delta_t, output_sounds)
-
-        for powerup in self.powerups:
-            self.__update_powerup(powerup, delta_t, output_sounds)
+            self.__update_ball(self.ball, delta_t)
 
-    def __game_objects_to_render(self) -> list[GameObject]:
-        """Returns a list of objects for Graphics to render"""
-        return [self.paddle] + [self.ball] + self.blocks + self.powerups
+        if self.powerups:
+            self.__update_powerups(delta_t)
 
-    def __get_block_from_id(self, id: Tuple[int, int]) -> Block | None:
-        """Finds a block from its index (id) in the list of blocks
+    def __scroll_endless_field(self, delta_t: float):
+        """Moves the blocks of endless mode down, adds rows that come into view and retires rows that leave the play area
 
-        We cannot simply index into the list of blocks, because that list mutates as blocks are destroyed.
-        The block ID is the INTIAL index of the block, and doesn't change. Its actual index changes whenever any block is destroyed.
+        Retiring rows keeps the number of blocks (and so memory and collision cost) bounded however long the game runs.
+        Scrolling is done once per frame rather than per substep, because blocks move less than a unit each frame.
         """
-        for block in self.blocks:
-            if block.block_id == id:
-                return block
+        distance = delta_t * Constants.endless_scroll_speed
+        new_blocks = self.endless_field.scroll(distance)
 
-        return None
-
-    def __generate_blocks(self, num_cols, num_rows) -> list[Block]:
-        """Generates the blocks for a level"""
         blocks = []
-        gap = 2
-        for i in range(num_cols):
-            for j in range(num_rows):
-                blocks.append(
-                    Block(
-                        (Constants.game_width / num_cols) * i + gap,
-                        (Constants.game_height / (3 * num_rows)) * j + gap,
-                        (Constants.game_width / num_cols) - 2 * gap,
-                        (Constants.game_height / (3 * num_rows)) - 2 * gap,
-                        (i, j),
-                        BlockType.NORMAL,
-                        1,
-                        0,
-                        Colors.generate_random_block_color(),
-                    )
-                )
-
-        return blocks
-
-    def __set_special_blocks(self):
-        """Creates special blocks
-
-        For now the location of special blocks is either random (powerup blocks)
-        or hardcoded (protector blocks). Later, this will be stored in a LevelData class
-        and blocks will be generated from there
-        """
         for block in self.blocks:
-            block.block_type = BlockType.normal_or_powerup(
-                Constants.powerup_probability
-            )
-
-            if block.block_id[1] in [0, 2]:
-                block.health += 1
-            if block.block_id in [(4, 2)]:
-                block.block_type = BlockType.PROTECTOR
+            block.y += distance
+            if block.y < Constants.endless_retire_line:
+                blocks.append(block)
+                self.__scene_change(block.block_id, block)
+            else:
+                for changed in self.block_effects.remove(block):
+                    self.__block_change(changed)
+                self.__block_destroy(block)
+        # Blocks waiting to revive come back where they would have been
+        for _, _, block in self.block_effects.revives:
+            block.y += distance
+        for block in new_blocks:
+            for changed in self.block_effects.add(block):
+                self.__block_change(changed)
+
+        if new_blocks or len(blocks) != len(self.blocks):
+            self.blocks = blocks + new_blocks
 
     def __collision_check_ball_block(self, ball: Ball, block: Block) -> bool:
         """Checks for collision between a ball and a block. Also executes the effects of the collision.
@@ -271,93 +526,116 @@ class CoreGameState:
                 collision_occurred = True
         return collision_occurred  # This should flag the paddle sound to be played
 
-    def __collision_check_powerup_paddle(self, powerup: Powerup, paddle: Paddle):
-        """Executes collision effects when the paddle cllects a powerup
-
-        The return value is used to queue a sound to be played
-        """
-        if (
+    def __collision_check_powerup_paddle(
+        self, powerup: Powerup, paddle: Paddle
+    ) -> bool:
+        """Checks whether the paddle collects a powerup"""
+        return (
             paddle.y - powerup.hitbox_radius
             <= powerup.y
             <= paddle.y + paddle.height + powerup.hitbox_radius
             and paddle.x - powerup.hitbox_radius
             <= powerup.x
             <= paddle.x + paddle.width + powerup.hitbox_radius
-        ):
-            self.powerups.remove(powerup)
-            return True
+        )
 
-    def __update_block_from_collision(self, block: Block, output_sounds: list[Sound]):
+    def __update_block_from_collision(self, block: Block):
         """Updates the state of a block upon collision"""
         if block.protection == 0:
             block.health -= 1
 
         if block.health <= 0:
-            self.__break_block(block)
-            output_sounds.append(Sound.BLOCK)
-            self.__update_block_effects()
-
-    def __update_block_effects(self):
-        """Each time a block is destroyed, other blocks near it may be changed
-
-        Currently this deals with protector blocks, because when they are destroyed they stop protecting
-        the blocks below them
-        """
-        # Reset all block effects, and then reapply them if necessary
-        # This is slightly awkward, but is currently the quickest way to do this because the protector block
-        # which potentially got destroyed no longer exists. So there is no way to query its neighbors
-        # If more complex effects are added this method will have to change
-        for block in self.blocks:
-            block.protection = 0
-
-        for block in self.blocks:
-            if block.block_type == BlockType.PROTECTOR:
-                i, j = block.block_id
-                self.__get_block_from_id((i, j + 1)).protection += 1
-                self.__get_block_from_id((i - 1, j + 1)).protection += 1
-                self.__get_block_from_id((i + 1, j + 1)).protection += 1
-
-    def __break_block(self, block: Block):
-        """Breaks a block, removing it from the list of blocks
-
-        While this is a simple way to remove a block from the game, it causes issues, such as the __update_block_effects
-        method being needlessly complicated. It also precludes effects like reviving blocks. This method will probably be
-        changed to keep a block in the list but just "switch it off." As an added bonus, that will reduce the need for the
-        (extremely awkward) __get_block_by_id method
-        """
-        if block.block_type == BlockType.POWERUP:
-            self.__spawn_powerup(
-                block.x + block.width / 2,
-                block.y + block.height / 2,
-                block.height / 2,
-            )
-        self.blocks.remove(block)
+            self.block_effects.break_block(block)
+        elif block.protection == 0:
+            self.__write_block_event(EventType.BLOCK_DAMAGED, block)
+            self.__block_change(block)
+
+    def __write_event(
+        self,
+        event_type: EventType,
+        x: float,
+        y: float,
+        block_id: Tuple[int, int] = None,
+        powerup_type: PowerupType = None,
+    ):
+        """Writes an event, if events are recorded"""
+        if self.events != None:
+            self.events.write(event_type, x, y, block_id, powerup_type)
+
+    def __write_block_event(self, event_type: EventType, block: Block):
+        """Writes an event about a block, placed at its centre"""
+        self.__write_event(
+            event_type,
+            block.x + block.width / 2,
+            block.y + block.height / 2,
+            block.block_id,
+        )
 
-    def __update_ball(self, ball: Ball, delta_t: float, output_sounds: list[Sound]):
-        """Updates the ball data, depending on time step. Queues sounds to be played if necessary.
+    def __break_blocks(self):
+        """Breaks the blocks queued in block_effects, and any blocks their effects break in turn
 
-        Passing around a mutable output sound object is slightly awkward, but the simplest way to do this because
-        it persists over a single frame whereas update methods are called 50 times a frame
+        Broken blocks are removed from the list of blocks, powerup blocks spawn their powerups, and blocks changed by
+        the effects (losing protection, being healed, ...) are redrawn
         """
+        broken, changed = self.block_effects.process()
+        for block in changed:
+            self.__block_change(block)
+        for block in broken:
+            self.__write_block_event(EventType.BLOCK_BROKEN, block)
+            if block.block_type == BlockType.POWERUP:
+                self.__spawn_powerup(
+                    block.x + block.width / 2,
+                    block.y + block.height / 2,
+                    block.height / 2,
+                )
+            self.__block_destroy(block)
+        if self.__cell_size == None:
+            self.blocks = [
+                block for block in self.blocks if self.block_effects.is_live(block)
+            ]
+        elif self.__blocks != None:
+            # The blocks of a level are in order of id, so each broken one can be found without a scan
+            for block in broken:
+                del self.blocks[
+                    bisect.bisect_left(self.blocks, block.block_id, key=BLOCK_ID)
+                ]
+
+    def __revive_blocks(self, revived: list[Block]):
+        """Brings back blocks whose revive time came"""
+        for block in revived:
+            # In endless mode, the field may have scrolled the block's place away
+            if self.endless_field != None and block.y >= Constants.endless_retire_line:
+                continue
+            if self.__cell_size != None:
+                if self.__blocks != None:
+                    bisect.insort(self.blocks, block, key=BLOCK_ID)
+            else:
+                self.blocks.append(block)
+            for changed in self.block_effects.add(block):
+                self.__block_change(changed)
+            self.__write_block_event(EventType.BLOCK_REVIVED, block)
+
+    @traced("CoreGameState.__update_ball")
+    def __update_ball(self, ball: Ball, delta_t: float):
+        """Updates the ball data, depending on time step. Writes what happens to self.events"""
         ball.y_vel += Constants.gravity * delta_t
-        if ball.x_vel > 0.1:
-            ball.x_vel = 0.1
-        elif ball.x_vel < -0.1:
-            ball.x_vel = -0.1
+        if ball.x_vel > Constants.ball_x_vel_limit:
+            ball.x_vel = Constants.ball_x_vel_limit
+        elif ball.x_vel < -Constants.ball_x_vel_limit:
+            ball.x_vel = -Constants.ball_x_vel_limit
 
         if ball.y > Constants.game_height + ball.radius:
             self.lives -= 1
+            self.__write_event(EventType.LIFE_LOST, ball.x, ball.y)
             self.__new_life()
 
         else:
             ball.y += ball.y_vel * delta_t
             ball.x += ball.x_vel * delta_t
             if self.__collision_check_ball_paddle(ball, self.paddle):
-                output_sounds.append(Sound.HIT)
+                self.__write_event(EventType.PADDLE_HIT, ball.x, ball.y)
             self.__collision_check_ball_wall(ball)
-            for block in self.blocks:
-                if self.__collision_check_ball_block(ball, block):
-                    self.__update_block_from_collision(block, output_sounds)
+            self.__collision_check_ball_blocks(ball)
 
             if ball.modifier == BallModifier.PIERCING:
                 ball.modifier_active_for -= delta_t
@@ -365,25 +643,124 @@ class CoreGameState:
                     ball.modifier_active_for = 0
                     ball.modifier = None
 
+    @traced("collision checks")
+    def __collision_check_ball_blocks(self, ball: Ball):
+        """Checks the ball against the blocks it could be touching, executing the effects of any collisions
+
+        Broken blocks are only queued during the loop, and broken after it. Removing them from the list being
+        looped over would skip the block after each one
+        """
+        # The ball spends most of its time below the blocks of a level
+        if (
+            self.__blocks_bottom != None
+            and ball.y - ball.radius >= self.__blocks_bottom
+        ):
+            return
+
+        # The blocks in the cells the ball overlaps are the only ones it can collide with. They come in the same
+        # order as self.blocks, so collisions are handled in the same order as when checking every block
+        blocks = self.blocks_around(ball.x, ball.y, ball.radius)
+        for block in blocks:
+            if self.__collision_check_ball_block(ball, block):
+                self.__update_block_from_collision(block)
+
+        if self.block_effects.pending():
+            self.__break_blocks()
+
+    def cells_around(self, x: float, y: float, reach: float) -> Tuple[range, range]:
+        """The columns and rows of the cells of a level that are within reach (along each axis) of a point
+
+        Only levels have cells. Endless blocks move, so they don't stay in any
+        """
+        col_width, row_height = self.__cell_size
+        return (
+            range(
+                math.floor((x - reach) / col_width),
+                math.floor((x + reach) / col_width) + 1,
+            ),
+            range(
+                math.floor((y - reach) / row_height),
+                math.floor((y + reach) / row_height) + 1,
+            ),
+        )
+
+    def blocks_around(self, x: float, y: float, reach: float) -> list[Block]:
+        """The blocks in the cells within reach of a point, in the same order as self.blocks
+
+        For levels, the cost depends on the reach and not on the size of the level. Endless mode has no cells,
+        so every block is returned
+        """
+        if self.__cell_size == None:
+            return self.blocks
+        return self.block_effects.blocks_in(*self.cells_around(x, y, reach))
+
     def __spawn_powerup(self, x, y, hitbox_radius):
-        """Spawns a powerup"""
+        """Spawns a powerup, reusing one that was collected or fell off if there is one"""
         ptype = random.choices(list(PowerupType), Constants.powerup_type_probabilities)[
             0
         ]
-        self.powerups.append(Powerup(ptype, x, y, hitbox_radius))
+        if self.__powerup_pool:
+            powerup = self.__powerup_pool.pop()
+            powerup.powerup_type = ptype
+            powerup.x = x
+            powerup.y = y
+            powerup.hitbox_radius = hitbox_radius
+        else:
+            powerup = Powerup(ptype, x, y, hitbox_radius)
+        self.powerups.append(powerup)
+        if not self.__scene_reset:
+            self.__scene_change(self.__new_powerup_scene_id(powerup), powerup)
+        self.__write_event(EventType.POWERUP_SPAWNED, x, y, powerup_type=ptype)
 
-    def __update_powerup(
-        self, powerup: Powerup, delta_t: float, output_sounds: list[Sound]
-    ):
-        """Updates te location of a powerup. If it hits, executes the effect"""
+    def __update_powerups(self, delta_t: float):
+        """Updates every powerup, removing the ones that were collected or fell off the bottom
+
+        The list is compacted in place as it is walked, rather than removing from it while looping over it
+        """
+        kept = 0
+        for powerup in self.powerups:
+            if self.__update_powerup(powerup, delta_t):
+                self.__release_powerup(powerup)
+            else:
+                self.powerups[kept] = powerup
+                kept += 1
+        del self.powerups[kept:]
+
+    def __update_powerup(self, powerup: Powerup, delta_t: float) -> bool:
+        """Updates te location of a powerup. If it hits, executes the effect. Returns whether it is gone"""
         powerup.y += delta_t * Constants.powerup_fall_speed
         if self.__collision_check_powerup_paddle(powerup, self.paddle):
-            output_sounds.append(Sound.POWERUP)
+            self.__write_event(
+                EventType.POWERUP_COLLECTED,
+                powerup.x,
+                powerup.y,
+                powerup_type=powerup.powerup_type,
+            )
             if powerup.powerup_type == PowerupType.PIERCING:
-                self.ball.make_piercing(3000, 1)
+                # Between lives there is no ball to make piercing, and the powerup is wasted
+                if self.ball != None:
+                    self.ball.make_piercing(3000, 1)
             elif powerup.powerup_type == PowerupType.LIFE:
                 self.lives += 1
                 self.paddle.lives += 1
+            return True
+
+        # Past the bottom of the screen a powerup can't be collected any more
+        if powerup.y - powerup.hitbox_radius > Constants.game_height:
+            self.__write_event(
+                EventType.POWERUP_MISSED,
+                powerup.x,
+                powerup.y,
+                powerup_type=powerup.powerup_type,
+            )
+            return True
+        return False
+
+    def __release_powerup(self, powerup: Powerup):
+        """Takes a powerup out of the scene and keeps it to be reused by __spawn_powerup"""
+        if not self.__scene_reset:
+            self.__scene_destroy(self.__powerup_scene_ids.pop(id(powerup)))
+        self.__powerup_pool.append(powerup)
 
     def __new_life(self):
         """Removes the current ball from play, and does some data bookkeeping
@@ -395,4 +772,5 @@ class CoreGameState:
         """
         self.paddle.lives = self.lives
         self.ball = None
+        self.__scene_destroy(BALL_SCENE_ID)
         self.new_life = True
@@ -0,0 +1,311 @@
+"""Estimates how hard a level is, by playing many seeded headless games across all cores
+
+Each game is a CoreGameState played by a controller until it is won, lost, or runs out of time
+(Constants.difficulty_max_game_time). Game k is seeded with k, so a configuration always plays the same games.
+Results stream back from a process pool and are folded into running statistics as they arrive:
+    win rate            with a Wilson score confidence interval
+    clear time          mean time to win, over the games that were won, with a normal confidence interval
+    lives left          mean lives left at the end of won games
+Once at least --min-games games are in and the win rate interval is narrower than +/- --precision,
+the remaining games are cancelled.
+
+Controllers:
+    autopilot   the predicting autopilot (see autopilot.py), a strong player
+    follow      moves towards where the ball is now, which is enough to win almost every game
+    human       follows the ball too, but late and a little off the mark, and loses now and then (the default)
+
+Run from the src directory:
+    python difficulty.py                                    the default level
+    python difficulty.py levels/hard.txt --games 5000 --controller autopilot --powerup-probability 0.2
+"""
+
+import argparse
+from collections import deque
+from dataclasses import dataclass
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import pygame
+
+from autopilot import Autopilot
+from common import Constants, GameFsmState
+from core_game_state import CoreGameState
+from level import LevelData
+
+# z for a 95% confidence interval
+Z_95 = 1.96
+
+
+@dataclass
+class GameResult:
+    """How one game ended"""
+
+    seed: int
+    won: bool
+    lost: bool
+    time: float
+    lives: int
+
+
+class RunningStats:
+    """Mean and variance of a stream of numbers, updated one at a time (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0
+        self.__squares = 0
+
+    def add(self, value: float):
+        """Folds in one value"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.__squares += delta * (value - self.mean)
+
+    def variance(self) -> float:
+        """The sample variance, 0 until there are two values"""
+        return self.__squares / (self.count - 1) if self.count > 1 else 0
+
+    def interval(self, z: float = Z_95) -> float:
+        """Half the width of the confidence interval of the mean"""
+        if self.count < 2:
+            return math.inf
+        return z * math.sqrt(self.variance() / self.count)
+
+
+def wilson_interval(
+    successes: int, trials: int, z: float = Z_95
+) -> tuple[float, float]:
+    """The Wilson score confidence interval of a proportion, which behaves well near 0 and 1"""
+    if trials == 0:
+        return 0, 1
+    proportion = successes / trials
+    denominator = 1 + z * z / trials
+    centre = (proportion + z * z / (2 * trials)) / denominator
+    half_width = (
+        z
+        * math.sqrt(
+            proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)
+        )
+        / denominator
+    )
+    return max(0, centre - half_width), min(1, centre + half_width)
+
+
+def follow_ball(core_game_state: CoreGameState) -> list[int]:
+    """Keys that move the paddle towards where the ball is now"""
+    ball = core_game_state.ball
+    paddle_middle = core_game_state.paddle.x + core_game_state.paddle.width / 2
+    if ball == None or abs(ball.x - paddle_middle) < 10:
+        return []
+    return [pygame.K_a] if ball.x < paddle_middle else [pygame.K_d]
+
+
+def autopilot_controller(seed: int) -> callable:
+    """Keys chosen by an Autopilot"""
+    autopilot = Autopilot()
+    return lambda core_game_state: autopilot.keys(
+        core_game_state.paddle, core_game_state.ball, core_game_state.blocks
+    )
+
+
+def human_controller(seed: int) -> callable:
+    """Keys of a player who sees the ball Constants.difficulty_reaction_time late, and misjudges where it is by
+    about Constants.difficulty_aim_error each time it comes down, with a generator seeded by the game's seed
+    """
+    rng = random.Random(seed)
+    delay = max(
+        1, round(Constants.difficulty_reaction_time / Constants.difficulty_frame_time)
+    )
+    seen = deque([None] * delay, delay)
+    aim_error = 0
+    falling = False
+
+    def keys(core_game_state: CoreGameState) -> list[int]:
+        nonlocal aim_error, falling
+        ball = core_game_state.ball
+        seen.append(None if ball == None else ball.x)
+        if ball != None and (ball.y_vel > 0) != falling:
+            falling = ball.y_vel > 0
+            if falling:
+                aim_error = rng.gauss(0, Constants.difficulty_aim_error)
+
+        ball_x = seen[0]
+        paddle_middle = core_game_state.paddle.x + core_game_state.paddle.width / 2
+        if ball_x == None or abs(ball_x + aim_error - paddle_middle) < 10:
+            return []
+        return [pygame.K_a] if ball_x + aim_error < paddle_middle else [pygame.K_d]
+
+    return keys
+
+
+# Each controller is made afresh for every game, from the game's seed
+CONTROLLERS = {
+    "autopilot": autopilot_controller,
+    "follow": lambda seed: follow_ball,
+    "human": human_controller,
+}
+
+# Set in each worker process by initialize_worker
+worker_level = None
+worker_controller = None
+
+
+def initialize_worker(
+    level_path: str | None, controller: str, powerup_probability: float
+):
+    """Loads the level and applies the configuration in a worker process"""
+    global worker_level, worker_controller
+    worker_level = LevelData.load(level_path) if level_path else LevelData.default()
+    worker_controller = controller
+    Constants.powerup_probability = powerup_probability
+
+
+def play_game(seed: int) -> GameResult:
+    """Plays one game of the worker's level to the end, or until it runs out of time"""
+    random.seed(seed)
+    # Nobody rewinds these games or reads what happened in them, and they are never drawn (so scene_changes is
+    # never called, and CoreGameState keeps no scene changes either)
+    core_game_state = CoreGameState(
+        worker_level, record_rewind=False, record_events=False
+    )
+    core_game_state.ball.y_vel = Constants.init_y_vel_ball
+    controller = CONTROLLERS[worker_controller](seed)
+
+    elapsed = 0
+    while elapsed < Constants.difficulty_max_game_time:
+        core_game_state.update(
+            Constants.difficulty_frame_time,
+            controller(core_game_state),
+            GameFsmState.PLAY,
+        )
+        elapsed += Constants.difficulty_frame_time
+
+        if core_game_state.game_win() or core_game_state.game_over():
+            break
+        if core_game_state.start_new_life():
+            core_game_state.make_new_ball()
+            core_game_state.ball.y_vel = Constants.init_y_vel_ball
+
+    return GameResult(
+        seed,
+        core_game_state.game_win(),
+        core_game_state.game_over(),
+        elapsed,
+        core_game_state.lives,
+    )
+
+
+class DifficultyEstimate:
+    """Statistics over the games played so far"""
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.losses = 0
+        self.clear_time = RunningStats()
+        self.lives_left = RunningStats()
+
+    def add(self, result: GameResult):
+        """Folds in one game"""
+        self.games += 1
+        if result.won:
+            self.wins += 1
+            self.clear_time.add(result.time / 1000)
+            self.lives_left.add(result.lives)
+        elif result.lost:
+            self.losses += 1
+
+    def win_rate_interval(self) -> tuple[float, float]:
+        """The 95% confidence interval of the win rate"""
+        return wilson_interval(self.wins, self.games)
+
+    def summary(self) -> dict:
+        """The estimate, ready to print or write as JSON"""
+        low, high = self.win_rate_interval()
+        return {
+            "games": self.games,
+            "win rate": self.wins / max(1, self.games),
+            "win rate 95% interval": [low, high],
+            "loss rate": self.losses / max(1, self.games),
+            "timed out": self.games - self.wins - self.losses,
+            "mean clear time (s)": self.clear_time.mean,
+            "clear time 95% interval (s)": self.clear_time.interval(),
+            "mean lives left when won": self.lives_left.mean,
+        }
+
+
+def estimate(
+    level_path: str | None,
+    controller: str,
+    powerup_probability: float,
+    games: int,
+    min_games: int,
+    precision: float,
+    workers: int,
+) -> DifficultyEstimate:
+    """Plays up to the given number of games in a process pool, stopping early once the win rate is precise enough"""
+    result = DifficultyEstimate()
+    pool = multiprocessing.Pool(
+        workers,
+        initializer=initialize_worker,
+        initargs=(level_path, controller, powerup_probability),
+    )
+    try:
+        # Results are folded in in seed order. Taking them as they finish would favour short games when stopping early
+        for game in pool.imap(play_game, range(games), chunksize=4):
+            result.add(game)
+            low, high = result.win_rate_interval()
+            if result.games >= min_games and (high - low) / 2 <= precision:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("level", nargs="?", help="level file, text or compiled")
+    parser.add_argument("--controller", choices=CONTROLLERS.keys(), default="human")
+    parser.add_argument(
+        "--powerup-probability", type=float, default=Constants.powerup_probability
+    )
+    parser.add_argument("--games", type=int, default=2000)
+    parser.add_argument("--min-games", type=int, default=100)
+    parser.add_argument(
+        "--precision",
+        type=float,
+        default=0.02,
+        help="stop once the win rate is known to within this, either way",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    result = estimate(
+        args.level,
+        args.controller,
+        args.powerup_probability,
+        args.games,
+        args.min_games,
+        args.precision,
+        args.workers,
+    )
+    summary = result.summary()
+    summary["wall time (s)"] = time.perf_counter() - start
+
+    for key, value in summary.items():
+        print("{:<30} {}".format(key, value))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Provides a reset/step environment around CoreGameState, for training agents to control the paddle
+
+The API follows Gym: reset() returns an observation, and step(action) returns the observation, the reward,
+whether the episode terminated (the game was lost or won), whether it was truncated (it ran for
+Constants.env_max_frames steps) and a dict of extra information. Each step is one frame of Constants.env_frame_time
+milliseconds. There is no launching: when a ball is lost, the next one is launched straight away.
+
+Actions are the keys the player could hold during the frame:
+    0   nothing
+    1   A (impulse to the left)
+    2   D (impulse to the right)
+
+An observation is a fixed-size array of floats, in game units:
+    paddle      x, x velocity, lives
+    ball        whether there is one, x, y, x velocity, y velocity, whether it is piercing
+    blocks      one entry per cell of the level, 1 if the block in it is alive and 0 otherwise, indexed by
+                i * num_rows + j for the block in column i and row j
+    powerups    Constants.env_max_powerups slots of (type, x, y), lowest first. The type is 0 for an empty slot,
+                otherwise 1 + the index of the PowerupType
+Endless mode has no fixed set of cells, so it is not offered.
+
+VectorEnvironment runs many environments in worker processes. Observations, actions, rewards and done flags live
+in multiprocessing.shared_memory, so a step only sends a few bytes through each worker's pipe, whatever the
+size of the observations.
+"""
+
+from array import array
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import random
+from typing import Sequence, Tuple
+
+import pygame
+
+from common import BallModifier, Constants, GameFsmState, PowerupType
+from core_game_state import CoreGameState
+from level import LevelData
+
+ACTION_KEYS = [[], [pygame.K_a], [pygame.K_d]]
+POWERUP_TYPES = list(PowerupType)
+
+PADDLE_SIZE = 3
+BALL_SIZE = 6
+POWERUP_SIZE = 3
+
+
+def observation_size(level: LevelData) -> int:
+    """Returns the number of floats in an observation of the given level"""
+    return (
+        PADDLE_SIZE
+        + BALL_SIZE
+        + level.num_cols * level.num_rows
+        + POWERUP_SIZE * Constants.env_max_powerups
+    )
+
+
+class BreakoutEnvironment:
+    """A single game, stepped one frame at a time"""
+
+    def __init__(self, level: LevelData = None):
+        self.level = level if level != None else LevelData.default()
+        self.observation_size = observation_size(self.level)
+        self.num_actions = len(ACTION_KEYS)
+        self.core_game_state = None
+        self.frames = 0
+        self.__observation = array("d", bytes(8 * self.observation_size))
+
+    def reset(self, seed: int = None) -> array:
+        """Starts a new episode and returns its first observation
+
+        Seeding seeds the random module, which is where all the game's randomness comes from
+        """
+        if seed != None:
+            random.seed(seed)
+        self.core_game_state = CoreGameState(self.level, record_rewind=False)
+        self.core_game_state.ball.y_vel = Constants.init_y_vel_ball
+        self.frames = 0
+        self.observe(self.__observation)
+        return self.__observation
+
+    def step(self, action: int) -> Tuple[array, float, bool, bool, dict]:
+        """Simulates one frame with the given action held
+
+        Returns the observation, the reward, whether the episode terminated, whether it was truncated, and info.
+        The returned observation is reused by the next call, so copy it to keep it
+        """
+        core_game_state = self.core_game_state
+        blocks_before = core_game_state.num_blocks()
+        lives_before = core_game_state.lives
+
+        core_game_state.update(
+            Constants.env_frame_time, ACTION_KEYS[action], GameFsmState.PLAY
+        )
+        self.frames += 1
+
+        if core_game_state.start_new_life() and not core_game_state.game_over():
+            core_game_state.make_new_ball()
+            core_game_state.ball.y_vel = Constants.init_y_vel_ball
+
+        reward = (blocks_before - core_game_state.num_blocks()) + (
+            Constants.env_life_reward * (core_game_state.lives - lives_before)
+        )
+        terminated = core_game_state.game_over() or core_game_state.game_win()
+        truncated = not terminated and self.frames >= Constants.env_max_frames
+
+        self.observe(self.__observation)
+        return (
+            self.__observation,
+            reward,
+            terminated,
+            truncated,
+            {"frames": self.frames, "blocks": core_game_state.num_blocks()},
+        )
+
+    def observe(self, out, offset: int = 0):
+        """Writes the current observation into out (any writable buffer of floats) starting at offset"""
+        core_game_state = self.core_game_state
+        paddle = core_game_state.paddle
+        ball = core_game_state.ball
+
+        out[offset] = paddle.x
+        out[offset + 1] = paddle.x_vel
+        out[offset + 2] = core_game_state.lives
+        offset += PADDLE_SIZE
+
+        if ball != None:
+            out[offset] = 1
+            out[offset + 1] = ball.x
+            out[offset + 2] = ball.y
+            out[offset + 3] = ball.x_vel
+            out[offset + 4] = ball.y_vel
+            out[offset + 5] = ball.modifier == BallModifier.PIERCING
+        else:
+            for index in range(BALL_SIZE):
+                out[offset + index] = 0
+        offset += BALL_SIZE
+
+        num_rows = self.level.num_rows
+        num_cells = self.level.num_cols * num_rows
+        for index in range(num_cells):
+            out[offset + index] = 0
+        for block in core_game_state.blocks:
+            i, j = block.block_id
+            out[offset + i * num_rows + j] = 1
+        offset += num_cells
+
+        powerups = sorted(core_game_state.powerups, key=lambda powerup: -powerup.y)
+        for slot in range(Constants.env_max_powerups):
+            if slot < len(powerups):
+                powerup = powerups[slot]
+                out[offset] = 1 + POWERUP_TYPES.index(powerup.powerup_type)
+                out[offset + 1] = powerup.x
+                out[offset + 2] = powerup.y
+            else:
+                out[offset] = out[offset + 1] = out[offset + 2] = 0
+            offset += POWERUP_SIZE
+
+
+class VectorEnvironment:
+    """Runs num_envs environments across worker processes, exchanging data through shared memory
+
+    After step(), observations holds the observations of all environments one after another (environment k
+    starts at k * observation_size), and rewards, terminated and truncated hold one entry per environment.
+    They are memoryviews over the shared memory, so they can be wrapped without copying, e.g. with
+    numpy.frombuffer(vector_environment.observations). An environment whose episode ended is reset
+    straight away, so its observation is the first one of its next episode.
+
+    Call close() (or use it as a context manager) to stop the workers and free the shared memory.
+    """
+
+    def __init__(self, num_envs: int, num_workers: int = None, level: LevelData = None):
+        level = level if level != None else LevelData.default()
+        if num_workers == None:
+            num_workers = os.cpu_count() or 1
+        num_workers = max(1, min(num_workers, num_envs))
+
+        self.num_envs = num_envs
+        self.observation_size = observation_size(level)
+        self.num_actions = len(ACTION_KEYS)
+
+        self.__memory = {
+            "observations": shared_memory.SharedMemory(
+                create=True, size=8 * num_envs * self.observation_size
+            ),
+            "rewards": shared_memory.SharedMemory(create=True, size=8 * num_envs),
+            "actions": shared_memory.SharedMemory(create=True, size=num_envs),
+            "terminated": shared_memory.SharedMemory(create=True, size=num_envs),
+            "truncated": shared_memory.SharedMemory(create=True, size=num_envs),
+        }
+        self.observations = self.__memory["observations"].buf.cast("d")
+        self.rewards = self.__memory["rewards"].buf.cast("d")
+        self.__actions = self.__memory["actions"].buf
+        self.terminated = self.__memory["terminated"].buf.cast("?")
+        self.truncated = self.__memory["truncated"].buf.cast("?")
+
+        # Environments are split between the workers as evenly as possible. Workers get the compiled form of the
+        # level, since a level loaded from a compiled file is memory-mapped and can't be pickled
+        compiled = level.compile()
+        names = {key: memory.name for key, memory in self.__memory.items()}
+        self.__workers = []
+        self.__connections = []
+        for worker in range(num_workers):
+            first = worker * num_envs // num_workers
+            last = (worker + 1) * num_envs // num_workers
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(worker_connection, names, range(first, last), compiled),
+                daemon=True,
+            )
+            process.start()
+            self.__workers.append(process)
+            self.__connections.append(connection)
+
+    def __enter__(self) -> "VectorEnvironment":
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def observation(self, index: int) -> memoryview:
+        """Returns the observation of one environment"""
+        start = index * self.observation_size
+        return self.observations[start : start + self.observation_size]
+
+    def reset(self, seed: int = None) -> memoryview:
+        """Resets every environment (environment k with seed + k, if a seed is given) and returns the observations"""
+        self.__broadcast(("reset", seed))
+        return self.observations
+
+    def step(
+        self, actions: Sequence[int]
+    ) -> Tuple[memoryview, memoryview, memoryview, memoryview]:
+        """Steps every environment with its action. Returns observations, rewards, terminated and truncated"""
+        self.__actions[: self.num_envs] = bytes(actions)
+        self.__broadcast(("step", None))
+        return self.observations, self.rewards, self.terminated, self.truncated
+
+    def close(self):
+        """Stops the workers and frees the shared memory"""
+        if not self.__workers:
+            return
+        self.__broadcast(("close", None))
+        for process in self.__workers:
+            process.join()
+        self.__workers = []
+
+        for view in [
+            self.observations,
+            self.rewards,
+            self.__actions,
+            self.terminated,
+            self.truncated,
+        ]:
+            view.release()
+        for memory in self.__memory.values():
+            memory.close()
+            memory.unlink()
+
+    def __broadcast(self, command: Tuple[str, int | None]):
+        """Sends a command to every worker, then waits until all of them have carried it out"""
+        for connection in self.__connections:
+            connection.send(command)
+        for connection in self.__connections:
+            connection.recv()
+
+
+def run_worker(connection, names: dict[str, str], indices: range, compiled: bytes):
+    """The loop of a VectorEnvironment worker, which steps the environments with the given indices of the level
+    in the given compiled form
+    """
+    level = LevelData.from_compiled(compiled)
+    memory = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    observations = memory["observations"].buf.cast("d")
+    rewards = memory["rewards"].buf.cast("d")
+    actions = memory["actions"].buf
+    terminated = memory["terminated"].buf.cast("?")
+    truncated = memory["truncated"].buf.cast("?")
+
+    environments = [BreakoutEnvironment(level) for _ in indices]
+    size = observation_size(level)
+
+    while True:
+        command, seed = connection.recv()
+        if command == "close":
+            break
+
+        for environment, index in zip(environments, indices):
+            if command == "reset":
+                environment.reset(None if seed == None else seed + index)
+                rewards[index] = 0
+                terminated[index] = truncated[index] = False
+            else:
+                _, reward, done, cut_off, _ = environment.step(actions[index])
+                rewards[index] = reward
+                terminated[index] = done
+                truncated[index] = cut_off
+                if done or cut_off:
+                    environment.reset()
+            environment.observe(observations, index * size)
+
+        connection.send(True)
+
+    for view in [observations, rewards, actions, terminated, truncated]:
+        view.release()
+    for shared in memory.values():
+        shared.close()
+    connection.send(True)
@@ -0,0 +1,135 @@
+"""Provides the stream of things that happen during play, like blocks breaking or lives being lost
+
+CoreGameState writes a GameEvent into its EventStream whenever something happens, and anything interested
+(sounds, statistics, replays, networking) reads them back with its own EventReader, at its own pace. This way
+consumers can react to just what changed, instead of comparing whole lists of objects every frame.
+
+The stream is a ring buffer of preallocated arrays, so writing an event does not allocate. It holds the last
+capacity events; a reader that falls further behind than that skips the events it missed, and counts them.
+"""
+
+from array import array
+from dataclasses import dataclass
+from enum import Enum
+from typing import Iterator, Tuple
+
+from common import PowerupType
+
+
+class EventType(Enum):
+    """The kinds of things that can happen during play"""
+
+    PADDLE_HIT = "paddle hit"
+    BLOCK_DAMAGED = "block damaged"
+    BLOCK_BROKEN = "block broken"
+    BLOCK_REVIVED = "block revived"
+    POWERUP_SPAWNED = "powerup spawned"
+    POWERUP_COLLECTED = "powerup collected"
+    POWERUP_MISSED = "powerup missed"
+    LIFE_LOST = "life lost"
+
+
+EVENT_TYPES = list(EventType)
+POWERUP_TYPES = list(PowerupType)
+
+
+@dataclass(frozen=True, slots=True)
+class GameEvent:
+    """One thing that happened, and where
+
+    block_id is set for block events and powerup_type for powerup events
+    """
+
+    event_type: EventType
+    x: float
+    y: float
+    block_id: Tuple[int, int] | None = None
+    powerup_type: PowerupType | None = None
+
+
+class EventStream:
+    """A ring buffer of events (type, position, block id, powerup type), preallocated so that writing does not allocate"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.__types = array("B", bytes(capacity))
+        self.__xs = array("d", bytes(8 * capacity))
+        self.__ys = array("d", bytes(8 * capacity))
+        self.__block_is = array("i", bytes(4 * capacity))
+        self.__block_js = array("i", bytes(4 * capacity))
+        # The index in POWERUP_TYPES plus one, or 0 for no powerup
+        self.__powerup_types = array("B", bytes(capacity))
+        # How many events have ever been written. Readers keep their place as a count like this
+        self.written = 0
+
+    def write(
+        self,
+        event_type: EventType,
+        x: float,
+        y: float,
+        block_id: Tuple[int, int] = None,
+        powerup_type: PowerupType = None,
+    ):
+        """Records an event"""
+        index = self.written % self.capacity
+        self.__types[index] = EVENT_TYPES.index(event_type)
+        self.__xs[index] = x
+        self.__ys[index] = y
+        if block_id != None:
+            self.__block_is[index], self.__block_js[index] = block_id
+        self.__powerup_types[index] = (
+            0 if powerup_type == None else POWERUP_TYPES.index(powerup_type) + 1
+        )
+        self.written += 1
+
+    def event(self, position: int) -> GameEvent:
+        """Builds the event written at the given position (a count of events written before it)"""
+        index = position % self.capacity
+        event_type = EVENT_TYPES[self.__types[index]]
+        powerup_type = self.__powerup_types[index]
+        return GameEvent(
+            event_type,
+            self.__xs[index],
+            self.__ys[index],
+            (
+                (self.__block_is[index], self.__block_js[index])
+                if event_type
+                in (
+                    EventType.BLOCK_DAMAGED,
+                    EventType.BLOCK_BROKEN,
+                    EventType.BLOCK_REVIVED,
+                )
+                else None
+            ),
+            POWERUP_TYPES[powerup_type - 1] if powerup_type else None,
+        )
+
+    def reader(self) -> "EventReader":
+        """A reader that starts with the next event written"""
+        return EventReader(self)
+
+
+class EventReader:
+    """One consumer's place in an EventStream"""
+
+    def __init__(self, stream: EventStream):
+        self.stream = stream
+        self.position = stream.written
+        # Events that were overwritten before this reader got to them
+        self.missed = 0
+
+    def pending(self) -> int:
+        """How many events are waiting to be read"""
+        return self.stream.written - self.position
+
+    def read(self) -> Iterator[GameEvent]:
+        """Yields the events written since the last read, oldest first"""
+        stream = self.stream
+        oldest = stream.written - stream.capacity
+        if self.position < oldest:
+            self.missed += oldest - self.position
+            self.position = oldest
+        while self.position < stream.written:
+            event = stream.event(self.position)
+            self.position += 1
+            yield event
@@ -3,26 +3,63 @@
 from enum import Enum
 from typing import Tuple
 import copy
+import random
 import pygame
 
-from common import GameFsmState, Constants
+from common import Block, GameFsmState, Constants
 from settings import SettingsState
-from audio import AudioInstructions, Music, Sound
-from graphics import GraphicsInstructions
+from audio import AudioInstructions, Music, Sound, event_sounds
+from graphics import Camera, GraphicsInstructions, Message
 from inputs import KeyboardState
 from core_game_state import CoreGameState
+from level import CellType, LevelData
 from screen_content import screen_content
+from snapshot import save_snapshot, load_snapshot
+from tracing import traced
+from allocation import freeze_long_lived_objects
+from autopilot import Autopilot
 
 
 class GameState:
     """Holds all state data for the program"""
 
-    def __init__(self):
+    # States in which nothing changes on screen until the user presses a key
+    idle_fsm_states = [
+        GameFsmState.MENU,
+        GameFsmState.INSTRUCTIONS,
+        GameFsmState.SETTINGS,
+        GameFsmState.PAUSE,
+        GameFsmState.GAME_OVER,
+        GameFsmState.GAME_WIN,
+    ]
+
+    def __init__(self, level: LevelData = None):
         self.game_fsm_state = GameFsmState.MENU
         self.game_exit = False
         self.settings = copy.deepcopy(Constants.default_settings)
         self.settings_state = None
+        self.core_game_state = None
+        # Where GameState is up to in the events of core_game_state, which it turns into sounds
+        self.event_reader = None
 
+        # The level classic games are played on (the default level if None)
+        self.level = level
+        # Whether the game started from the menu is in endless mode or on a huge board. Restarting keeps the same mode
+        self.endless = False
+        self.huge_board = False
+        # How far the camera zooms in on a huge board, one of Constants.camera_zooms changed with Z
+        self.camera_zoom = Constants.default_camera_zoom
+
+        # A snapshot of the game, made by pressing F5 in the pause screen and restored by pressing F9
+        self.quicksave = None
+
+        # Pressing O while playing hands the paddle over to the autopilot, and pressing it again takes it back
+        self.autopilot = None
+
+        # How many times faster than real time the game plays, changed with [ and ] while playing or paused
+        self.time_scale = 1
+
+    @traced("GameState.update")
     def update(
         self, total_delta_t: float, keyboard_state: KeyboardState
     ) -> Tuple[AudioInstructions, GraphicsInstructions]:
@@ -46,20 +83,59 @@ class GameState:
             )
             self.__on_transition(next_fsm_state)
 
-        objects = []
+        if self.game_fsm_state in [GameFsmState.PLAY, GameFsmState.PAUSE]:
+            self.__step_time_scale(keyboard_state)
+            if self.huge_board and pygame.K_z in keyboard_state.new_keys_pressed:
+                zooms = Constants.camera_zooms
+                self.camera_zoom = zooms[
+                    (zooms.index(self.camera_zoom) + 1) % len(zooms)
+                ]
+        if self.game_fsm_state == GameFsmState.PAUSE:
+            self.__quicksave_or_quickload(keyboard_state)
+        elif (
+            self.game_fsm_state == GameFsmState.PLAY
+            and pygame.K_o in keyboard_state.new_keys_pressed
+        ):
+            self.autopilot = Autopilot() if self.autopilot == None else None
+
+        scene_changes = None
+        events = []
         ui_elements = []
+        camera = None
 
         # If the game is being played (i.e. not in a menu screen type of state)
-        # Update the game physics and get the objects to render and sounds to play from that
+        # Update the game physics and get the changes to render and sounds to play from that
         if self.game_fsm_state in [
             GameFsmState.PLAY,
             GameFsmState.PAUSE,
             GameFsmState.PRE_PLAY,
         ]:
-            sounds, objects = self.core_game_state.update(
-                total_delta_t, keys, self.game_fsm_state
+            if self.autopilot != None:
+                keys = self.autopilot.keys(
+                    self.core_game_state.paddle,
+                    self.core_game_state.ball,
+                    self.__autopilot_blocks(),
+                )
+            self.core_game_state.update(
+                total_delta_t, keys, self.game_fsm_state, self.time_scale
+            )
+            # Only the blocks the camera shows need to be built for drawing
+            if self.huge_board:
+                camera = self.__follow_ball()
+            scene_changes = self.core_game_state.scene_changes(
+                camera.area() if camera != None else None
             )
-            collision_sounds = AudioInstructions(sounds, None)
+            events = list(self.event_reader.read())
+            collision_sounds = AudioInstructions(event_sounds(events), None)
+            if self.time_scale != 1:
+                ui_elements.append(
+                    Message(
+                        "{:g}x".format(self.time_scale),
+                        15,
+                        0.95 * Constants.game_width,
+                        0.03 * Constants.game_height,
+                    )
+                )
 
         # deals with the settings menu state
         elif self.game_fsm_state == GameFsmState.SETTINGS:
@@ -80,8 +156,16 @@ class GameState:
             else screen_content(GameFsmState.SETTINGS, self.settings_state)
         )
         screen_graphics = GraphicsInstructions(
-            objects,
+            [],
             screen_ui,
+            scene_changes=scene_changes,
+            events=events,
+            effect_time=(
+                total_delta_t * self.time_scale
+                if self.game_fsm_state == GameFsmState.PLAY
+                else 0
+            ),
+            camera=camera,
         )
         ui_graphics = GraphicsInstructions([], ui_elements)
 
@@ -91,9 +175,102 @@ class GameState:
 
         return audio_instructions, graphics_instructions
 
+    def set_time_scale(self, time_scale: float):
+        """Sets how many times faster than real time the game plays, within the range of Constants.time_scales
+
+        Below 1 the game plays in slow motion. See CoreGameState.update for how the physics keeps up
+        """
+        self.time_scale = min(
+            max(time_scale, Constants.time_scales[0]), Constants.time_scales[-1]
+        )
+
+    def is_idle(self) -> bool:
+        """Returns whether the current screen is static, so the main loop can wait for input instead of ticking"""
+        return self.game_fsm_state in GameState.idle_fsm_states
+
     def __initialize_game(self):
         """Called when a game first starts, building a CoreGameState object"""
-        self.core_game_state = CoreGameState()
+        if self.huge_board:
+            # Rewind keyframes hold every block, which on a board this size is some 10 MB for the whole buffer, and
+            # restoring one takes over 100 ms, so huge boards are not recorded
+            self.core_game_state = CoreGameState(
+                level=LevelData.uniform(
+                    Constants.huge_board_cols,
+                    Constants.huge_board_rows,
+                    cell_type=CellType.NORMAL,
+                ),
+                record_rewind=False,
+            )
+        else:
+            self.core_game_state = CoreGameState(
+                level=self.level,
+                endless_seed=random.randrange(2**32) if self.endless else None,
+            )
+        self.event_reader = self.core_game_state.events.reader()
+        if Constants.freeze_gc_after_level_load:
+            freeze_long_lived_objects()
+
+    def __quicksave_or_quickload(self, keyboard_state: KeyboardState):
+        """Saves, restores or rewinds the game, if asked to in the pause screen"""
+        if pygame.K_F5 in keyboard_state.new_keys_pressed:
+            self.quicksave = save_snapshot(self.core_game_state)
+        elif pygame.K_F9 in keyboard_state.new_keys_pressed and self.quicksave != None:
+            load_snapshot(self.core_game_state, self.quicksave)
+            self.core_game_state.reset_scene()
+            # The recorded frames belong to the game that was just replaced
+            if self.core_game_state.rewind_buffer != None:
+                self.core_game_state.rewind_buffer.clear()
+        elif (
+            pygame.K_LEFT in keyboard_state.new_keys_pressed
+            and self.core_game_state.rewind_buffer != None
+        ):
+            self.core_game_state.rewind(Constants.rewind_scrub_frames)
+
+    def __follow_ball(self) -> Camera:
+        """The camera for a huge board, which follows the ball, or the paddle while there is no ball"""
+        core_game_state = self.core_game_state
+        if core_game_state.ball != None:
+            return Camera.following(
+                core_game_state.ball.x, core_game_state.ball.y, self.camera_zoom
+            )
+        paddle = core_game_state.paddle
+        return Camera.following(paddle.x + paddle.width / 2, paddle.y, self.camera_zoom)
+
+    def __autopilot_blocks(self) -> list[Block]:
+        """The blocks the autopilot predicts bounces off: all of them, or those near the ball on a huge board"""
+        core_game_state = self.core_game_state
+        if not self.huge_board or core_game_state.ball == None:
+            return core_game_state.blocks
+        ball = core_game_state.ball
+        return core_game_state.blocks_around(
+            ball.x, ball.y, Constants.huge_board_autopilot_reach
+        )
+
+    def __choose_mode(self, endless: bool, huge_board: bool):
+        """Sets the mode of the games started from the menu
+
+        A quicksave made in another mode is dropped. Huge boards and normal ones have different grids, and the
+        collision checks of a game rely on its blocks being in the cells of its own grid
+        """
+        if (endless, huge_board) != (self.endless, self.huge_board):
+            self.quicksave = None
+        self.endless = endless
+        self.huge_board = huge_board
+
+    def __step_time_scale(self, keyboard_state: KeyboardState):
+        """Steps through Constants.time_scales, slower with [ and faster with ]"""
+        if pygame.K_RIGHTBRACKET in keyboard_state.new_keys_pressed:
+            faster = [
+                scale for scale in Constants.time_scales if scale > self.time_scale
+            ]
+            if faster:
+                self.set_time_scale(faster[0])
+        elif pygame.K_LEFTBRACKET in keyboard_state.new_keys_pressed:
+            slower = [
+                scale for scale in Constants.time_scales if scale < self.time_scale
+            ]
+            if slower:
+                self.set_time_scale(slower[-1])
 
     def __next_fsm_state(self, keyboard_state: KeyboardState) -> GameFsmState | None:
         """Checks whether we need to do a screen transition. If yes, it returns the next GameFsmState"""
@@ -101,6 +278,13 @@ class GameState:
 
         if self.game_fsm_state == GameFsmState.MENU:
             if pygame.K_p in keyboard_state.new_keys_pressed:
+                self.__choose_mode(endless=False, huge_board=False)
+                return GameFsmState.PRE_PLAY
+            elif pygame.K_e in keyboard_state.new_keys_pressed:
+                self.__choose_mode(endless=True, huge_board=False)
+                return GameFsmState.PRE_PLAY
+            elif pygame.K_h in keyboard_state.new_keys_pressed:
+                self.__choose_mode(endless=False, huge_board=True)
                 return GameFsmState.PRE_PLAY
             elif pygame.K_q in keys:
                 return GameFsmState.QUIT
@@ -1,12 +1,13 @@
 """Provides classes that deal with rendering objects and UI elements to the screen"""
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import pygame
 import copy
 import math
 from typing import Tuple
 
 from settings import SettingsSelector
+from performance import PerformanceOverlay
 from common import (
     Color,
     Colors,
@@ -19,10 +20,16 @@ from common import (
     BlockType,
     PowerupType,
     GraphicsSettings,
+    SceneChanges,
+    SceneId,
 )
+from events import EventType, GameEvent
+from particles import ParticleSystem, PARTICLES_AVAILABLE
+from tiles import BlockTiles
+from tracing import traced
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Message:
     """Stores the data for a message to be rendered onto the screen"""
 
@@ -35,7 +42,39 @@ class Message:
 
 
 # Union type for things that are rendered as UI elements by Graphics
-UIElement = SettingsSelector | Message
+UIElement = SettingsSelector | Message | PerformanceOverlay
+
+
+@dataclass(frozen=True, slots=True)
+class Camera:
+    """The part of the game area to draw, for boards with more detail than fits on screen (huge-board mode)
+
+    The camera shows 1/zoom of the width and height of the game area, with its top left corner at (x, y)
+    """
+
+    x: float
+    y: float
+    zoom: float
+
+    @classmethod
+    def following(cls, x: float, y: float, zoom: float) -> "Camera":
+        """A camera centred on (x, y), moved as little as needed to show only the game area"""
+        width = Constants.game_width / zoom
+        height = Constants.game_height / zoom
+        return cls(
+            min(max(x - width / 2, 0), Constants.game_width - width),
+            min(max(y - height / 2, 0), Constants.game_height - height),
+            zoom,
+        )
+
+    def area(self) -> Tuple[float, float, float, float]:
+        """The part of the game area the camera shows, as (x, y, width, height)"""
+        return (
+            self.x,
+            self.y,
+            Constants.game_width / self.zoom,
+            Constants.game_height / self.zoom,
+        )
 
 
 @dataclass
@@ -45,13 +84,20 @@ class GraphicsInstructions:
     objects: list[GameObject]
     ui_elements: list[UIElement]
     graphics_settings_change: None | GraphicsSettings = None
+    # Changes to the scene Graphics keeps, see Graphics.render. Objects in the scene are drawn before objects
+    scene_changes: None | SceneChanges = None
+    # What happened in the game this frame, for visual effects, and how much game time the effects move on by
+    events: list[GameEvent] = field(default_factory=list)
+    effect_time: float = 0
+    # What part of the game area to draw. Without a camera, the whole game area is drawn
+    camera: None | Camera = None
 
     def __add__(self, other: "GraphicsInstructions"):
         """Merges two GraphicsInstructions objects together, allowing different sources to return their own instructions
         on what to draw, which can be merged by a parent class, instead of mutating a single object passed around between
         the sources.
 
-        If both have new settings, the ones in the caller (i.e. a in a+b) are preserved
+        If both have new settings (or scene changes, or cameras), the ones in the caller (i.e. a in a+b) are preserved
 
         (This method should probably be changed to .merge(), like in audio instructions)
         """
@@ -60,10 +106,17 @@ class GraphicsInstructions:
             if self.graphics_settings_change != None
             else other.graphics_settings_change
         )
+        scene_changes = (
+            self.scene_changes if self.scene_changes != None else other.scene_changes
+        )
         return GraphicsInstructions(
             self.objects + other.objects,
             self.ui_elements + other.ui_elements,
             new_settings,
+            scene_changes,
+            self.events + other.events,
+            max(self.effect_time, other.effect_time),
+            self.camera if self.camera != None else other.camera,
         )
 
 
@@ -81,17 +134,48 @@ class Graphics:
         self.__paddle_color = Colors.white
         self.__ball_color = Colors.white
         self.graphics_settings = copy.deepcopy(graphics_settings)
+
+        # Rendering text is slow, and most text is the same every frame, so fonts and rendered text are cached
+        self.__fonts = {}
+        self.__text_surfaces = {}
         self.__set_game_screen()
 
+        # The objects of the game being played, by scene id, kept between frames and updated with SceneChanges
+        self.__scene = {}
+        # While there is a camera, the blocks of the scene are drawn from tiles, and the other objects of the scene
+        # are kept apart so that drawing them does not go through the blocks
+        self.__tiles = None
+        self.__sprites = None
+        self.__particles = (
+            ParticleSystem(Constants.particle_capacity) if PARTICLES_AVAILABLE else None
+        )
+
+    def scene_objects(self) -> list[GameObject]:
+        """Returns the objects in the scene, as drawn by the last render"""
+        return list(self.__scene.values())
+
+    def scene_object(self, scene_id: SceneId) -> GameObject | None:
+        """Returns the object in the scene with a scene id, or None if there is none"""
+        return self.__scene.get(scene_id)
+
+    def scene_size(self) -> int:
+        """Returns the number of objects in the scene"""
+        return len(self.__scene)
+
+    def tiles_drawn(self) -> int:
+        """Returns the number of block tiles the last render blitted, which is 0 without a camera"""
+        return self.__tiles.last_drawn if self.__tiles != None else 0
+
+    @traced("Graphics.render")
     def render(self, instructions: GraphicsInstructions):
-        """Given graphics instructions, render things to the screen"""
+        """Given graphics instructions, render things to the screen
 
-        # If new settings are detected, update affected instance variables
-        if instructions.graphics_settings_change != None:
-            self.graphics_settings = copy.deepcopy(
-                instructions.graphics_settings_change
-            )
-            self.__reset_resolution()
+        Objects come from two places: the scene, which is kept between frames and only told what changed
+        (this is how the game being played is drawn), and the objects of the instructions, which are drawn
+        for this frame only. Instructions without scene changes empty the scene
+        """
+
+        self.__take_in(instructions)
 
         self.__screen.fill(Colors.black)
 
@@ -107,14 +191,170 @@ class Graphics:
             ],
         )
 
+        camera = instructions.camera
+        scene_objects = self.__scene.values()
+        if camera != None:
+            # The game area is drawn through the camera, and nothing drawn through it spills out of the game area
+            self.__screen.set_clip(
+                pygame.Rect(
+                    int(self.game_screen_origin_x),
+                    int(self.game_screen_origin_y),
+                    int(self.game_screen_width),
+                    int(self.game_screen_height),
+                )
+            )
+            self.__set_camera_view(camera)
+            self.__tiles.draw(
+                self.__screen,
+                self.__view_origin_x,
+                self.__view_origin_y,
+                self.__screen.get_clip(),
+            )
+            scene_objects = self.__sprites.values()
+
+        for obj in scene_objects:
+            self.__render_object(obj)
+        if self.__particles != None:
+            self.__render_particles()
         for obj in instructions.objects:
             self.__render_object(obj)
 
+        if camera != None:
+            self.__screen.set_clip(None)
+            self.__set_screen_view()
+
         for ui_element in instructions.ui_elements:
             self.__render_ui_element(ui_element)
 
         pygame.display.update()
 
+    def skip(self, instructions: GraphicsInstructions):
+        """Takes in the instructions of a frame without drawing it
+
+        The scene, settings and effects are updated as if the frame was rendered, so the next render is correct
+        """
+        self.__take_in(instructions)
+
+    def __take_in(self, instructions: GraphicsInstructions):
+        """Updates what Graphics keeps between frames (settings, the scene, particles) from a frame's instructions"""
+        # If new settings are detected, update affected instance variables
+        if instructions.graphics_settings_change != None:
+            self.graphics_settings = copy.deepcopy(
+                instructions.graphics_settings_change
+            )
+            self.__reset_resolution()
+
+        if self.__particles != None:
+            self.__update_particles(instructions)
+        self.__apply_scene_changes(instructions.scene_changes)
+        self.__point_camera(instructions.camera)
+
+    def __update_particles(self, instructions: GraphicsInstructions):
+        """Emits particles for what happened this frame, and moves all of them on
+
+        This runs before the scene changes are applied, so broken blocks are still in the scene to take the color of
+        """
+        if instructions.scene_changes == None:
+            self.__particles.clear()
+            return
+        for event in instructions.events:
+            if event.event_type == EventType.BLOCK_BROKEN:
+                block = self.__scene.get(event.block_id)
+                color = Colors.unpack(block.color) if block != None else Colors.white
+                self.__particles.emit(
+                    event.x, event.y, Constants.particles_per_block, color
+                )
+            elif event.event_type == EventType.PADDLE_HIT:
+                self.__particles.emit(
+                    event.x, event.y, Constants.particles_per_paddle_hit, Colors.white
+                )
+        self.__particles.update(instructions.effect_time)
+
+    def __render_particles(self):
+        """Draws all the particles in one batch, straight into the pixels of the game area"""
+        if self.__particles.count == 0:
+            return
+        pixels = pygame.surfarray.pixels3d(self.__screen)
+        self.__particles.draw(
+            pixels,
+            self.__view_scaling,
+            (self.__view_origin_x, self.__view_origin_y),
+            (
+                int(self.game_screen_origin_x),
+                int(self.game_screen_origin_y),
+                int(self.game_screen_origin_x + self.game_screen_width),
+                int(self.game_screen_origin_y + self.game_screen_height),
+            ),
+        )
+        # The screen stays locked while the pixel array exists
+        del pixels
+
+    def __apply_scene_changes(self, scene_changes: SceneChanges | None):
+        """Updates the scene with what was created, changed and destroyed
+
+        The changes are passed on to the block tiles, if there are any. A new scene gets new tiles
+        """
+        if scene_changes == None:
+            if self.__scene:
+                self.__scene = {}
+            self.__tiles = None
+            return
+        if scene_changes.reset:
+            self.__scene = {}
+            self.__tiles = None
+        for scene_id in scene_changes.destroyed:
+            self.__scene.pop(scene_id, None)
+        self.__scene.update(scene_changes.changed)
+
+        if self.__tiles != None:
+            for scene_id in scene_changes.destroyed:
+                self.__tiles.remove(scene_id)
+                self.__sprites.pop(scene_id, None)
+            for scene_id, obj in scene_changes.changed.items():
+                if type(obj) == Block:
+                    self.__tiles.set(scene_id, obj)
+                else:
+                    self.__sprites[scene_id] = obj
+
+    def __point_camera(self, camera: Camera | None):
+        """Builds the block tiles from the scene when a camera first appears, or its zoom changes, and drops them
+        when there is no camera
+        """
+        if camera == None:
+            self.__tiles = None
+            self.__sprites = None
+            return
+        scaling = self.scaling * camera.zoom
+        if self.__tiles != None and self.__tiles.scaling == scaling:
+            return
+        self.__tiles = BlockTiles(scaling, self.__draw_blocks_onto)
+        self.__sprites = {}
+        for scene_id, obj in self.__scene.items():
+            if type(obj) == Block:
+                self.__tiles.set(scene_id, obj)
+            else:
+                self.__sprites[scene_id] = obj
+
+    def __draw_blocks_onto(
+        self,
+        surface: pygame.Surface,
+        scaling: float,
+        origin_x: float,
+        origin_y: float,
+        blocks: list[Block],
+    ):
+        """Draws blocks onto a tile for the block tiles, then goes back to drawing through the camera"""
+        view = (
+            self.__view_surface,
+            self.__view_scaling,
+            self.__view_origin_x,
+            self.__view_origin_y,
+        )
+        self.__set_view(surface, scaling, origin_x, origin_y)
+        for block in blocks:
+            self.__render_block(block)
+        self.__set_view(*view)
+
     def __reset_resolution(self):
         """Changes the resolution of the screen"""
         self.__screen = pygame.display.set_mode(
@@ -127,6 +367,7 @@ class Graphics:
             self.graphics_settings.resolution_width,
             self.graphics_settings.resolution_height,
         )
+        self.__text_surfaces = {}
         self.__set_game_screen()
 
     def __render_paddle(self, paddle: Paddle):
@@ -161,18 +402,58 @@ class Graphics:
 
     def __render_block(self, block: Block):
         """Renders blocks"""
-        self.__res_draw_rect(block.x, block.y, block.width, block.height, block.color)
+        color = Colors.unpack(block.color)
+        self.__res_draw_rect(block.x, block.y, block.width, block.height, color)
         if block.block_type == BlockType.POWERUP:
             self.__res_draw_circle(
                 block.x + block.width / 2,
                 block.y + block.height / 2,
                 block.height / 2,
-                Colors.negative(block.color),
+                Colors.negative(color),
             )
         elif block.block_type == BlockType.PROTECTOR:
             self.__res_draw_rect(
                 block.x, block.y, block.width, block.height, Colors.white
             )
+        elif block.block_type == BlockType.HEALER:
+            # A cross
+            arm = block.height / 2
+            self.__res_draw_rect(
+                block.x + block.width / 2 - arm / 4,
+                block.y + block.height / 2 - arm,
+                arm / 2,
+                2 * arm,
+                Colors.white,
+            )
+            self.__res_draw_rect(
+                block.x + block.width / 2 - arm,
+                block.y + block.height / 2 - arm / 4,
+                2 * arm,
+                arm / 2,
+                Colors.white,
+            )
+        elif block.block_type == BlockType.EXPLOSIVE:
+            # A diamond
+            middle_x = block.x + block.width / 2
+            middle_y = block.y + block.height / 2
+            radius = block.height / 2
+            self.__res_draw_polygon(
+                [
+                    (middle_x, middle_y - radius),
+                    (middle_x + radius, middle_y),
+                    (middle_x, middle_y + radius),
+                    (middle_x - radius, middle_y),
+                ],
+                Colors.red,
+            )
+        elif block.block_type == BlockType.REVIVER:
+            self.__res_draw_circle(
+                block.x + block.width / 2,
+                block.y + block.height / 2,
+                block.height / 2,
+                Colors.white,
+                2,
+            )
         if block.health > 1:
             self.__res_draw_rect(
                 block.x,
@@ -264,15 +545,66 @@ class Graphics:
 
     def __render_message(self, msg: Message):
         """Renders UI text"""
-        surf = pygame.font.SysFont(msg.font, round(self.scaling * msg.size)).render(
-            msg.text, True, msg.color
-        )
+        surf = self.__text_surface(msg.text, msg.font, msg.size, msg.color)
         trect = surf.get_rect()
         trect.center = self.__game_x_to_resolution_x(
             msg.x
         ), self.__game_y_to_resolution_y(msg.y)
         self.__screen.blit(surf, trect)
 
+    def __text_surface(
+        self, text: str, font: str, size: int, color: Color
+    ) -> pygame.Surface:
+        """Renders text at the current scaling, reusing the surface if the same text was rendered before"""
+        pixel_size = round(self.scaling * size)
+        key = (text, font, pixel_size, color)
+        if key not in self.__text_surfaces:
+            if (font, pixel_size) not in self.__fonts:
+                self.__fonts[(font, pixel_size)] = pygame.font.SysFont(font, pixel_size)
+            # Changing text (like the performance HUD) would otherwise grow the cache forever
+            if len(self.__text_surfaces) >= 256:
+                self.__text_surfaces = {}
+            self.__text_surfaces[key] = self.__fonts[(font, pixel_size)].render(
+                text, True, color
+            )
+        return self.__text_surfaces[key]
+
+    def __render_performance_overlay(self, overlay: PerformanceOverlay):
+        """Renders the performance HUD: one line of text per stat, and a graph of recent frame times"""
+        line_height = 12
+        width = 160
+        graph_height = 40
+        height = line_height * len(overlay.lines) + graph_height + 10
+        self.__res_draw_rect(overlay.x, overlay.y, width, height, Colors.black)
+
+        for index, line in enumerate(overlay.lines):
+            surf = self.__text_surface(line, "couriernew", 10, Colors.white)
+            self.__screen.blit(
+                surf,
+                self.__game_coords_to_resolution_coords(
+                    (overlay.x + 3, overlay.y + 3 + line_height * index)
+                ),
+            )
+
+        # The graph is scaled so that a frame at the budget of 60 fps is halfway up
+        graph_bottom = overlay.y + height - 3
+        budget = 1000 / 60
+        if len(overlay.frame_times) >= 2:
+            step = width / Constants.hud_graph_frames
+            points = [
+                self.__game_coords_to_resolution_coords(
+                    (
+                        overlay.x + step * index,
+                        graph_bottom - min(frame_time / (2 * budget), 1) * graph_height,
+                    )
+                )
+                for index, frame_time in enumerate(overlay.frame_times)
+            ]
+            pygame.draw.lines(self.__screen, Colors.white, False, points)
+        self.__res_draw_rect(
+            overlay.x, graph_bottom - graph_height / 2, width, 1, Colors.red
+        )
+
     def __render_settings_selector(self, selector: SettingsSelector):
         """Renders the setting selector in the settings screens as two triangles surrounding the setting"""
         triangle_base = 50
@@ -327,6 +659,8 @@ class Graphics:
             self.__render_message(ui_element)
         elif type(ui_element) == SettingsSelector:
             self.__render_settings_selector(ui_element)
+        elif type(ui_element) == PerformanceOverlay:
+            self.__render_performance_overlay(ui_element)
 
     def __set_game_screen(self):
         """Sets the game screen and resolution data
@@ -376,13 +710,45 @@ class Graphics:
                 self.graphics_settings.resolution_width / 2
             ) - (self.game_screen_width / 2)
 
+        self.__set_screen_view()
+
+    def __set_view(
+        self, surface: pygame.Surface, scaling: float, origin_x: float, origin_y: float
+    ):
+        """Sets where the drawing methods draw: onto which surface, at what scaling, and at which pixel game (0, 0) is"""
+        self.__view_surface = surface
+        self.__view_scaling = scaling
+        self.__view_origin_x = origin_x
+        self.__view_origin_y = origin_y
+
+    def __set_screen_view(self):
+        """Draws the whole game area onto the screen, which is how everything is drawn unless there is a camera"""
+        self.__set_view(
+            self.__screen,
+            self.scaling,
+            self.game_screen_origin_x,
+            self.game_screen_origin_y,
+        )
+
+    def __set_camera_view(self, camera: Camera):
+        """Draws the part of the game area the camera shows onto the screen. The origin is a whole pixel, which the
+        block tiles line up with
+        """
+        scaling = self.scaling * camera.zoom
+        self.__set_view(
+            self.__screen,
+            scaling,
+            round(self.game_screen_origin_x - camera.x * scaling),
+            round(self.game_screen_origin_y - camera.y * scaling),
+        )
+
     def __game_x_to_resolution_x(self, x: float) -> float:
         """Transforms the x-coordinate to actual pixels"""
-        return x * self.scaling + self.game_screen_origin_x
+        return x * self.__view_scaling + self.__view_origin_x
 
     def __game_y_to_resolution_y(self, y: float) -> float:
         """Transforms the y-coordinate to actual pixels"""
-        return y * self.scaling + self.game_screen_origin_y
+        return y * self.__view_scaling + self.__view_origin_y
 
     def __game_coords_to_resolution_coords(
         self, coord: Tuple[float, float]
@@ -392,31 +758,50 @@ class Graphics:
         y = coord[1]
         return (self.__game_x_to_resolution_x(x), self.__game_y_to_resolution_y(y))
 
+    def __game_coords_to_pixel(self, coord: Tuple[float, float]) -> Tuple[int, int]:
+        """Transforms coordinates to the pixel they are in
+
+        This rounds down, where pygame would round towards 0. The two only differ for negative coordinates, which
+        a block on the edge of a tile has, and rounding down puts it on the same pixels in the tiles on both sides
+        """
+        return (
+            math.floor(self.__game_x_to_resolution_x(coord[0])),
+            math.floor(self.__game_y_to_resolution_y(coord[1])),
+        )
+
     def __res_draw_rect(self, x, y, width, height, color, border_width=0):
         """Given abstract game coordinates, draws a rectangle in the correct resolution (pixel) coordinates"""
-        pygame.draw.rect(
-            self.__screen,
-            color,
-            [
-                self.__game_x_to_resolution_x(x),
-                self.__game_y_to_resolution_y(y),
-                self.scaling * width,
-                self.scaling * height,
-            ],
-            int(self.scaling * border_width),
+        rect = pygame.Rect(
+            *self.__game_coords_to_pixel((x, y)),
+            self.__view_scaling * width,
+            self.__view_scaling * height,
         )
+        border = int(self.__view_scaling * border_width)
+        if border <= 0:
+            pygame.draw.rect(self.__view_surface, color, rect)
+            return
+        # pygame clips an outline to the surface before drawing it, which draws the sides of a rectangle that goes
+        # past the surface (like a block on the edge of a tile) along the edge instead. Drawing the sides as filled
+        # rectangles gives the same pixels as an outline, wherever the rectangle is
+        for side in [
+            (rect.left, rect.top, rect.width, border),
+            (rect.left, rect.bottom - border, rect.width, border),
+            (rect.left, rect.top, border, rect.height),
+            (rect.right - border, rect.top, border, rect.height),
+        ]:
+            pygame.draw.rect(self.__view_surface, color, rect.clip(side))
 
     def __res_draw_circle(self, x, y, radius, color, border_width=0):
         """Given game coordinates, draws a circle in the correct resolution (pixel) coordinates"""
         pygame.draw.circle(
-            self.__screen,
+            self.__view_surface,
             color,
-            self.__game_coords_to_resolution_coords((x, y)),
-            self.scaling * radius,
-            int(self.scaling * border_width),
+            self.__game_coords_to_pixel((x, y)),
+            self.__view_scaling * radius,
+            int(self.__view_scaling * border_width),
         )
 
     def __res_draw_polygon(self, points, color):
         """Given game coordinates, draws a polygon in the correct resolution (pixel) coordinates"""
-        points = [self.__game_coords_to_resolution_coords(i) for i in points]
-        pygame.draw.polygon(self.__screen, color, points)
+        points = [self.__game_coords_to_pixel(i) for i in points]
+        pygame.draw.polygon(self.__view_surface, color, points)
@@ -18,6 +18,8 @@ class KeyboardState:
         self.new_keys_pressed = set()
         self.currently_pressed_keys = set()
         self.quit = False
+        # The event that ended the last wait_for_pygame_events, waiting to be dealt with
+        self.__woken_by = None
 
     def handle_pygame_events(self):
         """Flushes the pygame event queue and deals with input
@@ -30,21 +32,39 @@ class KeyboardState:
         )
         self.new_keys_pressed = set()
 
+        if self.__woken_by != None:
+            self.__handle_event(self.__woken_by)
+            self.__woken_by = None
         for event in pygame.event.get():
-            if event.type == pygame.KEYDOWN:
-                if event.key not in self.currently_pressed_keys:
-                    self.new_keys_pressed.add(event.key)
-            elif event.type == pygame.KEYUP:
-                # Technically a KEYUP key must always be in currently pressed keys, but just in case it is not, I added this check
-                if event.key in self.currently_pressed_keys:
-                    self.currently_pressed_keys.remove(event.key)
-
-            # Quits the game when the 'cross' button in pressed on the window
-            # Technically this should not be handled by keyboard state
-            # But right now it is the only class in inputs
-            # This will later probably be the responsibility of an Inputs class that handles multiple kinds of inputs
-            elif event.type == pygame.QUIT:
-                self.quit = True
+            self.__handle_event(event)
+
+    def wait_for_pygame_events(self, timeout: int):
+        """Sleeps until an event arrives or timeout milliseconds pass. The input is dealt with by the next call to
+        handle_pygame_events, so that waiting and handling input can be timed apart
+
+        Used on static screens, where there is nothing to update until the user does something. Blocking inside
+        pygame.event.wait lets the process sleep instead of spinning through frames.
+        """
+        event = pygame.event.wait(timeout)
+        if event.type != pygame.NOEVENT:
+            self.__woken_by = event
+
+    def __handle_event(self, event: pygame.event.Event):
+        """Updates the key sets according to a single pygame event"""
+        if event.type == pygame.KEYDOWN:
+            if event.key not in self.currently_pressed_keys:
+                self.new_keys_pressed.add(event.key)
+        elif event.type == pygame.KEYUP:
+            # Technically a KEYUP key must always be in currently pressed keys, but just in case it is not, I added this check
+            if event.key in self.currently_pressed_keys:
+                self.currently_pressed_keys.remove(event.key)
+
+        # Quits the game when the 'cross' button in pressed on the window
+        # Technically this should not be handled by keyboard state
+        # But right now it is the only class in inputs
+        # This will later probably be the responsibility of an Inputs class that handles multiple kinds of inputs
+        elif event.type == pygame.QUIT:
+            self.quit = True
 
     def get_keys(self):
         """Keys that are currently down, whether they have been for a while or have been newly pressed"""
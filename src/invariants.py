@@ -0,0 +1,211 @@
+"""Provides checks that the program state is consistent, at a configurable cost
+
+Each invariant is a function of the GameState and Graphics objects that asserts something about them.
+Invariants are either cheap (constant time) or expensive (they look at every block). How many of them run
+depends on the level:
+    OFF             nothing runs
+    SAMPLED         every Constants.invariant_sample_interval frames, all cheap invariants and one expensive one,
+                    taking turns, so that every invariant is eventually checked at a small cost per frame
+    EVERY_FRAME     all cheap invariants every frame, and expensive ones as in SAMPLED
+    EXHAUSTIVE      everything, every frame
+
+The level is Constants.default_invariant_level, unless the BREAKOUT_INVARIANTS environment variable is set
+to one of "off", "sampled", "every frame" or "exhaustive"
+
+A huge board has too many blocks to look at in a frame, so there expensive invariants only check the blocks
+around the ball (see checked_blocks), which is where blocks break and change
+"""
+
+import os
+from typing import Callable, TYPE_CHECKING
+
+from common import (
+    BALL_SCENE_ID,
+    PADDLE_SCENE_ID,
+    Block,
+    BlockType,
+    Constants,
+    GameFsmState,
+    InvariantLevel,
+)
+
+if TYPE_CHECKING:
+    from game_state import GameState
+    from graphics import Graphics
+
+
+def settings_are_consistent(game: "GameState", graphics: "Graphics"):
+    """Graphics and the settings screen must agree with GameState about the settings"""
+    assert game.settings.graphics_settings == graphics.graphics_settings
+    if game.settings_state != None:
+        assert game.settings == game.settings_state.settings
+
+
+def ball_is_in_bounds(game: "GameState", graphics: "Graphics"):
+    """The ball can't leave through the walls or the ceiling. It can only fall off the bottom"""
+    core_game_state = game.core_game_state
+    if core_game_state == None or core_game_state.ball == None:
+        return
+    ball = core_game_state.ball
+    assert -ball.radius <= ball.x <= Constants.game_width + ball.radius, ball
+    assert ball.y >= -ball.radius, ball
+
+
+def lives_are_consistent(game: "GameState", graphics: "Graphics"):
+    """The paddle shows the lives that CoreGameState has"""
+    core_game_state = game.core_game_state
+    if core_game_state == None:
+        return
+    assert core_game_state.paddle.lives == core_game_state.lives
+    assert core_game_state.lives >= 0
+
+
+def checked_blocks(game: "GameState", margin: int = 0) -> list[Block]:
+    """The blocks expensive invariants check: all of them, or on a huge board those in the cells within
+    Constants.huge_board_invariant_reach of the ball, and margin more cells on each side
+
+    On a huge board there is no list of every block (see CoreGameState.blocks), so they come from the block
+    effects' index. The blocks around the ball are in view, so they have already been built and drawn
+    """
+    core_game_state = game.core_game_state
+    ball = core_game_state.ball
+    if not game.huge_board or ball == None:
+        return core_game_state.blocks
+
+    cols, rows = core_game_state.cells_around(
+        ball.x, ball.y, Constants.huge_board_invariant_reach
+    )
+    return core_game_state.block_effects.blocks_in(
+        range(cols.start - margin, cols.stop + margin),
+        range(rows.start - margin, rows.stop + margin),
+    )
+
+
+def blocks_do_not_overlap(game: "GameState", graphics: "Graphics"):
+    """No two blocks overlap, and no two blocks have the same id
+
+    Blocks are sorted by x and swept, so that only blocks that overlap in x are compared
+    """
+    core_game_state = game.core_game_state
+    if core_game_state == None:
+        return
+    blocks = sorted(checked_blocks(game), key=lambda block: block.x)
+    assert len({block.block_id for block in blocks}) == len(blocks)
+
+    active = []
+    for block in blocks:
+        active = [other for other in active if other.x + other.width > block.x]
+        for other in active:
+            assert not (
+                block.y < other.y + other.height and other.y < block.y + block.height
+            ), (block.block_id, other.block_id)
+        active.append(block)
+
+
+def protection_matches_protectors(game: "GameState", graphics: "Graphics"):
+    """Each block's protection is the number of protector blocks above it (directly or diagonally)"""
+    core_game_state = game.core_game_state
+    if core_game_state == None:
+        return
+    # The protectors of the blocks checked are at most a cell away from them
+    protectors = {
+        block.block_id
+        for block in checked_blocks(game, margin=1)
+        if block.block_type == BlockType.PROTECTOR
+    }
+    for block in checked_blocks(game):
+        i, j = block.block_id
+        expected = sum(
+            1
+            for above in [(i, j - 1), (i - 1, j - 1), (i + 1, j - 1)]
+            if above in protectors
+        )
+        assert block.protection == expected, block
+
+
+def block_effects_index_blocks(game: "GameState", graphics: "Graphics"):
+    """Every block in play is indexed by the block effects, so their effects reach it"""
+    core_game_state = game.core_game_state
+    if core_game_state == None:
+        return
+    for block in checked_blocks(game):
+        assert core_game_state.block_effects.is_live(block), block
+
+
+def scene_matches_game(game: "GameState", graphics: "Graphics"):
+    """The scene Graphics keeps holds exactly the objects of the game, so no change was missed"""
+    core_game_state = game.core_game_state
+    if core_game_state == None or game.game_fsm_state not in [
+        GameFsmState.PLAY,
+        GameFsmState.PAUSE,
+        GameFsmState.PRE_PLAY,
+    ]:
+        return
+    if game.huge_board:
+        # Only the number of objects, the paddle, the ball and the blocks around it. Blocks that have not been
+        # built yet are not drawn
+        ball = core_game_state.ball
+        count = len(core_game_state.block_effects) + len(core_game_state.powerups)
+        count += 1 if ball == None else 2
+        assert graphics.scene_size() == count, (graphics.scene_size(), count)
+        assert graphics.scene_object(PADDLE_SCENE_ID) is core_game_state.paddle
+        assert graphics.scene_object(BALL_SCENE_ID) is ball
+        for block in checked_blocks(game):
+            assert graphics.scene_object(block.block_id) is block, block
+        return
+
+    scene = graphics.scene_objects()
+    objects = [obj for obj in core_game_state.objects() if obj != None]
+    assert len(scene) == len(objects), (len(scene), len(objects))
+    assert {id(obj) for obj in scene} == {id(obj) for obj in objects}
+
+
+CHEAP_INVARIANTS = [settings_are_consistent, ball_is_in_bounds, lives_are_consistent]
+EXPENSIVE_INVARIANTS = [
+    blocks_do_not_overlap,
+    protection_matches_protectors,
+    block_effects_index_blocks,
+    scene_matches_game,
+]
+
+
+class InvariantChecker:
+    """Runs invariants each frame, according to an InvariantLevel"""
+
+    def __init__(self, level: InvariantLevel = None):
+        if level == None:
+            level = InvariantLevel(
+                os.environ.get(
+                    "BREAKOUT_INVARIANTS", Constants.default_invariant_level.value
+                )
+            )
+        self.level = level
+        self.__frame = 0
+        self.__next_expensive = 0
+
+    def check(self, game: "GameState", graphics: "Graphics"):
+        """Checks the invariants due this frame. A failing invariant raises AssertionError"""
+        self.__frame += 1
+        sampled_frame = self.__frame % Constants.invariant_sample_interval == 0
+
+        if self.level == InvariantLevel.OFF:
+            return
+        elif self.level == InvariantLevel.EXHAUSTIVE:
+            invariants = CHEAP_INVARIANTS + EXPENSIVE_INVARIANTS
+        elif self.level == InvariantLevel.EVERY_FRAME:
+            invariants = CHEAP_INVARIANTS
+            if sampled_frame:
+                invariants = invariants + [self.__take_expensive_turn()]
+        elif sampled_frame:
+            invariants = CHEAP_INVARIANTS + [self.__take_expensive_turn()]
+        else:
+            return
+
+        for invariant in invariants:
+            invariant(game, graphics)
+
+    def __take_expensive_turn(self) -> Callable:
+        """Returns the expensive invariant whose turn it is to run"""
+        invariant = EXPENSIVE_INVARIANTS[self.__next_expensive]
+        self.__next_expensive = (self.__next_expensive + 1) % len(EXPENSIVE_INVARIANTS)
+        return invariant
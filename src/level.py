@@ -0,0 +1,482 @@
+"""Provides the LevelData class, which describes the blocks a level starts with, and the level file formats
+
+Levels have two forms:
+
+A human-editable text form. Each non-empty line that does not start with # is a row of blocks, top row first.
+Each row is a list of whitespace separated cells. A cell is either "." (no block) or a health followed by an
+optional type letter:
+    2       a block with 2 health, which has a powerup with probability Constants.powerup_probability
+    1n      a normal block
+    1p      a powerup block
+    2x      a protector block
+    1h      a healer block
+    1e      an explosive block
+    1r      a reviver block
+
+A compiled binary form, which is a small header followed by two bytes (type, health) per cell, column by column.
+Compiled levels are memory-mapped rather than read, so opening one takes the same time however large it is.
+Starting one does too: a game builds the Block of a cell only when something first needs it (see LevelBlocks).
+
+Run `python level.py compile <level.txt> <level.lvl>` to compile a text level.
+
+Endless mode has no level file. Its rows are generated one at a time by an EndlessField as the blocks scroll down.
+"""
+
+from enum import Enum
+import mmap
+import random
+import struct
+import sys
+from typing import Iterator, Tuple
+
+from common import Block, BlockType, Colors, Constants
+
+
+class CellType(Enum):
+    """What kind of block a cell of a level holds. The values are the letters used in the text form"""
+
+    EMPTY = "."
+    RANDOM = ""
+    NORMAL = "n"
+    POWERUP = "p"
+    PROTECTOR = "x"
+    HEALER = "h"
+    EXPLOSIVE = "e"
+    REVIVER = "r"
+
+
+# Cell types are stored in compiled levels as their index in this list
+CELL_TYPES = list(CellType)
+
+MAGIC = b"BRKL"
+VERSION = 1
+HEADER = struct.Struct("<4sHII")
+CELL_SIZE = 2
+
+# Block types of cells whose type is fixed by the level. Random cells are decided as each block is built
+FIXED_BLOCK_TYPES = {
+    CellType.NORMAL: BlockType.NORMAL,
+    CellType.POWERUP: BlockType.POWERUP,
+    CellType.PROTECTOR: BlockType.PROTECTOR,
+    CellType.HEALER: BlockType.HEALER,
+    CellType.EXPLOSIVE: BlockType.EXPLOSIVE,
+    CellType.REVIVER: BlockType.REVIVER,
+}
+# The same, by the code cells are stored with
+CODE_BLOCK_TYPES = [FIXED_BLOCK_TYPES.get(cell_type) for cell_type in CELL_TYPES]
+EMPTY_CODE = CELL_TYPES.index(CellType.EMPTY)
+# Maps the code of a cell to 1 if it holds a block and 0 if it is empty, for bytes.translate
+OCCUPIED = bytes(int(code != EMPTY_CODE) for code in range(256))
+
+MASK_64 = (1 << 64) - 1
+
+DEFAULT_LEVEL = """
+# The original level: rows 0 and 2 take two hits, and a protector in the middle of row 2
+2 2 2 2 2  2 2 2 2
+1 1 1 1 1  1 1 1 1
+2 2 2 2 2x 2 2 2 2
+1 1 1 1 1  1 1 1 1
+1 1 1 1 1  1 1 1 1
+"""
+
+
+class LevelData:
+    """Describes the initial layout of blocks in a level
+
+    Cells are held in the same layout as the compiled form, in any object supporting the buffer protocol
+    (a bytearray for levels made in code or parsed from text, a memory-mapped file for compiled levels)
+    """
+
+    def __init__(self, num_cols: int, num_rows: int, cells):
+        assert len(cells) == num_cols * num_rows * CELL_SIZE
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.__cells = cells
+        col_width, row_height = self.cell_size()
+        # Large levels have small cells, which need smaller gaps between blocks
+        self.__geometry = col_width, row_height, min(2, col_width / 8, row_height / 8)
+
+    @classmethod
+    def default(cls) -> "LevelData":
+        """The level played when no other level is chosen"""
+        return cls.from_text(DEFAULT_LEVEL)
+
+    @classmethod
+    def uniform(
+        cls,
+        num_cols: int,
+        num_rows: int,
+        health: int = 1,
+        cell_type: CellType = CellType.RANDOM,
+    ) -> "LevelData":
+        """A level completely filled with blocks of the same health and type (random ones by default)"""
+        cell = bytes([CELL_TYPES.index(cell_type), health])
+        return cls(num_cols, num_rows, bytearray(cell * (num_cols * num_rows)))
+
+    @classmethod
+    def from_text(cls, text: str) -> "LevelData":
+        """Parses the text form of a level. Raises ValueError if it is malformed"""
+        rows = [
+            line.split()
+            for line in text.splitlines()
+            if line.strip() != "" and not line.lstrip().startswith("#")
+        ]
+        if len(rows) == 0:
+            raise ValueError("Level has no rows")
+        num_cols = len(rows[0])
+        if any(len(row) != num_cols for row in rows):
+            raise ValueError("All rows of a level must have the same number of cells")
+
+        num_rows = len(rows)
+        cells = bytearray(num_cols * num_rows * CELL_SIZE)
+        for j, row in enumerate(rows):
+            for i, token in enumerate(row):
+                cell_type, health = parse_cell(token)
+                offset = (i * num_rows + j) * CELL_SIZE
+                cells[offset] = CELL_TYPES.index(cell_type)
+                cells[offset + 1] = health
+
+        return cls(num_cols, num_rows, cells)
+
+    @classmethod
+    def load(cls, path: str) -> "LevelData":
+        """Loads a level file in either form, memory-mapping it if it is compiled"""
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) == MAGIC:
+                return cls.load_compiled(path)
+        with open(path, "r") as file:
+            return cls.from_text(file.read())
+
+    @classmethod
+    def load_compiled(cls, path: str) -> "LevelData":
+        """Memory-maps a compiled level. Raises ValueError if the file is not one"""
+        with open(path, "rb") as file:
+            # mmap refuses empty files with a ValueError too
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_compiled(mapped)
+
+    @classmethod
+    def from_compiled(cls, data) -> "LevelData":
+        """Reads the compiled form of a level from any object supporting the buffer protocol, without copying the
+        cells. Raises ValueError if it is not a compiled level
+        """
+        if len(data) < HEADER.size:
+            raise ValueError("Not a compiled level")
+        magic, version, num_cols, num_rows = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a compiled level")
+        if version != VERSION:
+            raise ValueError("Unsupported level version {}".format(version))
+        if len(data) < HEADER.size + num_cols * num_rows * CELL_SIZE:
+            raise ValueError(
+                "Compiled level is truncated: {} by {} cells need {} bytes, got {}".format(
+                    num_cols,
+                    num_rows,
+                    HEADER.size + num_cols * num_rows * CELL_SIZE,
+                    len(data),
+                )
+            )
+
+        cells = memoryview(data)[
+            HEADER.size : HEADER.size + num_cols * num_rows * CELL_SIZE
+        ]
+        return cls(num_cols, num_rows, cells)
+
+    def compile(self) -> bytes:
+        """Returns the compiled form of the level"""
+        return HEADER.pack(MAGIC, VERSION, self.num_cols, self.num_rows) + bytes(
+            self.__cells
+        )
+
+    def to_text(self) -> str:
+        """Returns the text form of the level"""
+        lines = []
+        for j in range(self.num_rows):
+            tokens = []
+            for i in range(self.num_cols):
+                cell_type, health = self.cell(i, j)
+                tokens.append(
+                    "."
+                    if cell_type == CellType.EMPTY
+                    else str(health) + cell_type.value
+                )
+            lines.append(" ".join(tokens))
+        return "\n".join(lines) + "\n"
+
+    def cell(self, i: int, j: int) -> Tuple[CellType, int]:
+        """Returns the type and health of the block in column i and row j"""
+        offset = (i * self.num_rows + j) * CELL_SIZE
+        return CELL_TYPES[self.__cells[offset]], self.__cells[offset + 1]
+
+    def cell_size(self) -> Tuple[float, float]:
+        """The width and height of the cells of the level, in game units. Block (i, j) is inside the cell at
+        (i * width, j * height)
+
+        Cells fill the width of the game area and the top third of its height, like the original level
+        """
+        return (
+            Constants.game_width / self.num_cols,
+            Constants.game_height / (3 * self.num_rows),
+        )
+
+    def codes(self) -> bytes:
+        """The index in CELL_TYPES of the type of each cell, in the same order as the cells"""
+        return memoryview(self.__cells)[::CELL_SIZE].tobytes()
+
+    def occupied(self) -> bytearray:
+        """One byte per cell, in the same order as the cells, which is 1 if the cell holds a block and 0 if it is empty"""
+        return bytearray(self.codes().translate(OCCUPIED))
+
+    def block(self, i: int, j: int, seed: int) -> Block | None:
+        """Builds the block in column i and row j, or returns None if the cell is empty
+
+        Its random type and color come from a generator seeded with the seed and the cell alone, so a block is the
+        same whenever it is built, whatever was built before it
+        """
+        index = i * self.num_rows + j
+        code = self.__cells[index * CELL_SIZE]
+        if code == EMPTY_CODE:
+            return None
+        rng = CellRandom(seed << 32 | index)
+        block_type = CODE_BLOCK_TYPES[code]
+        if block_type == None:
+            block_type = BlockType.normal_or_powerup(Constants.powerup_probability, rng)
+
+        col_width, row_height, gap = self.__geometry
+        return Block(
+            col_width * i + gap,
+            row_height * j + gap,
+            col_width - 2 * gap,
+            row_height - 2 * gap,
+            (i, j),
+            block_type,
+            self.__cells[index * CELL_SIZE + 1],
+            0,
+            Colors.generate_random_block_color(rng),
+        )
+
+    def blocks(self, seed: int = 0) -> Iterator[Block]:
+        """Builds the blocks of the level, one at a time, in order of id (by column, then row)"""
+        for i in range(self.num_cols):
+            for j in range(self.num_rows):
+                block = self.block(i, j, seed)
+                if block != None:
+                    yield block
+
+
+class CellRandom:
+    """The generator the random type and color of a block are drawn from, seeded with the game's seed and the cell
+
+    Seeding a random.Random for every block would take longer than building the block (some 7 microseconds), so
+    this is splitmix64, which is cheap to seed. It has the two methods the block helpers in common.py use
+    """
+
+    __slots__ = ("state",)
+
+    def __init__(self, seed: int):
+        self.state = seed & MASK_64
+
+    def __next(self) -> int:
+        """The next 64 random bits"""
+        self.state = (self.state + 0x9E3779B97F4A7C15) & MASK_64
+        z = self.state
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+        return z ^ (z >> 31)
+
+    def random(self) -> float:
+        """A float in [0, 1)"""
+        return (self.__next() >> 11) * (1.0 / (1 << 53))
+
+    def getrandbits(self, k: int) -> int:
+        """An integer of k random bits, for k up to 64"""
+        return self.__next() >> (64 - k)
+
+
+class LevelBlocks:
+    """The blocks of a level in one game, each built the first time the game needs it
+
+    Nothing is built up front, so starting a level takes the same time however large it is. A cell's block is built
+    when it is first asked for: by a collision check, by the camera coming over it, or by something that needs every
+    block (a snapshot, or drawing the whole board). Since LevelData.block only depends on the cell and the seed, when
+    a block is built does not change what it is. A cell is pristine until its block is built.
+    """
+
+    def __init__(self, level: LevelData, seed: int):
+        self.level = level
+        self.seed = seed
+        self.__pristine = level.occupied()
+        # The number of pristine cells
+        self.remaining = len(self.__pristine) - self.__pristine.count(0)
+        # Blocks built since take_new() was last called
+        self.__new = []
+        # The sets pristine_cells() returned, by block type
+        self.__pristine_cells = {}
+
+    def take(self, i: int, j: int) -> Block | None:
+        """Builds the block of a pristine cell. Returns None for any other cell, including cells outside the level"""
+        num_rows = self.level.num_rows
+        if not (0 <= i < self.level.num_cols and 0 <= j < num_rows):
+            return None
+        index = i * num_rows + j
+        if not self.__pristine[index]:
+            return None
+        self.__pristine[index] = 0
+        self.remaining -= 1
+        for cells in self.__pristine_cells.values():
+            cells.discard((i, j))
+        block = self.level.block(i, j, self.seed)
+        self.__new.append(block)
+        return block
+
+    def take_all(self) -> list[Block]:
+        """Builds the blocks of every pristine cell, in order of id"""
+        level, seed, pristine = self.level, self.seed, self.__pristine
+        blocks = []
+        index = pristine.find(1)
+        while index != -1:
+            blocks.append(level.block(*divmod(index, level.num_rows), seed))
+            index = pristine.find(1, index + 1)
+        self.__pristine = bytearray(len(pristine))
+        self.remaining = 0
+        for cells in self.__pristine_cells.values():
+            cells.clear()
+        self.__new += blocks
+        return blocks
+
+    def pristine_cells(self, block_type: BlockType) -> set[Tuple[int, int]]:
+        """The ids of the pristine cells whose blocks the level makes of a type (random cells are normal or powerup
+        blocks, so they are not included). The set is kept up to date as blocks are built
+        """
+        cells = self.__pristine_cells.get(block_type)
+        if cells == None:
+            num_rows = self.level.num_rows
+            codes = {
+                CELL_TYPES.index(cell_type)
+                for cell_type, fixed_type in FIXED_BLOCK_TYPES.items()
+                if fixed_type == block_type
+            }
+            cells = set()
+            for index, code in enumerate(self.level.codes()):
+                if code in codes and self.__pristine[index]:
+                    cells.add(divmod(index, num_rows))
+            self.__pristine_cells[block_type] = cells
+        return cells
+
+    def take_new(self) -> list[Block]:
+        """Returns the blocks built since the last call"""
+        new, self.__new = self.__new, []
+        return new
+
+
+class EndlessField:
+    """Generates the rows of blocks for endless mode, as the field scrolls down
+
+    Row n is built from its own generator seeded with the field seed and n, so rows do not depend on what happened
+    before they were built. The whole field is described by three numbers: the seed, the index of the next row to
+    build and how far the field has scrolled. This is what snapshots and rewinding store.
+    Rows are numbered upwards, and their blocks have the ids (i, -n), so that the row below a block is at j + 1
+    like in a normal level.
+    """
+
+    num_cols = 9
+    initial_rows = 5
+    row_height = Constants.game_height / (3 * initial_rows)
+
+    def __init__(self, seed: int, next_row: int = 0, scroll_offset: float = 0):
+        self.seed = seed
+        self.next_row = next_row
+        self.scroll_offset = scroll_offset
+        # How far the last scroll moved the field, so that rewinding can tell blocks that only scrolled
+        # from blocks that changed
+        self.last_scroll = 0
+
+    def row_y(self, n: int) -> float:
+        """The current y coordinate of the top of row n"""
+        return self.scroll_offset + (self.initial_rows - 1 - n) * self.row_height
+
+    def scroll(self, distance: float) -> list[Block]:
+        """Scrolls the field down and returns the blocks of any rows that have come into view
+
+        This only moves the field itself. CoreGameState moves the blocks that already exist.
+        Scrolling by 0 builds the initial rows.
+        """
+        self.scroll_offset += distance
+        self.last_scroll = distance
+        new_blocks = []
+        while self.row_y(self.next_row) > -self.row_height:
+            new_blocks += self.__build_row(self.next_row)
+            self.next_row += 1
+        return new_blocks
+
+    def __build_row(self, n: int) -> list[Block]:
+        """Builds the blocks of row n"""
+        rng = random.Random("{}:{}".format(self.seed, n))
+        gap = 2
+        col_width = Constants.game_width / self.num_cols
+        y = self.row_y(n)
+
+        blocks = []
+        for i in range(self.num_cols):
+            if rng.random() < Constants.endless_gap_probability:
+                continue
+            health = 2 if rng.random() < Constants.endless_tough_probability else 1
+            if rng.random() < Constants.endless_protector_probability:
+                block_type = BlockType.PROTECTOR
+            else:
+                block_type = BlockType.normal_or_powerup(
+                    Constants.powerup_probability, rng
+                )
+
+            blocks.append(
+                Block(
+                    col_width * i + gap,
+                    y + gap,
+                    col_width - 2 * gap,
+                    self.row_height - 2 * gap,
+                    (i, -n),
+                    block_type,
+                    health,
+                    0,
+                    Colors.generate_random_block_color(rng),
+                )
+            )
+
+        return blocks
+
+
+def parse_cell(token: str) -> Tuple[CellType, int]:
+    """Parses one cell of the text form of a level"""
+    if token == CellType.EMPTY.value:
+        return CellType.EMPTY, 0
+
+    letter = token[-1] if token[-1].isalpha() else ""
+    digits = token[: len(token) - len(letter)]
+    cell_types = {
+        cell_type.value: cell_type
+        for cell_type in CellType
+        if cell_type != CellType.EMPTY
+    }
+    if not digits.isdigit() or letter not in cell_types:
+        raise ValueError("Invalid level cell {!r}".format(token))
+    if not 1 <= int(digits) <= 255:
+        raise ValueError(
+            "Block health must be between 1 and 255, got {!r}".format(token)
+        )
+    return cell_types[letter], int(digits)
+
+
+def main():
+    """Compiles a text level into a binary one"""
+    if len(sys.argv) != 4 or sys.argv[1] != "compile":
+        print("Usage: python level.py compile <level.txt> <level.lvl>")
+        sys.exit(1)
+
+    with open(sys.argv[2], "r") as file:
+        level = LevelData.from_text(file.read())
+    with open(sys.argv[3], "wb") as file:
+        file.write(level.compile())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,153 @@
 """Executes all the code and calls upon the other modules"""
 
+import os
+import random
+import sys
 import pygame
 
-
 from game_state import GameState
-from graphics import Graphics
+from graphics import Graphics, GraphicsInstructions
 from audio import Audio
 from inputs import KeyboardState
-
-
-def check_invariants(game: GameState, graphics: Graphics):
-    """Makes sure that certain conditions are true, so that the game is consistent"""
-    assert game.settings.graphics_settings == graphics.graphics_settings
-    if game.settings_state != None:
-        assert game.settings == game.settings_state.settings
+from common import Constants, GameFsmState
+from performance import FrameSkipper, PerformanceStats
+from allocation import AllocationProfiler
+from replay import InputTrace
+from spectator import SpectatorServer
+from invariants import InvariantChecker
+from level import LevelData
+import tracing
+
+
+def performance_counts(
+    game: GameState, audio_instructions, frame_skipper: FrameSkipper
+) -> dict[str, int | str]:
+    """The object counts shown in the performance HUD, and the speed the game runs at"""
+    core_game_state = game.core_game_state
+    if core_game_state == None:
+        return {"sounds": len(audio_instructions.sound_queue)}
+    return {
+        "substeps": core_game_state.last_update_repetitions,
+        # Game time given up over the whole game because frames were too long to simulate, see CoreGameState
+        "dropped": "{:.0f} ms".format(core_game_state.dropped_time),
+        "blocks": core_game_state.num_blocks(),
+        "powerups": len(core_game_state.powerups),
+        "sounds": len(audio_instructions.sound_queue),
+        "speed": "{:.2f}x of {:g}x".format(frame_skipper.speed_up(), game.time_scale),
+        "skipped frames": frame_skipper.skipped_frames,
+    }
 
 
 def GameLoop():
     """The main loop of the game. Initializes classes and repeatedly updates them"""
-    game = GameState()
+    # Setting BREAKOUT_RECORD records the inputs of the session so it can be replayed, see replay.py
+    input_trace = None
+    if os.environ.get("BREAKOUT_RECORD"):
+        input_trace = InputTrace(random.randrange(2**63))
+        random.seed(input_trace.seed)
+
+    # Setting BREAKOUT_LEVEL to a level file (text or compiled, see level.py) plays it instead of the default level
+    level = None
+    if os.environ.get("BREAKOUT_LEVEL"):
+        try:
+            level = LevelData.load(os.environ["BREAKOUT_LEVEL"])
+        except (OSError, ValueError) as error:
+            sys.exit(
+                "Can't load level {}: {}".format(os.environ["BREAKOUT_LEVEL"], error)
+            )
+
+    game = GameState(level)
     clock = pygame.time.Clock()
     audio = Audio()
     graphics = Graphics(game.settings.graphics_settings)
     keyboard_state = KeyboardState()
 
+    # Setting BREAKOUT_ALLOCATIONS prints what each stage of a frame allocates, see allocation.py
+    allocation_profiler = None
+    if os.environ.get("BREAKOUT_ALLOCATIONS"):
+        allocation_profiler = AllocationProfiler()
+        allocation_profiler.start()
+    performance_stats = PerformanceStats(allocation_profiler)
+    frame_skipper = FrameSkipper()
+    invariant_checker = InvariantChecker()
+
+    # Setting BREAKOUT_SPECTATE to a port streams the game to spectators, see spectator.py. Only spectators on this
+    # machine can connect, unless BREAKOUT_SPECTATE_HOST sets the address to serve on (like 0.0.0.0 for any)
+    spectator_server = None
+    if os.environ.get("BREAKOUT_SPECTATE"):
+        spectator_server = SpectatorServer(
+            os.environ.get("BREAKOUT_SPECTATE_HOST", "127.0.0.1"),
+            int(os.environ["BREAKOUT_SPECTATE"]),
+        )
+        spectator_server.start()
+
     while not game.game_exit:
         clock.tick(game.settings.fps)
 
         total_delta_t = clock.get_time()
+        performance_stats.start_frame(total_delta_t)
+        if input_trace != None:
+            input_trace.record(total_delta_t, keyboard_state)
 
         audio_instructions, graphics_instructions = game.update(
             total_delta_t, keyboard_state
         )
+        performance_stats.end_stage("update")
+        if game.core_game_state != None and game.game_fsm_state == GameFsmState.PLAY:
+            frame_skipper.record(
+                total_delta_t, game.core_game_state.last_simulated_time
+            )
 
         audio.run(audio_instructions)
-        graphics.render(graphics_instructions)
-
+        performance_stats.end_stage("audio")
+
+        if pygame.K_F3 in keyboard_state.new_keys_pressed:
+            performance_stats.visible = not performance_stats.visible
+        if pygame.K_F4 in keyboard_state.new_keys_pressed:
+            tracing.flush()
+        if performance_stats.visible:
+            graphics_instructions += GraphicsInstructions(
+                [],
+                [
+                    performance_stats.overlay(
+                        performance_counts(game, audio_instructions, frame_skipper)
+                    )
+                ],
+            )
+        # Fast-forwarding skips drawing frames when the physics needs the time
+        render = frame_skipper.should_render(
+            game.time_scale,
+            1000 / game.settings.fps,
+            performance_stats.last("update"),
+        )
+        if render:
+            graphics.render(graphics_instructions)
+        else:
+            graphics.skip(graphics_instructions)
+        if spectator_server != None:
+            spectator_server.publish(graphics_instructions.scene_changes)
+        performance_stats.end_stage("render")
+        if render:
+            frame_skipper.rendered(performance_stats.last("render"))
+
+        if game.is_idle():
+            keyboard_state.wait_for_pygame_events(Constants.idle_wait_timeout)
+            # The time spent waiting is not game time. Without this the first frame after unpausing
+            # would get the whole pause as its delta
+            clock.tick()
+        # The wait (up to Constants.idle_wait_timeout) is timed as its own stage, so it doesn't swamp events
+        performance_stats.end_stage("idle")
         keyboard_state.handle_pygame_events()
-        check_invariants(game, graphics)
+        performance_stats.end_stage("events")
+
+        invariant_checker.check(game, graphics)
+        performance_stats.end_stage("invariants")
+        performance_stats.end_frame()
+
+    if input_trace != None:
+        input_trace.save(os.environ["BREAKOUT_RECORD"])
+    if spectator_server != None:
+        spectator_server.stop()
 
 
 def main():
@@ -0,0 +1,113 @@
+"""Provides a particle system for visual effects, like the debris of broken blocks
+
+Particles are kept in preallocated NumPy arrays (position, velocity, age, lifetime, color), with the live ones
+packed at the front. Each frame they are all moved with a few vectorized operations, the ones that expired are
+compacted away, and the rest are written straight into the pixels of the screen in one batch. This way tens of
+thousands of particles cost about as much as a handful of draw calls, see benchmarks/particles.py.
+
+Particles are purely visual. They use their own random generator, so they never disturb the game's randomness.
+
+NumPy is optional. Without it PARTICLES_AVAILABLE is False, and Graphics draws no particles.
+"""
+
+import math
+
+from common import Color, Constants
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PARTICLES_AVAILABLE = numpy != None
+
+
+class ParticleSystem:
+    """Holds up to capacity particles, moving them and drawing them in batches"""
+
+    def __init__(self, capacity: int, seed: int = None):
+        self.capacity = capacity
+        # The number of live particles, which are the first count entries of each array
+        self.count = 0
+        self.__positions = numpy.zeros((capacity, 2), numpy.float32)
+        self.__velocities = numpy.zeros((capacity, 2), numpy.float32)
+        self.__ages = numpy.zeros(capacity, numpy.float32)
+        self.__lifetimes = numpy.ones(capacity, numpy.float32)
+        self.__colors = numpy.zeros((capacity, 3), numpy.float32)
+        self.__rng = numpy.random.default_rng(seed)
+
+    def emit(self, x: float, y: float, count: int, color: Color):
+        """Sends out a burst of particles from a point, in all directions
+
+        When the system is full, the particles that don't fit are not emitted
+        """
+        count = min(count, self.capacity - self.count)
+        if count <= 0:
+            return
+        new = slice(self.count, self.count + count)
+        angles = self.__rng.uniform(0, 2 * math.pi, count)
+        speeds = self.__rng.uniform(0.2, 1, count) * Constants.particle_speed
+        self.__positions[new] = (x, y)
+        self.__velocities[new, 0] = numpy.cos(angles) * speeds
+        self.__velocities[new, 1] = numpy.sin(angles) * speeds
+        self.__ages[new] = 0
+        self.__lifetimes[new] = (
+            self.__rng.uniform(0.5, 1, count) * Constants.particle_lifetime
+        )
+        self.__colors[new] = color
+        self.count += count
+
+    def update(self, delta_t: float):
+        """Moves the particles on by delta_t milliseconds, and removes the ones that expired"""
+        count = self.count
+        if count == 0 or delta_t == 0:
+            return
+        velocities = self.__velocities[:count]
+        velocities[:, 1] += Constants.gravity * delta_t
+        self.__positions[:count] += velocities * delta_t
+        ages = self.__ages[:count]
+        ages += delta_t
+
+        alive = ages < self.__lifetimes[:count]
+        alive_count = int(numpy.count_nonzero(alive))
+        if alive_count < count:
+            for values in [
+                self.__positions,
+                self.__velocities,
+                self.__ages,
+                self.__lifetimes,
+                self.__colors,
+            ]:
+                values[:alive_count] = values[:count][alive]
+            self.count = alive_count
+
+    def clear(self):
+        """Removes every particle"""
+        self.count = 0
+
+    def draw(
+        self,
+        pixels,
+        scaling: float,
+        origin: tuple[float, float],
+        bounds: tuple[int, int, int, int],
+    ):
+        """Writes the particles into an array of pixels (as from pygame.surfarray.pixels3d), fading them as they age
+
+        Game coordinates become pixels as x * scaling + origin. Particles outside bounds (left, top, right, bottom,
+        in pixels) are not drawn
+        """
+        count = self.count
+        if count == 0:
+            return
+        size = max(1, round(scaling * Constants.particle_size))
+        xs = (self.__positions[:count, 0] * scaling + origin[0]).astype(numpy.int32)
+        ys = (self.__positions[:count, 1] * scaling + origin[1]).astype(numpy.int32)
+        left, top, right, bottom = bounds
+        inside = (xs >= left) & (xs < right - size) & (ys >= top) & (ys < bottom - size)
+        xs, ys = xs[inside], ys[inside]
+        fade = 1 - self.__ages[:count][inside] / self.__lifetimes[:count][inside]
+        colors = (self.__colors[:count][inside] * fade[:, None]).astype(numpy.uint8)
+        for dx in range(size):
+            for dy in range(size):
+                pixels[xs + dx, ys + dy] = colors
@@ -0,0 +1,173 @@
+"""Provides classes to measure how long each stage of a frame takes, and the UI element that displays it"""
+
+from collections import deque
+from dataclasses import dataclass
+import time
+
+from allocation import AllocationProfiler, StageAllocations
+from common import Constants
+import tracing
+
+
+@dataclass
+class PerformanceOverlay:
+    """The performance HUD, as a UI element for Graphics to render
+
+    The text lines only change every Constants.hud_refresh_interval milliseconds, so that Graphics can reuse
+    the surfaces it rendered them to instead of rendering text every frame
+    """
+
+    lines: list[str]
+    frame_times: list[float]
+    x: float
+    y: float
+
+
+class PerformanceStats:
+    """Keeps rolling timings of each stage of the main loop
+
+    GameLoop marks the start of each frame and the end of each stage, whether or not the HUD is visible,
+    so that the numbers are already warmed up when it is turned on. If given an allocation profiler,
+    it also attributes allocations to each stage and prints a report every Constants.allocation_report_interval frames
+    """
+
+    # idle is the time spent asleep waiting for input on static screens, which is nothing during play
+    stages = ["update", "audio", "render", "idle", "events", "invariants"]
+
+    def __init__(self, allocation_profiler: AllocationProfiler = None):
+        self.visible = False
+        self.allocation_profiler = allocation_profiler
+        self.__allocation_totals = {}
+        self.__frames_since_report = 0
+        self.__frame_start = 0
+        self.__stage_start = 0
+        self.__timings = {
+            stage: deque(maxlen=Constants.hud_window) for stage in self.stages
+        }
+        self.frame_times = deque(maxlen=Constants.hud_graph_frames)
+        self.__lines = []
+        self.__since_refresh = Constants.hud_refresh_interval
+
+    def start_frame(self, milliseconds: float):
+        """Starts timing a new frame, recording the total time between this frame and the last one"""
+        self.frame_times.append(milliseconds)
+        self.__since_refresh += milliseconds
+        self.__frame_start = self.__stage_start = time.perf_counter()
+        if self.allocation_profiler != None:
+            self.allocation_profiler.checkpoint("between frames")
+
+    def end_stage(self, stage: str):
+        """Records how long a stage took this frame, and what it allocated"""
+        now = time.perf_counter()
+        self.__timings[stage].append(1000 * (now - self.__stage_start))
+        self.__stage_start = now
+        if self.allocation_profiler != None:
+            self.allocation_profiler.checkpoint(stage)
+
+    def end_frame(self):
+        """Finishes the frame"""
+        tracing.record("frame", self.__frame_start, time.perf_counter())
+        if self.allocation_profiler != None:
+            self.__add_allocations(self.allocation_profiler.end_frame())
+
+    def __add_allocations(self, frame: dict[str, StageAllocations]):
+        """Adds a frame's allocations to the running totals, printing a report once enough frames have been added"""
+        for stage, allocations in frame.items():
+            totals = self.__allocation_totals.setdefault(stage, StageAllocations())
+            totals.allocated += allocations.allocated
+            totals.retained += allocations.retained
+            for generation in range(3):
+                totals.collections[generation] += allocations.collections[generation]
+
+        self.__frames_since_report += 1
+        if self.__frames_since_report == Constants.allocation_report_interval:
+            frames = self.__frames_since_report
+            print("Allocations per frame, averaged over {} frames".format(frames))
+            for stage, totals in self.__allocation_totals.items():
+                print(
+                    "    {:<16} allocated {:>9.0f} B  retained {:>7.0f} B  collections {}".format(
+                        stage,
+                        totals.allocated / frames,
+                        totals.retained / frames,
+                        totals.collections,
+                    )
+                )
+            self.__allocation_totals = {}
+            self.__frames_since_report = 0
+
+    def last(self, stage: str) -> float:
+        """How long a stage took in the latest frame, in milliseconds"""
+        timings = self.__timings[stage]
+        return timings[-1] if timings else 0
+
+    def average(self, stage: str) -> float:
+        """The average time a stage took over the last Constants.hud_window frames, in milliseconds"""
+        timings = self.__timings[stage]
+        return sum(timings) / len(timings) if timings else 0
+
+    def overlay(self, counts: dict[str, int | str]) -> PerformanceOverlay:
+        """Builds the HUD, showing stage timings and the given object counts"""
+        if self.__since_refresh >= Constants.hud_refresh_interval:
+            self.__since_refresh = 0
+            frame_time = (
+                sum(self.frame_times) / len(self.frame_times) if self.frame_times else 0
+            )
+            self.__lines = ["frame {:6.2f} ms".format(frame_time)]
+            self.__lines += [
+                "{} {:6.2f} ms".format(stage, self.average(stage))
+                for stage in self.stages
+            ]
+            self.__lines += [
+                "{} {}".format(name, count) for name, count in counts.items()
+            ]
+
+        return PerformanceOverlay(self.__lines, list(self.frame_times), 5, 5)
+
+
+class FrameSkipper:
+    """Decides which frames to draw while the game runs faster than real time, and measures the speed achieved
+
+    Fast-forwarding runs more physics substeps each frame (see CoreGameState.update). When the substeps and rendering
+    no longer fit in a frame together, frames are skipped (Graphics still takes in their instructions) so that the
+    time goes to the physics, rather than the physics getting less accurate. At most Constants.max_skipped_frames
+    frames are skipped in a row, so the screen keeps moving
+    """
+
+    def __init__(self):
+        # Frames skipped since the game started
+        self.skipped_frames = 0
+        self.__skipped_in_a_row = 0
+        # How long the latest frame that was drawn took to render, in milliseconds
+        self.__render_time = 0
+        # Real and game time of the last Constants.hud_window frames of play, in milliseconds
+        self.__real_times = deque(maxlen=Constants.hud_window)
+        self.__game_times = deque(maxlen=Constants.hud_window)
+
+    def should_render(
+        self, time_scale: float, frame_budget: float, update_time: float
+    ) -> bool:
+        """Whether to draw a frame, given how long its update took and how long a frame may take, in milliseconds"""
+        if (
+            time_scale <= 1
+            or update_time + self.__render_time <= frame_budget
+            or self.__skipped_in_a_row >= Constants.max_skipped_frames
+        ):
+            self.__skipped_in_a_row = 0
+            return True
+        self.__skipped_in_a_row += 1
+        self.skipped_frames += 1
+        return False
+
+    def rendered(self, render_time: float):
+        """Records how long drawing a frame took, in milliseconds"""
+        self.__render_time = render_time
+
+    def record(self, real_time: float, game_time: float):
+        """Records how much game time a frame of play simulated in how much real time, in milliseconds"""
+        self.__real_times.append(real_time)
+        self.__game_times.append(game_time)
+
+    def speed_up(self) -> float:
+        """How many times faster than real time the game actually ran, over the last frames of play"""
+        real_time = sum(self.__real_times)
+        return sum(self.__game_times) / real_time if real_time > 0 else 0
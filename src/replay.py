@@ -0,0 +1,130 @@
+"""Provides recording and replaying of the inputs of a session
+
+A trace holds the random seed the session started with and, for every frame, the frame time and the keys
+GameState saw. Since everything random in the game comes from the random module, replaying a trace through
+a GameState seeded the same way plays the same game again, without a window or a person.
+
+Sessions are recorded by setting the BREAKOUT_RECORD environment variable to the path to write the trace to.
+
+Traces are stored compactly: each frame is its frame time plus the keys only if they changed since the last frame,
+and the whole thing is zlib compressed. A minute of play takes a few kilobytes.
+"""
+
+import random
+import struct
+import time
+import zlib
+from typing import Callable
+
+from common import GameFsmState
+from game_state import GameState
+from inputs import KeyboardState
+
+MAGIC = b"BKTR"
+VERSION = 1
+HEADER = struct.Struct("<4sHQI")
+# frame time in milliseconds, and whether the keys changed
+FRAME = struct.Struct("<H?")
+# number of newly pressed keys, number of currently pressed keys
+KEY_COUNTS = struct.Struct("<BB")
+KEY = struct.Struct("<i")
+
+
+class InputTrace:
+    """The inputs of a session: its seed, and the frame time and keys of each frame"""
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.frames = []
+
+    def record(self, delta_t: int, keyboard_state: KeyboardState):
+        """Adds a frame, with the keys GameState is about to see"""
+        self.frames.append(
+            (
+                delta_t,
+                frozenset(keyboard_state.new_keys_pressed),
+                frozenset(keyboard_state.currently_pressed_keys),
+            )
+        )
+
+    def to_bytes(self) -> bytes:
+        """Returns the compressed trace"""
+        parts = [HEADER.pack(MAGIC, VERSION, self.seed, len(self.frames))]
+        previous_keys = (frozenset(), frozenset())
+        for delta_t, new_keys, current_keys in self.frames:
+            changed = (new_keys, current_keys) != previous_keys
+            parts.append(FRAME.pack(min(delta_t, 65535), changed))
+            if changed:
+                parts.append(KEY_COUNTS.pack(len(new_keys), len(current_keys)))
+                parts += [KEY.pack(key) for key in sorted(new_keys)]
+                parts += [KEY.pack(key) for key in sorted(current_keys)]
+                previous_keys = (new_keys, current_keys)
+        return zlib.compress(b"".join(parts), 9)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "InputTrace":
+        """Reads a compressed trace. Raises ValueError if it is not one"""
+        data = zlib.decompress(data)
+        magic, version, seed, num_frames = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an input trace")
+        if version != VERSION:
+            raise ValueError("Unsupported trace version {}".format(version))
+        offset = HEADER.size
+
+        trace = cls(seed)
+        new_keys, current_keys = frozenset(), frozenset()
+        for _ in range(num_frames):
+            delta_t, changed = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            if changed:
+                num_new, num_current = KEY_COUNTS.unpack_from(data, offset)
+                offset += KEY_COUNTS.size
+                keys = [
+                    KEY.unpack_from(data, offset + KEY.size * index)[0]
+                    for index in range(num_new + num_current)
+                ]
+                offset += KEY.size * (num_new + num_current)
+                new_keys = frozenset(keys[:num_new])
+                current_keys = frozenset(keys[num_new:])
+            trace.frames.append((delta_t, new_keys, current_keys))
+        return trace
+
+    def save(self, path: str):
+        """Writes the trace to a file"""
+        with open(path, "wb") as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "InputTrace":
+        """Reads a trace from a file"""
+        with open(path, "rb") as file:
+            return cls.from_bytes(file.read())
+
+
+def replay(
+    trace: InputTrace,
+    on_frame: Callable[[GameState, GameFsmState, float], None] = None,
+) -> GameState:
+    """Plays a trace through a new GameState, without rendering or audio
+
+    on_frame is called after every frame with the GameState, the state it was in during that frame
+    and how long GameState.update took, in seconds
+    """
+    random.seed(trace.seed)
+    game = GameState()
+    keyboard_state = KeyboardState()
+
+    for delta_t, new_keys, current_keys in trace.frames:
+        keyboard_state.new_keys_pressed = set(new_keys)
+        keyboard_state.currently_pressed_keys = set(current_keys)
+        fsm_state = game.game_fsm_state
+        start = time.perf_counter()
+        game.update(delta_t, keyboard_state)
+        update_time = time.perf_counter() - start
+        if on_frame != None:
+            on_frame(game, fsm_state, update_time)
+        if game.game_exit:
+            break
+
+    return game
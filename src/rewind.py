@@ -0,0 +1,265 @@
+"""Provides a ring buffer of recent frames, so that the game can be rewound
+
+Every frame is stored as either a keyframe (a full snapshot, see snapshot.py) or a delta against the frame before it.
+A delta holds the paddle, the ball, the powerups and only those blocks that changed or were destroyed, so most
+frames cost a couple of hundred bytes no matter how large the board is. CoreGameState tells the buffer which blocks
+those are, so recording a delta takes the same time however large the board is too. Keyframes of levels reuse the
+packed records of the blocks, which are kept up to date from the deltas, rather than packing every block again.
+In endless mode every block scrolls down each frame. A delta holds how far, and blocks that did nothing but scroll
+are not stored. A keyframe is stored every keyframe_interval frames, so restoring any frame means loading one
+keyframe and applying at most keyframe_interval - 1 deltas.
+"""
+
+import struct
+from typing import TYPE_CHECKING
+
+from snapshot import (
+    save_snapshot,
+    load_snapshot,
+    pack_paddle,
+    unpack_paddle,
+    pack_ball,
+    unpack_ball,
+    pack_block,
+    unpack_block,
+    pack_powerup,
+    unpack_powerup,
+    pack_revive,
+    unpack_revive,
+    PADDLE,
+    BALL,
+    BLOCK,
+    POWERUP,
+    REVIVE_SIZE,
+)
+
+if TYPE_CHECKING:
+    from core_game_state import CoreGameState
+
+KEYFRAME = b"K"
+DELTA = b"D"
+
+# lives, new_life, number of destroyed blocks, number of changed blocks, number of powerups,
+# the next row, scroll offset and last scroll of the endless mode field (0 when not in endless mode),
+# and the clock and number of blocks waiting to revive of the block effects
+DELTA_HEADER = struct.Struct("<i?IIIqdddI")
+BLOCK_ID = struct.Struct("<ii")
+
+
+class RewindBuffer:
+    """Stores the last capacity frames of a CoreGameState and restores any of them on request"""
+
+    def __init__(self, capacity: int, keyframe_interval: int):
+        self.capacity = capacity
+        self.keyframe_interval = keyframe_interval
+        self.__frames = [None] * capacity
+        self.__newest = -1
+        self.__count = 0
+        self.__frames_since_keyframe = 0
+        # Deltas need a frame before them, so the first frame (and the first after clear()) is a keyframe
+        self.__keyframe_due = True
+        # The packed records of the blocks of a level as of the last recorded frame, by block id, or None when they
+        # have to be packed from the blocks. Endless blocks all move every frame, so they are always packed
+        self.__block_records = None
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def memory_usage(self) -> int:
+        """Returns the number of bytes of frame data currently held"""
+        return sum(len(frame) for frame in self.__frames if frame != None)
+
+    def clear(self):
+        """Forgets all recorded frames, e.g. when the game is replaced by a quickload"""
+        self.__frames = [None] * self.capacity
+        self.__newest = -1
+        self.__count = 0
+        self.__keyframe_due = True
+        self.__block_records = None
+
+    def record(self, core_game_state: "CoreGameState", changed_blocks: dict):
+        """Stores the current frame, as a keyframe or as a delta against the previous frame
+
+        changed_blocks holds the blocks that changed since the previous frame, by id, with None for the blocks that
+        went away. Blocks that only scrolled with the endless field need not be in it
+        """
+        destroyed = [
+            block_id for block_id, block in changed_blocks.items() if block == None
+        ]
+        changed = {
+            block_id: pack_block(block)
+            for block_id, block in changed_blocks.items()
+            if block != None
+        }
+        if self.__block_records != None and not self.__keyframe_due:
+            for block_id in destroyed:
+                self.__block_records.pop(block_id, None)
+            self.__block_records.update(changed)
+
+        if (
+            self.__keyframe_due
+            or self.__frames_since_keyframe >= self.keyframe_interval - 1
+        ):
+            if self.__keyframe_due:
+                self.__block_records = self.__pack_blocks(core_game_state)
+            frame = KEYFRAME + save_snapshot(
+                core_game_state,
+                (
+                    self.__block_records.values()
+                    if self.__block_records != None
+                    else None
+                ),
+            )
+            self.__frames_since_keyframe = 0
+            self.__keyframe_due = False
+        else:
+            frame = self.__encode_delta(
+                core_game_state, destroyed, list(changed.values())
+            )
+            self.__frames_since_keyframe += 1
+
+        self.__newest = (self.__newest + 1) % self.capacity
+        self.__frames[self.__newest] = frame
+        self.__count = min(self.__count + 1, self.capacity)
+
+    def rewind(self, core_game_state: "CoreGameState", frames: int) -> int:
+        """Restores the frame recorded the given number of frames ago, and forgets every frame after it
+
+        Going further back than the oldest restorable frame restores that frame instead.
+        The state of the random module is restored as of the nearest keyframe.
+        Returns how many frames were actually rewound.
+        """
+        frames = min(frames, self.__oldest_restorable_age())
+        if frames <= 0:
+            return 0
+
+        target = (self.__newest - frames) % self.capacity
+        keyframe_age = 0
+        while self.__frames[(target - keyframe_age) % self.capacity][:1] != KEYFRAME:
+            keyframe_age += 1
+
+        keyframe = self.__frames[(target - keyframe_age) % self.capacity]
+        load_snapshot(core_game_state, keyframe[1:])
+        blocks = {block.block_id: block for block in core_game_state.blocks}
+        for age in range(keyframe_age - 1, -1, -1):
+            self.__apply_delta(
+                core_game_state, blocks, self.__frames[(target - age) % self.capacity]
+            )
+        core_game_state.blocks = list(blocks.values())
+        core_game_state.block_effects.rebuild(core_game_state.blocks)
+
+        for age in range(frames):
+            self.__frames[(self.__newest - age) % self.capacity] = None
+        self.__newest = target
+        self.__count -= frames
+        self.__frames_since_keyframe = keyframe_age
+        self.__block_records = self.__pack_blocks(core_game_state)
+        return frames
+
+    def __oldest_restorable_age(self) -> int:
+        """How many frames ago the oldest frame that can still be rebuilt was recorded
+
+        The oldest frames in the buffer may be deltas whose keyframe has already been overwritten,
+        so the oldest restorable frame is the oldest keyframe in the buffer
+        """
+        for age in range(self.__count - 1, -1, -1):
+            if self.__frames[(self.__newest - age) % self.capacity][:1] == KEYFRAME:
+                return age
+        return 0
+
+    def __pack_blocks(self, core_game_state: "CoreGameState") -> dict | None:
+        """Packs the records of the blocks of a level, by block id. Endless mode keeps none"""
+        if core_game_state.endless_field != None:
+            return None
+        return {block.block_id: pack_block(block) for block in core_game_state.blocks}
+
+    def __encode_delta(
+        self,
+        core_game_state: "CoreGameState",
+        destroyed: list[tuple[int, int]],
+        changed: list[bytes],
+    ) -> bytes:
+        """Packs the parts of the current frame that differ from the previous one: the ids of the blocks that were
+        destroyed and the packed records of those that changed
+        """
+        endless_field = core_game_state.endless_field
+        block_effects = core_game_state.block_effects
+        # Blocks that only scrolled with the field are moved by the scroll when the delta is applied
+        scroll = endless_field.last_scroll if endless_field != None else 0
+
+        parts = [
+            DELTA,
+            DELTA_HEADER.pack(
+                core_game_state.lives,
+                core_game_state.new_life,
+                len(destroyed),
+                len(changed),
+                len(core_game_state.powerups),
+                endless_field.next_row if endless_field != None else 0,
+                endless_field.scroll_offset if endless_field != None else 0,
+                scroll,
+                block_effects.clock,
+                len(block_effects.revives),
+            ),
+            pack_paddle(core_game_state.paddle),
+            pack_ball(core_game_state.ball),
+        ]
+        parts += [BLOCK_ID.pack(*block_id) for block_id in destroyed]
+        parts += changed
+        parts += [pack_powerup(powerup) for powerup in core_game_state.powerups]
+        parts += [pack_revive(revive) for revive in block_effects.revives]
+        return b"".join(parts)
+
+    def __apply_delta(
+        self, core_game_state: "CoreGameState", blocks: dict, frame: bytes
+    ):
+        """Applies a delta frame on top of the state of the frame before it"""
+        offset = len(DELTA)
+        (
+            core_game_state.lives,
+            core_game_state.new_life,
+            num_destroyed,
+            num_changed,
+            num_powerups,
+            next_row,
+            scroll_offset,
+            scroll,
+            clock,
+            num_revives,
+        ) = DELTA_HEADER.unpack_from(frame, offset)
+        offset += DELTA_HEADER.size
+        if core_game_state.endless_field != None:
+            core_game_state.endless_field.next_row = next_row
+            core_game_state.endless_field.scroll_offset = scroll_offset
+        core_game_state.paddle = unpack_paddle(frame, offset)
+        offset += PADDLE.size
+        core_game_state.ball = unpack_ball(frame, offset)
+        offset += BALL.size
+
+        # Scrolls the blocks like the game did. Those that changed as well are replaced below
+        if scroll != 0:
+            for block in blocks.values():
+                block.y += scroll
+
+        # A block can come and go within a frame, like a new row of endless mode that is retired straight away
+        for _ in range(num_destroyed):
+            blocks.pop(BLOCK_ID.unpack_from(frame, offset), None)
+            offset += BLOCK_ID.size
+
+        for _ in range(num_changed):
+            block = unpack_block(frame, offset)
+            blocks[block.block_id] = block
+            offset += BLOCK.size
+
+        powerups = []
+        for _ in range(num_powerups):
+            powerups.append(unpack_powerup(frame, offset))
+            offset += POWERUP.size
+        core_game_state.powerups = powerups
+
+        revives = []
+        for _ in range(num_revives):
+            revives.append(unpack_revive(frame, offset))
+            offset += REVIVE_SIZE
+        core_game_state.block_effects.clock = clock
+        core_game_state.block_effects.revives = revives
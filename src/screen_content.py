@@ -25,7 +25,23 @@ def screen_content(
                 "Press P to play",
                 25,
                 Constants.game_width / 2,
-                0.5 * Constants.game_height,
+                0.47 * Constants.game_height,
+            )
+        )
+        answer.append(
+            Message(
+                "Press E for endless mode",
+                25,
+                Constants.game_width / 2,
+                0.54 * Constants.game_height,
+            )
+        )
+        answer.append(
+            Message(
+                "Press H for a huge board",
+                25,
+                Constants.game_width / 2,
+                0.61 * Constants.game_height,
             )
         )
         answer.append(
@@ -33,7 +49,7 @@ def screen_content(
                 "Press I for instructions",
                 25,
                 Constants.game_width / 2,
-                0.6 * Constants.game_height,
+                0.68 * Constants.game_height,
             )
         )
         answer.append(
@@ -41,7 +57,7 @@ def screen_content(
                 "Press S for settings",
                 25,
                 Constants.game_width / 2,
-                0.7 * Constants.game_height,
+                0.75 * Constants.game_height,
             )
         )
         answer.append(
@@ -49,7 +65,7 @@ def screen_content(
                 "Press Q to quit",
                 25,
                 Constants.game_width / 2,
-                0.8 * Constants.game_height,
+                0.82 * Constants.game_height,
             )
         )
 
@@ -70,6 +86,14 @@ def screen_content(
                 0.75 * Constants.game_height,
             )
         )
+        answer.append(
+            Message(
+                "F5 to quicksave, F9 to quickload, Left arrow to rewind, [ and ] to change speed",
+                15,
+                Constants.game_width / 2,
+                0.85 * Constants.game_height,
+            )
+        )
 
     elif game_fsm_state == GameFsmState.GAME_OVER:
         answer.append(
@@ -134,7 +158,7 @@ def screen_content(
         )
         answer.append(
             Message(
-                "Press A and D to move the paddle and P to pause",
+                "Press A and D to move the paddle, P to pause and O to let the autopilot play",
                 15,
                 Constants.game_width / 2,
                 0.2 * Constants.game_height,
@@ -9,7 +9,7 @@ from common import Settings, Constants
 from inputs import KeyboardState
 
 
-@dataclass
+@dataclass(slots=True)
 class SettingsSelector:
     """Data for the settings selector, which indicates which setting to change"""
 
@@ -0,0 +1,313 @@
+"""Provides functions to save the state of a game into a compact binary snapshot, and restore it again
+
+A snapshot is a fixed layout buffer built with struct, instead of a pickle of the dataclasses in common.
+This keeps it small and quick to build, which matters because snapshots are used for quicksaves and
+can be used for anything else that needs to store many copies of the game state.
+
+Layout (all little-endian):
+    header      magic, format version
+    state       lives, new_life, and the clock of the block effects
+    endless     whether the game is in endless mode, and the seed, next row and scroll offset of its field
+    paddle      one PADDLE record
+    ball        one BALL record (with a flag for whether there is a ball at all)
+    counts      number of blocks, number of powerups, number of blocks waiting to revive
+    blocks      one BLOCK record per block, in the order of CoreGameState.blocks (rewind keyframes may hold them in
+                another order, see rewind.py)
+    powerups    one POWERUP record per powerup
+    revives     one REVIVE record per block waiting to revive, in the order of their heap
+    rng         the state of the random module
+"""
+
+from array import array
+import random
+import struct
+from typing import TYPE_CHECKING, Collection, Tuple
+
+from level import EndlessField
+from common import (
+    Colors,
+    Paddle,
+    Ball,
+    BallModifier,
+    Block,
+    BlockType,
+    Powerup,
+    PowerupType,
+)
+
+if TYPE_CHECKING:
+    from core_game_state import CoreGameState
+
+MAGIC = b"BKSV"
+VERSION = 3
+
+HEADER = struct.Struct("<4sH")
+STATE = struct.Struct("<i?d")
+ENDLESS = struct.Struct("<?Qqd")
+PADDLE = struct.Struct("<6d")
+BALL = struct.Struct("<?5d?Bdii")
+COUNTS = struct.Struct("<III")
+BLOCK = struct.Struct("<4diiBiiBBB")
+POWERUP = struct.Struct("<B3d")
+# The revive time, followed by a BLOCK record
+REVIVE_TIME = struct.Struct("<d")
+REVIVE_SIZE = REVIVE_TIME.size + BLOCK.size
+RNG_EXTRA = struct.Struct("<i?d")
+
+# The Mersenne Twister state is 624 words plus a position
+RNG_WORDS = 625
+
+# Enums are stored as their index in these lists (0 is reserved for "no modifier")
+BALL_MODIFIERS = [None] + list(BallModifier)
+BLOCK_TYPES = list(BlockType)
+POWERUP_TYPES = list(PowerupType)
+
+
+def pack_endless_field(endless_field: EndlessField | None) -> bytes:
+    """Packs the state of the endless mode field into an ENDLESS record"""
+    if endless_field == None:
+        return ENDLESS.pack(False, 0, 0, 0)
+    return ENDLESS.pack(
+        True, endless_field.seed, endless_field.next_row, endless_field.scroll_offset
+    )
+
+
+def unpack_endless_field(data, offset: int = 0) -> EndlessField | None:
+    """Builds the endless mode field from an ENDLESS record"""
+    present, seed, next_row, scroll_offset = ENDLESS.unpack_from(data, offset)
+    if not present:
+        return None
+    return EndlessField(seed, next_row, scroll_offset)
+
+
+def pack_paddle(paddle: Paddle) -> bytes:
+    """Packs the paddle into a PADDLE record"""
+    return PADDLE.pack(
+        paddle.x, paddle.y, paddle.width, paddle.height, paddle.x_vel, paddle.lives
+    )
+
+
+def unpack_paddle(data, offset: int = 0) -> Paddle:
+    """Builds a paddle from a PADDLE record"""
+    x, y, width, height, x_vel, lives = PADDLE.unpack_from(data, offset)
+    return Paddle(x, y, width, height, x_vel, int(lives))
+
+
+def pack_ball(ball: Ball | None) -> bytes:
+    """Packs the ball into a BALL record. There is no ball between losing a life and starting the next one"""
+    if ball == None:
+        return BALL.pack(False, 0, 0, 0, 0, 0, False, 0, 0, 0, 0)
+    return BALL.pack(
+        True,
+        ball.x,
+        ball.y,
+        ball.x_vel,
+        ball.y_vel,
+        ball.radius,
+        ball.has_fallen,
+        BALL_MODIFIERS.index(ball.modifier),
+        ball.modifier_active_for,
+        ball.max_blocks_can_pierce,
+        ball.blocks_pierced,
+    )
+
+
+def unpack_ball(data, offset: int = 0) -> Ball | None:
+    """Builds a ball from a BALL record"""
+    (
+        present,
+        x,
+        y,
+        x_vel,
+        y_vel,
+        radius,
+        has_fallen,
+        modifier,
+        modifier_active_for,
+        max_blocks_can_pierce,
+        blocks_pierced,
+    ) = BALL.unpack_from(data, offset)
+    if not present:
+        return None
+    return Ball(
+        x,
+        y,
+        x_vel,
+        y_vel,
+        radius,
+        has_fallen,
+        BALL_MODIFIERS[modifier],
+        modifier_active_for,
+        max_blocks_can_pierce,
+        blocks_pierced,
+    )
+
+
+def pack_block(block: Block) -> bytes:
+    """Packs a block into a BLOCK record"""
+    return BLOCK.pack(
+        block.x,
+        block.y,
+        block.width,
+        block.height,
+        block.block_id[0],
+        block.block_id[1],
+        BLOCK_TYPES.index(block.block_type),
+        block.health,
+        block.protection,
+        *Colors.unpack(block.color),
+    )
+
+
+def unpack_block(data, offset: int = 0) -> Block:
+    """Builds a block from a BLOCK record"""
+    (
+        x,
+        y,
+        width,
+        height,
+        i,
+        j,
+        block_type,
+        health,
+        protection,
+        r,
+        g,
+        b,
+    ) = BLOCK.unpack_from(data, offset)
+    return Block(
+        x,
+        y,
+        width,
+        height,
+        (i, j),
+        BLOCK_TYPES[block_type],
+        health,
+        protection,
+        Colors.pack((r, g, b)),
+    )
+
+
+def pack_powerup(powerup: Powerup) -> bytes:
+    """Packs a powerup into a POWERUP record"""
+    return POWERUP.pack(
+        POWERUP_TYPES.index(powerup.powerup_type),
+        powerup.x,
+        powerup.y,
+        powerup.hitbox_radius,
+    )
+
+
+def unpack_powerup(data, offset: int = 0) -> Powerup:
+    """Builds a powerup from a POWERUP record"""
+    powerup_type, x, y, hitbox_radius = POWERUP.unpack_from(data, offset)
+    return Powerup(POWERUP_TYPES[powerup_type], x, y, hitbox_radius)
+
+
+def pack_revive(revive: Tuple[float, Tuple[int, int], Block]) -> bytes:
+    """Packs an entry of BlockEffects.revives into a REVIVE record"""
+    time, _, block = revive
+    return REVIVE_TIME.pack(time) + pack_block(block)
+
+
+def unpack_revive(data, offset: int = 0) -> Tuple[float, Tuple[int, int], Block]:
+    """Builds an entry of BlockEffects.revives from a REVIVE record"""
+    (time,) = REVIVE_TIME.unpack_from(data, offset)
+    block = unpack_block(data, offset + REVIVE_TIME.size)
+    return time, block.block_id, block
+
+
+def save_snapshot(
+    core_game_state: "CoreGameState", block_records: Collection[bytes] = None
+) -> bytes:
+    """Packs the game objects, lives and the random number generator state into a snapshot
+
+    Users that already hold a packed BLOCK record of every block (like the rewind buffer) can pass them as
+    block_records, to store them instead of packing the blocks again. They are stored in the order given
+    """
+    if block_records == None:
+        block_records = [pack_block(block) for block in core_game_state.blocks]
+    version, words, gauss_next = random.getstate()
+    block_effects = core_game_state.block_effects
+
+    parts = [
+        HEADER.pack(MAGIC, VERSION),
+        STATE.pack(
+            core_game_state.lives, core_game_state.new_life, block_effects.clock
+        ),
+        pack_endless_field(core_game_state.endless_field),
+        pack_paddle(core_game_state.paddle),
+        pack_ball(core_game_state.ball),
+        COUNTS.pack(
+            len(block_records),
+            len(core_game_state.powerups),
+            len(block_effects.revives),
+        ),
+    ]
+    parts += block_records
+    parts += [pack_powerup(powerup) for powerup in core_game_state.powerups]
+    parts += [pack_revive(revive) for revive in block_effects.revives]
+    parts.append(array("I", words).tobytes())
+    parts.append(
+        RNG_EXTRA.pack(
+            version, gauss_next != None, gauss_next if gauss_next != None else 0
+        )
+    )
+
+    return b"".join(parts)
+
+
+def load_snapshot(core_game_state: "CoreGameState", data: bytes):
+    """Restores a snapshot into an existing CoreGameState, replacing its game objects and lives
+
+    Raises ValueError if the data is not a snapshot this version of the game can read
+    """
+    magic, version = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a game snapshot")
+    if version != VERSION:
+        raise ValueError("Unsupported snapshot version {}".format(version))
+    offset = HEADER.size
+
+    lives, new_life, clock = STATE.unpack_from(data, offset)
+    offset += STATE.size
+    endless_field = unpack_endless_field(data, offset)
+    offset += ENDLESS.size
+    paddle = unpack_paddle(data, offset)
+    offset += PADDLE.size
+    ball = unpack_ball(data, offset)
+    offset += BALL.size
+    num_blocks, num_powerups, num_revives = COUNTS.unpack_from(data, offset)
+    offset += COUNTS.size
+
+    blocks = []
+    for _ in range(num_blocks):
+        blocks.append(unpack_block(data, offset))
+        offset += BLOCK.size
+
+    powerups = []
+    for _ in range(num_powerups):
+        powerups.append(unpack_powerup(data, offset))
+        offset += POWERUP.size
+
+    revives = []
+    for _ in range(num_revives):
+        revives.append(unpack_revive(data, offset))
+        offset += REVIVE_SIZE
+
+    words = array("I")
+    words.frombytes(data[offset : offset + RNG_WORDS * words.itemsize])
+    offset += RNG_WORDS * words.itemsize
+    rng_version, has_gauss, gauss_next = RNG_EXTRA.unpack_from(data, offset)
+
+    core_game_state.lives = lives
+    core_game_state.new_life = new_life
+    core_game_state.endless_field = endless_field
+    core_game_state.paddle = paddle
+    core_game_state.ball = ball
+    core_game_state.blocks = blocks
+    core_game_state.powerups = powerups
+    core_game_state.block_effects.clock = clock
+    core_game_state.block_effects.revives = revives
+    core_game_state.block_effects.rebuild(blocks)
+    random.setstate((rng_version, tuple(words), gauss_next if has_gauss else None))
@@ -0,0 +1,557 @@
+"""Provides live streaming of a game to spectators, as compact binary deltas of what Graphics is told to draw
+
+Each frame, SpectatorEncoder takes the scene changes of the frame's GraphicsInstructions (see
+CoreGameState.scene_changes) and writes only what changed: the paddle and ball if they moved, blocks that changed or
+appeared, the ids of blocks that broke, powerups that appeared or moved and the ids of powerups that were collected
+or fell off. Like Graphics, it keeps the scene between frames, so a frame costs the same to encode however many
+blocks there are. Positions are sent as 32 bit floats, which is plenty for drawing. A keyframe holds everything,
+and is sent when a spectator joins or has to catch up.
+
+SpectatorServer is an asyncio server, run in its own thread, that fans the frames out to every connected
+spectator. Each spectator has a bounded queue of frames. A spectator whose queue fills up (because its
+connection can't keep up) has its queue emptied and gets a keyframe with the next frame instead, so a slow
+spectator skips frames but never slows down the game or the other spectators.
+
+Messages on the wire are a 4 byte little-endian length followed by the frame.
+
+Streaming is turned on by setting the BREAKOUT_SPECTATE environment variable to the port to serve on. It is only
+served to this machine, unless BREAKOUT_SPECTATE_HOST is set to the address to serve on.
+Spectators watch with:
+    python spectator.py [host] [port]
+"""
+
+import asyncio
+import socket
+import struct
+import sys
+import threading
+import time
+
+import pygame
+
+from common import (
+    Ball,
+    BallModifier,
+    Block,
+    BlockType,
+    Colors,
+    Constants,
+    GameObject,
+    Paddle,
+    Powerup,
+    PowerupType,
+    SceneChanges,
+    PADDLE_SCENE_ID,
+    BALL_SCENE_ID,
+)
+from graphics import Graphics, GraphicsInstructions, Message
+
+KEYFRAME = b"K"
+DELTA = b"D"
+
+# kind, frame number, flags, then the number of changed blocks, broken blocks, changed powerups and removed powerups
+FRAME_HEADER = struct.Struct("<cIBIIII")
+PADDLE_CHANGED = 1
+BALL_CHANGED = 2
+BALL_REMOVED = 4
+PADDLE_REMOVED = 8
+
+# x, y, width, height, lives
+PADDLE_RECORD = struct.Struct("<4fB")
+# x, y, radius, whether it is piercing
+BALL_RECORD = struct.Struct("<3f?")
+# id, x, y, width, height, type, health, protection, color
+BLOCK_RECORD = struct.Struct("<ii4fBBB3B")
+BLOCK_ID = struct.Struct("<ii")
+# stream id, type, x, y, hitbox radius
+POWERUP_RECORD = struct.Struct("<IB3f")
+POWERUP_ID = struct.Struct("<I")
+LENGTH = struct.Struct("<I")
+
+BLOCK_TYPES = list(BlockType)
+POWERUP_TYPES = list(PowerupType)
+
+
+class SpectatorEncoder:
+    """Turns the scene changes of each frame into a delta against the previous frame"""
+
+    def __init__(self):
+        self.frame = 0
+        # The packed records of the scene as of the last frame encoded
+        self.__paddle = None
+        self.__ball = None
+        self.__blocks = {}
+        # Powerups get a stream id while they exist, by scene id, and are kept as (stream id, record)
+        self.__powerups = {}
+        self.__next_powerup_id = 0
+
+    def encode(self, scene_changes: SceneChanges | None) -> bytes:
+        """Returns the delta from the last frame encoded to this one
+
+        The scene changes are those Graphics is given for the frame, so no scene changes empty the scene like they
+        do for Graphics
+        """
+        self.frame += 1
+        paddle, ball = self.__paddle, self.__ball
+        previous_blocks, previous_powerups = self.__blocks, self.__powerups
+        reset = scene_changes == None or scene_changes.reset
+        if reset:
+            self.__paddle = self.__ball = None
+            self.__blocks = {}
+            self.__powerups = {}
+
+        broken_blocks = []
+        removed_powerups = []
+        changed_blocks = []
+        changed_powerups = []
+        if scene_changes != None:
+            for scene_id in scene_changes.destroyed:
+                if scene_id == PADDLE_SCENE_ID:
+                    self.__paddle = None
+                elif scene_id == BALL_SCENE_ID:
+                    self.__ball = None
+                elif scene_id in self.__powerups:
+                    removed_powerups.append(self.__powerups.pop(scene_id)[0])
+                elif self.__blocks.pop(scene_id, None) != None:
+                    broken_blocks.append(scene_id)
+
+            for scene_id, obj in scene_changes.changed.items():
+                if type(obj) == Block:
+                    record = pack_block(obj)
+                    # A reset sends every object again, most of them as they were
+                    if previous_blocks.get(scene_id) != record:
+                        changed_blocks.append(record)
+                    self.__blocks[scene_id] = record
+                elif type(obj) == Ball:
+                    self.__ball = pack_ball(obj)
+                elif type(obj) == Paddle:
+                    self.__paddle = pack_paddle(obj)
+                elif type(obj) == Powerup:
+                    if scene_id in self.__powerups:
+                        powerup_id = self.__powerups[scene_id][0]
+                    else:
+                        powerup_id = self.__next_powerup_id
+                        self.__next_powerup_id += 1
+                    record = pack_powerup(powerup_id, obj)
+                    changed_powerups.append(record)
+                    self.__powerups[scene_id] = (powerup_id, record)
+
+        if reset:
+            broken_blocks = [
+                block_id
+                for block_id in previous_blocks
+                if block_id not in self.__blocks
+            ]
+            removed_powerups = [
+                powerup_id
+                for scene_id, (powerup_id, _) in previous_powerups.items()
+                if scene_id not in self.__powerups
+            ]
+        else:
+            # A block can break and come back within a frame, like a reviver
+            broken_blocks = [
+                block_id for block_id in broken_blocks if block_id not in self.__blocks
+            ]
+
+        flags = 0
+        parts = []
+        if self.__paddle != paddle:
+            if self.__paddle == None:
+                flags |= PADDLE_REMOVED
+            else:
+                flags |= PADDLE_CHANGED
+                parts.append(self.__paddle)
+        if self.__ball != ball:
+            if self.__ball == None:
+                flags |= BALL_REMOVED
+            else:
+                flags |= BALL_CHANGED
+                parts.append(self.__ball)
+        parts += changed_blocks
+        parts += [BLOCK_ID.pack(*block_id) for block_id in broken_blocks]
+        parts += changed_powerups
+        parts += [POWERUP_ID.pack(powerup_id) for powerup_id in removed_powerups]
+
+        header = FRAME_HEADER.pack(
+            DELTA,
+            self.frame,
+            flags,
+            len(changed_blocks),
+            len(broken_blocks),
+            len(changed_powerups),
+            len(removed_powerups),
+        )
+        return header + b"".join(parts)
+
+    def keyframe(self) -> bytes:
+        """Returns the whole of the last frame encoded, for a spectator that has nothing to apply deltas to"""
+        flags = 0
+        parts = []
+        if self.__paddle != None:
+            flags |= PADDLE_CHANGED
+            parts.append(self.__paddle)
+        if self.__ball != None:
+            flags |= BALL_CHANGED
+            parts.append(self.__ball)
+        parts += self.__blocks.values()
+        parts += [record for _, record in self.__powerups.values()]
+        header = FRAME_HEADER.pack(
+            KEYFRAME,
+            self.frame,
+            flags,
+            len(self.__blocks),
+            0,
+            len(self.__powerups),
+            0,
+        )
+        return header + b"".join(parts)
+
+
+class SpectatorView:
+    """Rebuilds the objects to draw from the frames of a stream"""
+
+    def __init__(self):
+        self.frame = 0
+        self.paddle = None
+        self.ball = None
+        self.blocks = {}
+        self.powerups = {}
+        # Deltas can't be applied until a keyframe has been
+        self.synced = False
+
+    def apply(self, data: bytes):
+        """Applies a keyframe or delta"""
+        (
+            kind,
+            frame,
+            flags,
+            num_changed_blocks,
+            num_broken_blocks,
+            num_changed_powerups,
+            num_removed_powerups,
+        ) = FRAME_HEADER.unpack_from(data, 0)
+        if kind == KEYFRAME:
+            self.paddle = self.ball = None
+            self.blocks = {}
+            self.powerups = {}
+            self.synced = True
+        elif not self.synced:
+            return
+        self.frame = frame
+        offset = FRAME_HEADER.size
+
+        if flags & PADDLE_REMOVED:
+            self.paddle = None
+        elif flags & PADDLE_CHANGED:
+            self.paddle = unpack_paddle(data, offset)
+            offset += PADDLE_RECORD.size
+        if flags & BALL_REMOVED:
+            self.ball = None
+        elif flags & BALL_CHANGED:
+            self.ball = unpack_ball(data, offset)
+            offset += BALL_RECORD.size
+
+        for _ in range(num_changed_blocks):
+            block = unpack_block(data, offset)
+            self.blocks[block.block_id] = block
+            offset += BLOCK_RECORD.size
+        for _ in range(num_broken_blocks):
+            self.blocks.pop(BLOCK_ID.unpack_from(data, offset), None)
+            offset += BLOCK_ID.size
+
+        for _ in range(num_changed_powerups):
+            powerup_id, powerup = unpack_powerup(data, offset)
+            self.powerups[powerup_id] = powerup
+            offset += POWERUP_RECORD.size
+        for _ in range(num_removed_powerups):
+            self.powerups.pop(POWERUP_ID.unpack_from(data, offset)[0], None)
+            offset += POWERUP_ID.size
+
+    def objects(self) -> list[GameObject]:
+        """Returns the objects to draw, in the order CoreGameState gives them"""
+        objects = [obj for obj in [self.paddle, self.ball] if obj != None]
+        return objects + list(self.blocks.values()) + list(self.powerups.values())
+
+
+def pack_paddle(paddle: Paddle) -> bytes:
+    """Packs what is drawn of the paddle"""
+    return PADDLE_RECORD.pack(
+        paddle.x, paddle.y, paddle.width, paddle.height, min(paddle.lives, 255)
+    )
+
+
+def unpack_paddle(data, offset: int) -> Paddle:
+    """Builds a paddle to draw"""
+    x, y, width, height, lives = PADDLE_RECORD.unpack_from(data, offset)
+    return Paddle(x, y, width, height, 0, lives)
+
+
+def pack_ball(ball: Ball) -> bytes:
+    """Packs what is drawn of the ball"""
+    return BALL_RECORD.pack(
+        ball.x, ball.y, ball.radius, ball.modifier == BallModifier.PIERCING
+    )
+
+
+def unpack_ball(data, offset: int) -> Ball:
+    """Builds a ball to draw"""
+    x, y, radius, piercing = BALL_RECORD.unpack_from(data, offset)
+    return Ball(
+        x, y, 0, 0, radius, modifier=BallModifier.PIERCING if piercing else None
+    )
+
+
+def pack_block(block: Block) -> bytes:
+    """Packs what is drawn of a block, with its id"""
+    return BLOCK_RECORD.pack(
+        block.block_id[0],
+        block.block_id[1],
+        block.x,
+        block.y,
+        block.width,
+        block.height,
+        BLOCK_TYPES.index(block.block_type),
+        min(block.health, 255),
+        min(block.protection, 255),
+        *Colors.unpack(block.color),
+    )
+
+
+def unpack_block(data, offset: int) -> Block:
+    """Builds a block to draw"""
+    i, j, x, y, width, height, block_type, health, protection, r, g, b = (
+        BLOCK_RECORD.unpack_from(data, offset)
+    )
+    return Block(
+        x,
+        y,
+        width,
+        height,
+        (i, j),
+        BLOCK_TYPES[block_type],
+        health,
+        protection,
+        Colors.pack((r, g, b)),
+    )
+
+
+def pack_powerup(powerup_id: int, powerup: Powerup) -> bytes:
+    """Packs what is drawn of a powerup, with its stream id"""
+    return POWERUP_RECORD.pack(
+        powerup_id,
+        POWERUP_TYPES.index(powerup.powerup_type),
+        powerup.x,
+        powerup.y,
+        powerup.hitbox_radius,
+    )
+
+
+def unpack_powerup(data, offset: int) -> tuple[int, Powerup]:
+    """Builds a powerup to draw, returning it with its stream id"""
+    powerup_id, powerup_type, x, y, hitbox_radius = POWERUP_RECORD.unpack_from(
+        data, offset
+    )
+    return powerup_id, Powerup(POWERUP_TYPES[powerup_type], x, y, hitbox_radius)
+
+
+class Spectator:
+    """A connected spectator, with the frames waiting to be sent to it"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.queue = asyncio.Queue(Constants.spectator_queue_frames)
+        self.needs_keyframe = True
+        self.bytes_sent = 0
+
+
+class SpectatorServer:
+    """Streams frames to spectators from a background thread
+
+    publish() is called by the game loop each frame. Encoding happens there, and fanning the frame out to the
+    spectators happens on the server's event loop
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.spectators = []
+        self.encoder = SpectatorEncoder()
+
+        # Measurements, see benchmarks/spectator_fleet.py
+        self.frames = 0
+        self.encode_time = 0
+        self.fan_out_time = 0
+        self.resyncs = 0
+        self.bytes_sent = 0
+
+        self.__keyframe_wanted = False
+        self.__loop = None
+        self.__server = None
+        self.__thread = None
+
+    def start(self):
+        """Starts serving, returning once the server is listening. If port was 0, self.port is the port chosen"""
+        started = threading.Event()
+        self.__thread = threading.Thread(
+            target=self.__run, args=(started,), daemon=True
+        )
+        self.__thread.start()
+        started.wait()
+
+    def stop(self):
+        """Disconnects every spectator and stops the server"""
+        if self.__loop != None:
+            self.__loop.call_soon_threadsafe(self.__loop.stop)
+            self.__thread.join()
+            self.__loop = None
+
+    def publish(self, scene_changes: SceneChanges | None):
+        """Encodes a frame from the scene changes Graphics was given for it, and queues it for every spectator"""
+        start = time.perf_counter()
+        delta = self.encoder.encode(scene_changes)
+        keyframe = self.encoder.keyframe() if self.__keyframe_wanted else None
+        self.encode_time += time.perf_counter() - start
+        self.frames += 1
+        self.__loop.call_soon_threadsafe(self.__fan_out, delta, keyframe)
+
+    def __run(self, started: threading.Event):
+        """The server thread"""
+        loop = asyncio.new_event_loop()
+        self.__server = loop.run_until_complete(
+            asyncio.start_server(self.__handle_spectator, self.host, self.port)
+        )
+        self.port = self.__server.sockets[0].getsockname()[1]
+        self.__loop = loop
+        started.set()
+        loop.run_forever()
+
+        # Stopped: close the server, and hang up on every spectator without waiting for what is still buffered
+        self.__server.close()
+        for spectator in self.spectators:
+            spectator.writer.transport.abort()
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        loop.run_until_complete(self.__server.wait_closed())
+        loop.close()
+
+    def __fan_out(self, delta: bytes, keyframe: bytes | None):
+        """Queues a frame for every spectator, resynchronizing the ones that have fallen behind"""
+        start = time.perf_counter()
+        framed_delta = LENGTH.pack(len(delta)) + delta
+        framed_keyframe = (
+            LENGTH.pack(len(keyframe)) + keyframe if keyframe != None else None
+        )
+        for spectator in self.spectators:
+            if spectator.needs_keyframe:
+                if framed_keyframe == None:
+                    continue
+                frame = framed_keyframe
+                spectator.needs_keyframe = False
+            else:
+                frame = framed_delta
+
+            if spectator.queue.full():
+                # Deltas can't be skipped, so a spectator that is behind starts again from a keyframe
+                while not spectator.queue.empty():
+                    spectator.queue.get_nowait()
+                spectator.needs_keyframe = True
+                self.resyncs += 1
+            else:
+                spectator.queue.put_nowait(frame)
+
+        self.__keyframe_wanted = any(
+            spectator.needs_keyframe for spectator in self.spectators
+        )
+        self.fan_out_time += time.perf_counter() - start
+
+    async def __handle_spectator(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        """Sends queued frames to a spectator until it disconnects"""
+        spectator = Spectator(writer)
+        # Small buffers make a spectator that can't keep up show up in its queue (and get resynchronized) quickly,
+        # instead of seconds of stale frames piling up in the socket
+        connection = writer.get_extra_info("socket")
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, Constants.spectator_send_buffer
+        )
+        writer.transport.set_write_buffer_limits(Constants.spectator_send_buffer)
+        self.spectators.append(spectator)
+        self.__keyframe_wanted = True
+        try:
+            while True:
+                frame = await spectator.queue.get()
+                writer.write(frame)
+                # Waits while the connection's buffers are full, which lets this spectator's queue fill up
+                await writer.drain()
+                spectator.bytes_sent += len(frame)
+                self.bytes_sent += len(frame)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.spectators.remove(spectator)
+            writer.close()
+
+
+def read_frames(buffer: bytearray) -> list[bytes]:
+    """Takes every complete frame off the front of the buffer"""
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= LENGTH.size:
+        (length,) = LENGTH.unpack_from(buffer, offset)
+        if len(buffer) - offset - LENGTH.size < length:
+            break
+        frames.append(
+            bytes(buffer[offset + LENGTH.size : offset + LENGTH.size + length])
+        )
+        offset += LENGTH.size + length
+    del buffer[:offset]
+    return frames
+
+
+def watch(host: str, port: int):
+    """Connects to a game and draws it until the window is closed or the stream ends"""
+    pygame.init()
+    pygame.display.set_caption("Breakout (spectating)")
+    graphics = Graphics(Constants.default_settings.graphics_settings)
+    view = SpectatorView()
+    label = Message(
+        "SPECTATING", 15, Constants.game_width / 2, 0.97 * Constants.game_height
+    )
+
+    connection = socket.create_connection((host, port))
+    connection.settimeout(Constants.idle_wait_timeout / 1000)
+    buffer = bytearray()
+    watching = True
+    while watching:
+        try:
+            data = connection.recv(1 << 16)
+            if not data:
+                break
+            buffer += data
+        except socket.timeout:
+            pass
+
+        for frame in read_frames(buffer):
+            view.apply(frame)
+        graphics.render(GraphicsInstructions(view.objects(), [label]))
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                watching = False
+
+    connection.close()
+    pygame.quit()
+
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else Constants.spectator_port
+    watch(host, port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Provides BlockTiles, which draws the blocks of huge boards from pre-rendered tiles
+
+Drawing every block every frame costs time in proportion to the number of blocks. That is nothing for the 45 blocks
+of the original level, but too much for the tens of thousands of a huge board. Instead, the board is split into
+square chunks of Constants.tile_pixels pixels, and the blocks of each chunk are drawn once onto a tile. A frame only
+blits the tiles of the chunks the camera can see, and never looks at the others, so it costs the same however large
+the board is (see benchmarks/huge_board.py).
+
+A block that changes or breaks marks the tiles it is on as dirty, and they are drawn again when they are next seen.
+Tiles are kept in a least-recently-used cache of Constants.tile_cache_size, so their memory is bounded too.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Tuple
+
+import pygame
+
+from common import Block, Colors, Constants
+
+# Draws blocks onto a surface, given the scaling (pixels per game unit) and the pixel that game (0, 0) is at
+DrawBlocks = Callable[[pygame.Surface, float, float, float, list[Block]], None]
+
+# Tiles are drawn with a margin of this many pixels around the chunk, which is not blitted. pygame draws some shapes
+# that go past the edge of a surface (like polygons) with stray pixels along the edge, and these end up in the margin
+TILE_MARGIN = 1
+
+
+class BlockTiles:
+    """Draws blocks from tiles at one scaling. A new BlockTiles is needed when the scaling changes
+
+    Chunk (cx, cy) covers the Constants.tile_pixels square of pixels at (cx, cy) * Constants.tile_pixels,
+    counting from game (0, 0). Blocks are added and removed by scene id, like in Graphics
+    """
+
+    def __init__(self, scaling: float, draw_blocks: DrawBlocks):
+        self.scaling = scaling
+        self.__draw_blocks = draw_blocks
+        # The blocks on each chunk by scene id, and the chunks each block is on
+        self.__chunks = {}
+        self.__chunks_of = {}
+        # Tiles by chunk, least recently drawn first, and the chunks whose tiles have to be drawn again
+        self.__tiles = OrderedDict()
+        self.__dirty = set()
+        # Tiles of chunks that were evicted or emptied, kept to be reused instead of building new ones
+        self.__spare_tiles = []
+        # The number of tiles blitted by the last draw
+        self.last_drawn = 0
+
+    def __len__(self) -> int:
+        """The number of blocks"""
+        return len(self.__chunks_of)
+
+    def set(self, scene_id, block: Block):
+        """Adds a block, or replaces the block with the same scene id"""
+        self.remove(scene_id)
+        chunks = self.__chunks_covered(block)
+        self.__chunks_of[scene_id] = chunks
+        for chunk in chunks:
+            blocks = self.__chunks.get(chunk)
+            if blocks == None:
+                blocks = self.__chunks[chunk] = {}
+            blocks[scene_id] = block
+            if chunk in self.__tiles:
+                self.__dirty.add(chunk)
+
+    def remove(self, scene_id):
+        """Removes a block, if there is one with the scene id"""
+        for chunk in self.__chunks_of.pop(scene_id, ()):
+            blocks = self.__chunks[chunk]
+            del blocks[scene_id]
+            if len(blocks) == 0:
+                # Empty chunks have no tile, and are skipped when drawing
+                del self.__chunks[chunk]
+                tile = self.__tiles.pop(chunk, None)
+                if tile != None:
+                    self.__spare_tiles.append(tile)
+                self.__dirty.discard(chunk)
+            elif chunk in self.__tiles:
+                self.__dirty.add(chunk)
+
+    def draw(
+        self, surface: pygame.Surface, origin_x: int, origin_y: int, view: pygame.Rect
+    ):
+        """Blits the tiles of the chunks that are in view, with game (0, 0) at pixel (origin_x, origin_y)
+
+        Tiles that are not cached or are dirty are drawn first
+        """
+        tile_pixels = Constants.tile_pixels
+        chunks = self.__chunks
+        inside = pygame.Rect(TILE_MARGIN, TILE_MARGIN, tile_pixels, tile_pixels)
+        drawn = 0
+        for cx in range(
+            (view.left - origin_x) // tile_pixels,
+            (view.right - 1 - origin_x) // tile_pixels + 1,
+        ):
+            for cy in range(
+                (view.top - origin_y) // tile_pixels,
+                (view.bottom - 1 - origin_y) // tile_pixels + 1,
+            ):
+                if (cx, cy) not in chunks:
+                    continue
+                surface.blit(
+                    self.__tile((cx, cy)),
+                    (origin_x + cx * tile_pixels, origin_y + cy * tile_pixels),
+                    inside,
+                )
+                drawn += 1
+        self.last_drawn = drawn
+
+        # The tiles in view are never evicted, however many there are
+        while len(self.__tiles) > max(Constants.tile_cache_size, drawn):
+            chunk, tile = self.__tiles.popitem(last=False)
+            self.__dirty.discard(chunk)
+            self.__spare_tiles.append(tile)
+
+    def __tile(self, chunk: Tuple[int, int]) -> pygame.Surface:
+        """The tile of a chunk, drawing it if it is not cached or is dirty"""
+        tile = self.__tiles.get(chunk)
+        if tile == None:
+            if self.__spare_tiles:
+                tile = self.__spare_tiles.pop()
+            else:
+                size = Constants.tile_pixels + 2 * TILE_MARGIN
+                tile = pygame.Surface((size, size))
+            self.__tiles[chunk] = tile
+            self.__draw_tile(chunk, tile)
+        else:
+            self.__tiles.move_to_end(chunk)
+            if chunk in self.__dirty:
+                self.__draw_tile(chunk, tile)
+        return tile
+
+    def __draw_tile(self, chunk: Tuple[int, int], tile: pygame.Surface):
+        """Draws the blocks of a chunk onto its tile"""
+        tile.fill(Colors.dark_gray)
+        self.__draw_blocks(
+            tile,
+            self.scaling,
+            TILE_MARGIN - chunk[0] * Constants.tile_pixels,
+            TILE_MARGIN - chunk[1] * Constants.tile_pixels,
+            list(self.__chunks[chunk].values()),
+        )
+        self.__dirty.discard(chunk)
+
+    def __chunks_covered(self, block: Block) -> list[Tuple[int, int]]:
+        """The chunks a block is drawn on. Outlines can reach a pixel past the block, so that pixel counts too"""
+        tile_pixels = Constants.tile_pixels
+        scaling = self.scaling
+        return [
+            (cx, cy)
+            for cx in range(
+                int((block.x * scaling - 1) // tile_pixels),
+                int(((block.x + block.width) * scaling + 1) // tile_pixels) + 1,
+            )
+            for cy in range(
+                int((block.y * scaling - 1) // tile_pixels),
+                int(((block.y + block.height) * scaling + 1) // tile_pixels) + 1,
+            )
+        ]
@@ -0,0 +1,98 @@
+"""Provides optional tracing of the hot paths of the game, exported as Chrome trace JSON
+
+Tracing is turned on by setting the BREAKOUT_TRACE environment variable to the path the trace should be written to:
+    BREAKOUT_TRACE=trace.json python main.py
+Spans are kept in a fixed-size ring buffer and written out when the game exits or when F4 is pressed.
+The file can be opened in chrome://tracing or https://ui.perfetto.dev
+
+When tracing is off, traced() hands back the undecorated function, so the probes cost nothing at all
+"""
+
+from array import array
+import atexit
+import functools
+import json
+import os
+import time
+
+from common import Constants
+
+TRACE_PATH = os.environ.get("BREAKOUT_TRACE")
+
+
+class TraceBuffer:
+    """A ring buffer of spans (name, start, duration), preallocated so that recording does not allocate"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.__names = [""] * capacity
+        self.__starts = array("d", bytes(8 * capacity))
+        self.__durations = array("d", bytes(8 * capacity))
+        self.__next = 0
+        self.__count = 0
+
+    def record(self, name: str, start: float, end: float):
+        """Records a span. Times are in seconds, as returned by time.perf_counter()"""
+        index = self.__next
+        self.__names[index] = name
+        self.__starts[index] = start
+        self.__durations[index] = end - start
+        self.__next = (index + 1) % self.capacity
+        self.__count = min(self.__count + 1, self.capacity)
+
+    def chrome_trace(self) -> dict:
+        """Returns the recorded spans, oldest first, in the Chrome trace event format"""
+        first = (self.__next - self.__count) % self.capacity
+        events = []
+        for offset in range(self.__count):
+            index = (first + offset) % self.capacity
+            events.append(
+                {
+                    "name": self.__names[index],
+                    "ph": "X",
+                    "ts": 1e6 * self.__starts[index],
+                    "dur": 1e6 * self.__durations[index],
+                    "pid": 1,
+                    "tid": 1,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+buffer = TraceBuffer(Constants.trace_capacity) if TRACE_PATH != None else None
+
+
+def traced(name: str):
+    """Decorator that records a span each time the function runs, if tracing is on"""
+
+    def decorator(function):
+        if buffer == None:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                buffer.record(name, start, time.perf_counter())
+
+        return wrapper
+
+    return decorator
+
+
+def record(name: str, start: float, end: float):
+    """Records a span that is not a whole function call, like a frame of the main loop"""
+    if buffer != None:
+        buffer.record(name, start, end)
+
+
+def flush():
+    """Writes the recorded spans to the trace file, if tracing is on"""
+    if buffer != None:
+        with open(TRACE_PATH, "w") as file:
+            json.dump(buffer.chrome_trace(), file)
+
+
+atexit.register(flush)
@@ -0,0 +1,362 @@
+"""Provides a two player versus mode, played over the network with rollback netcode
+
+Each player has a board of their own, and whoever clears theirs first (or still has lives when the other runs
+out) wins. Both peers simulate both boards, in lockstep: frames have a fixed length (Constants.versus_frame_time),
+all randomness comes from a shared seed, so the same inputs always give the same games. Only inputs go over the
+network, one byte per player per frame.
+
+Waiting for the other player's input every frame would make the game as slow as the connection, so instead:
+    input delay     local input is applied Constants.versus_input_delay frames after it is pressed, which hides
+                    that much latency entirely
+    prediction      when a frame has to be simulated before the remote input for it arrived, the remote player is
+                    assumed to still be holding whatever they held last
+    rollback        when the real input arrives and differs from the prediction, the games are restored to the
+                    snapshot from before that frame (see snapshot.py) and resimulated up to the present
+A peer never gets more than Constants.versus_max_rollback frames ahead of the last frame it knows all inputs for;
+past that it waits.
+
+Inputs are sent over UDP. Every packet carries all the inputs the other peer hasn't acknowledged yet, so a lost
+packet costs nothing but a little latency. UdpLink can add artificial latency and loss, for testing over loopback.
+
+Two players on one machine:
+    python versus.py 0 7001 127.0.0.1 7002
+    python versus.py 1 7002 127.0.0.1 7001
+"""
+
+import heapq
+import random
+import socket
+import struct
+import sys
+import time
+
+import pygame
+
+from common import Constants, GameFsmState
+from core_game_state import CoreGameState
+from graphics import Graphics, GraphicsInstructions, Message
+from inputs import KeyboardState
+from level import LevelData
+from snapshot import load_snapshot, save_snapshot
+
+LEFT = 1
+RIGHT = 2
+
+# first frame of the inputs in the packet, how many frames of the receiver's inputs the sender has, number of inputs
+PACKET_HEADER = struct.Struct("<IIB")
+
+
+def encode_input(keys) -> int:
+    """Packs the keys that matter to the game into one byte"""
+    return (LEFT if pygame.K_a in keys else 0) | (RIGHT if pygame.K_d in keys else 0)
+
+
+def decode_input(bits: int) -> list[int]:
+    """The keys for CoreGameState.update from an encoded input"""
+    keys = []
+    if bits & LEFT:
+        keys.append(pygame.K_a)
+    if bits & RIGHT:
+        keys.append(pygame.K_d)
+    return keys
+
+
+class VersusSimulation:
+    """Both players' games, advanced together one fixed frame at a time
+
+    The games use the random module, whose state is kept with the simulation and swapped in around each step.
+    That way several simulations can run in one process (as in benchmarks/versus_loopback.py) without
+    disturbing each other's randomness
+    """
+
+    def __init__(self, seed: int, level: LevelData = None):
+        random.seed(seed)
+        self.games = [CoreGameState(level, record_rewind=False) for _ in range(2)]
+        for game in self.games:
+            game.ball.y_vel = Constants.init_y_vel_ball
+        self.__random_state = random.getstate()
+
+    def step(self, inputs: tuple[int, int]):
+        """Simulates one frame with each player's input"""
+        random.setstate(self.__random_state)
+        self.__step(inputs)
+        self.__random_state = random.getstate()
+
+    def __step(self, inputs: tuple[int, int]):
+        for game, bits in zip(self.games, inputs):
+            if game.game_over() or game.game_win():
+                continue
+            game.update(
+                Constants.versus_frame_time, decode_input(bits), GameFsmState.PLAY
+            )
+            # Like in the training environment, a lost ball is relaunched straight away
+            if game.start_new_life() and not game.game_over():
+                game.make_new_ball()
+                game.ball.y_vel = Constants.init_y_vel_ball
+
+    def save(self) -> tuple[bytes, bytes]:
+        """Snapshots both games (each snapshot also holds the random state)"""
+        random.setstate(self.__random_state)
+        return save_snapshot(self.games[0]), save_snapshot(self.games[1])
+
+    def load(self, snapshots: tuple[bytes, bytes]):
+        """Restores both games from save()"""
+        for game, snapshot in zip(self.games, snapshots):
+            load_snapshot(game, snapshot)
+        self.__random_state = random.getstate()
+
+    def winner(self) -> int | None:
+        """The player who has won, if either has"""
+        for player in range(2):
+            other = self.games[1 - player]
+            if self.games[player].game_win() or (
+                other.game_over() and not self.games[player].game_over()
+            ):
+                return player
+        return None
+
+
+class UdpLink:
+    """A UDP socket to the other peer, which can add artificial latency and packet loss"""
+
+    def __init__(
+        self,
+        local_address: tuple[str, int],
+        remote_address: tuple[str, int],
+        latency: float = 0,
+        loss: float = 0,
+        seed: int = 0,
+    ):
+        self.remote_address = remote_address
+        self.latency = latency
+        self.loss = loss
+        self.__socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__socket.bind(local_address)
+        self.__socket.setblocking(False)
+        self.__rng = random.Random(seed)
+        # Packets held back to simulate latency, as (time due, order, packet)
+        self.__delayed = []
+        self.__sent = 0
+
+    def send(self, packet: bytes):
+        """Sends a packet, or drops it with the artificial loss probability"""
+        if self.__rng.random() < self.loss:
+            return
+        self.__sent += 1
+        heapq.heappush(
+            self.__delayed,
+            (time.perf_counter() + self.latency / 1000, self.__sent, packet),
+        )
+        self.flush()
+
+    def flush(self):
+        """Actually sends the delayed packets that are due"""
+        now = time.perf_counter()
+        while self.__delayed and self.__delayed[0][0] <= now:
+            _, _, packet = heapq.heappop(self.__delayed)
+            try:
+                self.__socket.sendto(packet, self.remote_address)
+            except ConnectionError:
+                # The other peer isn't listening yet. Everything will be sent again anyway
+                pass
+
+    def receive(self) -> list[bytes]:
+        """Returns every packet that has arrived"""
+        self.flush()
+        packets = []
+        while True:
+            try:
+                packets.append(self.__socket.recv(1024))
+            except (BlockingIOError, ConnectionError):
+                return packets
+
+    def close(self):
+        self.__socket.close()
+
+
+class RollbackSession:
+    """One peer's view of a versus game: simulates both games, exchanging inputs with the other peer"""
+
+    def __init__(
+        self, local_player: int, link: UdpLink, seed: int, level: LevelData = None
+    ):
+        self.local_player = local_player
+        self.link = link
+        self.simulation = VersusSimulation(seed, level)
+        # The frame about to be simulated
+        self.frame = 0
+
+        # Inputs by frame. Local input for the first few frames is nothing, because of the input delay
+        self.local_inputs = [0] * Constants.versus_input_delay
+        # The remote inputs received so far, in order. All inputs are known for frames before len(remote_inputs)
+        self.remote_inputs = []
+        # Remote inputs received out of order, waiting for the ones before them
+        self.__early_inputs = {}
+        # What was assumed for remote inputs that weren't known when their frame was simulated
+        self.__predictions = {}
+        # Snapshots of both games from before each frame that may still have to be resimulated
+        self.__snapshots = {}
+        # How many local inputs the other peer has acknowledged
+        self.__remote_ack = 0
+
+        # Measurements, see benchmarks/versus_loopback.py
+        self.rollbacks = 0
+        self.resimulated_frames = 0
+        self.rollback_times = []
+        self.stalls = 0
+
+    def advance(self, local_keys) -> bool:
+        """Receives inputs, rolls back if needed and simulates the next frame with the given local keys held
+
+        Returns False, without simulating anything, if this peer is too far ahead of the other one
+        """
+        self.__receive()
+        advanced = self.frame - len(self.remote_inputs) < Constants.versus_max_rollback
+        if advanced:
+            self.local_inputs.append(encode_input(local_keys))
+            self.__simulate_frame()
+        else:
+            self.stalls += 1
+        self.__send()
+        return advanced
+
+    def poll(self):
+        """Exchanges inputs with the other peer without simulating a new frame
+
+        Rolls back if the inputs that arrive show a prediction was wrong. Keep polling while not advancing,
+        for example after the game has ended, so the last frames still get confirmed
+        """
+        self.__receive()
+        self.__send()
+
+    def confirmed_frames(self) -> int:
+        """How many frames were simulated with both players' real inputs, and so will never be rolled back"""
+        return min(self.frame, len(self.remote_inputs))
+
+    def __simulate_frame(self):
+        """Simulates self.frame, predicting the remote input if it isn't known yet"""
+        frame = self.frame
+        self.__snapshots[frame] = self.simulation.save()
+        if frame < len(self.remote_inputs):
+            remote = self.remote_inputs[frame]
+        else:
+            remote = self.remote_inputs[-1] if self.remote_inputs else 0
+            self.__predictions[frame] = remote
+
+        inputs = [0, 0]
+        inputs[self.local_player] = self.local_inputs[frame]
+        inputs[1 - self.local_player] = remote
+        self.simulation.step(tuple(inputs))
+        self.frame += 1
+
+    def __receive(self):
+        """Takes in the remote inputs that arrived, rolling back if any prediction turns out wrong"""
+        first_known = len(self.remote_inputs)
+        for packet in self.link.receive():
+            start, ack, count = PACKET_HEADER.unpack_from(packet, 0)
+            self.__remote_ack = max(self.__remote_ack, ack)
+            for index in range(count):
+                self.__early_inputs[start + index] = packet[PACKET_HEADER.size + index]
+        while len(self.remote_inputs) in self.__early_inputs:
+            self.remote_inputs.append(self.__early_inputs.pop(len(self.remote_inputs)))
+        for frame in [
+            frame for frame in self.__early_inputs if frame < len(self.remote_inputs)
+        ]:
+            del self.__early_inputs[frame]
+
+        # The earliest frame that was simulated with a wrong prediction
+        rollback_to = None
+        for frame in range(first_known, min(len(self.remote_inputs), self.frame)):
+            if (
+                self.__predictions.pop(frame) != self.remote_inputs[frame]
+                and rollback_to == None
+            ):
+                rollback_to = frame
+        if rollback_to != None:
+            self.__rollback(rollback_to)
+
+        # Frames before the confirmed ones will never be rolled back to again
+        for frame in [
+            frame for frame in self.__snapshots if frame < self.confirmed_frames()
+        ]:
+            del self.__snapshots[frame]
+
+    def __rollback(self, frame: int):
+        """Restores the games to before the given frame and resimulates up to the present"""
+        start = time.perf_counter()
+        present = self.frame
+        self.simulation.load(self.__snapshots[frame])
+        self.frame = frame
+        while self.frame < present:
+            self.__simulate_frame()
+        self.rollbacks += 1
+        self.resimulated_frames += present - frame
+        self.rollback_times.append(time.perf_counter() - start)
+
+    def __send(self):
+        """Sends every local input the other peer hasn't acknowledged, and acknowledges the remote inputs"""
+        start = self.__remote_ack
+        inputs = bytes(self.local_inputs[start : start + 255])
+        self.link.send(
+            PACKET_HEADER.pack(start, len(self.remote_inputs), len(inputs)) + inputs
+        )
+
+
+def main():
+    """Plays a versus game against another peer"""
+    if len(sys.argv) < 5:
+        print(
+            "Usage: python versus.py <player 0|1> <local port> <remote host> <remote port> [seed]"
+        )
+        sys.exit(1)
+    player = int(sys.argv[1])
+    link = UdpLink(("", int(sys.argv[2])), (sys.argv[3], int(sys.argv[4])))
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    session = RollbackSession(player, link, seed)
+
+    pygame.init()
+    pygame.display.set_caption("Breakout versus (player {})".format(player + 1))
+    graphics = Graphics(Constants.default_settings.graphics_settings)
+    keyboard_state = KeyboardState()
+    clock = pygame.time.Clock()
+
+    while not keyboard_state.quit:
+        clock.tick(1000 / Constants.versus_frame_time)
+        keyboard_state.handle_pygame_events()
+        winner = session.simulation.winner()
+        if winner == None:
+            session.advance(keyboard_state.get_keys())
+        else:
+            session.poll()
+
+        local = session.simulation.games[player]
+        remote = session.simulation.games[1 - player]
+        if winner == None:
+            status = "Opponent: {} blocks left, {} lives".format(
+                remote.num_blocks(), remote.lives
+            )
+        else:
+            status = "YOU WIN" if winner == player else "YOU LOSE"
+        if session.confirmed_frames() == 0:
+            status = "Waiting for the other player..."
+        objects = [obj for obj in [local.paddle, local.ball] if obj != None]
+        graphics.render(
+            GraphicsInstructions(
+                objects + local.blocks + local.powerups,
+                [
+                    Message(
+                        status,
+                        20,
+                        Constants.game_width / 2,
+                        0.97 * Constants.game_height,
+                    )
+                ],
+            )
+        )
+
+    link.close()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()